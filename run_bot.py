@@ -1,43 +1,88 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-from src.pipeline.data_pipeline import DataPipeline
-from src.capital.capital_manager import CapitalManager
-from src.ai.ai_engine import AIEngine
-from src.strategy.strategy_engine import StrategyEngine
-from src.risk.risk_controller import RiskController
-from src.execution.execution_engine import ExecutionEngine
-from src.discord.discord_bot import DiscordBot
-from src.webhook.webhook_server import WebhookQueue, WebhookServer
-from src.safemode.safemode_system import SafeModeSystem
+from concurrent.futures import ThreadPoolExecutor
+
+from pipeline.data_pipeline import DataPipeline
+from capital.capital_manager import CapitalManager
+from ai.ai_engine import AIEngine
+from ai.feature_engine import FeatureEngine
+from strategy.strategy_engine import StrategyEngine
+from strategy.universe_scanner import UniverseScanner
+from risk.risk_controller import RiskController
+from execution.execution_engine import ExecutionEngine
+from execution.paper_exchange import PaperExchange
+from discord.discord_bot import DiscordBot
+from webhook.webhook_server import WebhookQueue, WebhookServer
+from safemode.safemode_system import SafeModeSystem
+from utils.metrics import METRICS
 
 def on_new_candle(symbol, timeframe, candles):
-    ai_signal = ai_engine.ensemble_predict(symbol, extract_features(candles), extract_series(candles), extract_state(candles))
-    proposal = strategy_engine.propose_trade(ai_signal, candles)
+    with METRICS.timer("features", symbol):
+        features = feature_engine.build_features(candles, symbol)
+        series = feature_engine.build_series(candles, symbol)
+        state = feature_engine.build_state(candles, symbol)
+    ai_signal = ai_engine.ensemble_predict(symbol, features, series, state,
+                                           timeframe=timeframe, candle_ts=int(candles.timestamp[-1]))
+    indicators = data_pipeline.get_indicators(symbol, timeframe)
+    proposal = strategy_engine.propose_trade(ai_signal, candles, indicators=indicators)
     if proposal:
         # Thêm size, price nếu cần
         proposal["size"] = capital_manager.get_position_size({"winrate": 0.6, "rr": 2.0})
         proposal["entry_price"] = candles[-1]["close"]
         execution_engine.place_order(proposal)
 
+def on_tick(symbol, timeframe, candle):
+    # Chạy trên luồng ingest cho mọi nến nhận được (trước khi gộp timeframe / lọc universe):
+    # nến feed_timeframe cho paper exchange khớp lệnh, SL/TP khi symbol có lệnh mở -> order_monitor
+    if timeframe == feed_timeframe or execution_engine.book.for_symbol(symbol):
+        order_monitor.submit(watch_orders, symbol, timeframe, candle)
+
+def watch_orders(symbol, timeframe, candle):
+    if timeframe == feed_timeframe:
+        # Paper exchange khớp lệnh / SL / TP theo nến mới, lệnh sàn đã đóng phải đóng cả vị thế local
+        for order in client.feed(symbol, candle):
+            execution_engine.close_order(order["id"], order["exit_price"])
+    if execution_engine.book.for_symbol(symbol):
+        # SL/TP + trailing SL của lệnh đang mở theo giá mới nhất
+        execution_engine.monitor_orders({symbol: float(candle["close"])})
+
 if __name__ == "__main__":
     data_pipeline = DataPipeline()
     capital_manager = CapitalManager()
-    ai_engine = AIEngine()
-    strategy_engine = StrategyEngine()
     risk_controller = RiskController()
-    # Dummy client cần thay bằng API thực tế
-    class DummyClient: ...
-    client = DummyClient()
+    ai_engine = AIEngine(risk_controller=risk_controller)
+    feature_engine = FeatureEngine()
+    strategy_engine = StrategyEngine()
+    # Paper trading trên sàn giả lập local, thay bằng client API thực tế khi chạy live
+    client = PaperExchange.from_config(data_pipeline.strategy_cfg.get("paper_exchange", {}))
+    # Paper exchange chỉ nhận 1 timeframe (base nếu có gộp, không thì timeframe giao dịch) để không khớp 2 lần
+    feed_timeframe = None
+    if hasattr(client, "feed"):
+        feed_timeframe = data_pipeline.base_timeframe or data_pipeline.strategy_cfg.get("strategy", {}).get("timeframe")
     execution_engine = ExecutionEngine(client, capital_manager, risk_controller)
-    discord_bot = DiscordBot(capital_manager, risk_controller, execution_engine)
+    discord_bot = DiscordBot(capital_manager, risk_controller, execution_engine, price_source=data_pipeline.last_prices)
     safemode_system = SafeModeSystem(risk_controller, discord_bot)
     queue = WebhookQueue()
-    webhook_server = WebhookServer(queue)
+    webhook_server = WebhookServer(queue, health_callback=lambda: {
+        "safe_mode": risk_controller.safe_mode,
+        "dispatcher": data_pipeline.dispatch_stats(),
+    })
     webhook_server.start()
 
-    # Kết nối pipeline
-    data_pipeline.trigger_on_new_candle = on_new_candle
+    # Universe: chỉ top_n symbol đủ điều kiện mới chạy AI / strategy
+    universe_scanner = UniverseScanner(data_pipeline=data_pipeline)
+    universe_scanner.subscribe(data_pipeline.set_universe)
+    universe_scanner.subscribe(ai_engine.set_universe)
+    # Ticker 24h từ sàn nếu client hỗ trợ, không thì dựng từ nến DataPipeline (vd: PaperExchange)
+    fetch_tickers = client.get_ticker if hasattr(client, "get_ticker") else data_pipeline.tickers
+    universe_scanner.start(fetch_tickers, keep_fn=execution_engine.book.symbols)
+
+    # Kết nối pipeline: xử lý nến trên worker pool, tách khỏi luồng ingest
+    data_pipeline.start_dispatcher(on_new_candle)
+    # Theo dõi lệnh mở trên mọi nến ingest (kể cả symbol ngoài universe), 1 thread để giữ thứ tự giá
+    order_monitor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="order-monitor")
+    data_pipeline.add_listener(on_tick)
 
     # Có thể chạy các worker khác bằng thread nếu cần (Dashboard, SafeMode monitor...)
 
@@ -45,5 +90,5 @@ if __name__ == "__main__":
 
     # Giả lập nến mới
     # while True:
-    #     data_pipeline.append_candle("BTCUSDT", "15m", get_new_candle())
+    #     data_pipeline.trigger_on_new_candle("BTCUSDT", "15m", get_new_candle())
     #     time.sleep(60)
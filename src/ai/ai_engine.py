@@ -1,104 +1,353 @@
 import os
 import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
 import numpy as np
+from ai.feature_engine import artifact_path
+from ai.model_registry import ModelRegistry
+from ai.prediction_cache import PredictionCache
+from ai.tree_predictor import CompiledTreeModel
 from utils.config_loader import ConfigLoader
 from utils.log_manager import LogManager
+from utils.metrics import METRICS
+
+MODEL_TYPES = ["xgb", "lstm", "rl"]
+DEFAULT_MODEL = "default"  # Model dùng chung cho mọi symbol có cùng feature schema
+GATE_TYPES = ["xgb", "lstm"]  # Model phải vượt threshold để signal "pass" (nếu đang bật)
+DEFAULT_THRESHOLDS = {"xgb": 0.6, "lstm": 0.7}
 
 class AIEngine:
     """
     AI Engine: quản lý load/call các model XGBoost, LSTM, RL,
     chuẩn hóa input/output, trả về tín hiệu duy nhất dạng ScoredSignal.
     """
-    def __init__(self, model_dir="models", config_dir="config"):
+    def __init__(self, model_dir="models", config_dir="config", risk_controller=None):
         self.model_dir = model_dir
         self.config = ConfigLoader(config_dir)
         self.logger = LogManager.get_logger("ai")
-        self.models = {}
+        self.risk_controller = risk_controller
+        conf = self.config.get("ai", reload=True)
+        # Bỏ qua hoàn toàn model bị tắt (vd: lstm.enabled: false -> không import TensorFlow)
+        self.enabled_types = [t for t in MODEL_TYPES if conf.get(t, {}).get("enabled", True)]
+        self.gate_types = [t for t in GATE_TYPES if t in self.enabled_types]
+        loading = conf.get("general", {}).get("model_loading", {})
+        self.xgb_compiled = conf.get("xgb", {}).get("compiled", False)
+        self.loading_mode = loading.get("mode", "parallel")
+        self.loading_workers = loading.get("workers", 4)
+        self.load_report = {}
+        self.registry = ModelRegistry(
+            self.load_model, self.model_path,
+            memory_budget_mb=conf.get("resource_limits", {}).get("model_cache_mb", 300),
+            logger=self.logger,
+        )
+        cache_cfg = conf.get("general", {}).get("prediction_cache", {})
+        self.cache = None
+        if cache_cfg.get("enabled", True):
+            self.cache = PredictionCache(cache_cfg.get("max_size", 2048), cache_cfg.get("ttl", 3600))
+            self.registry.add_listener(self._on_model_reload)
+        # Mỗi model chạy trong executor riêng để áp deadline (resource_limits.prediction_timeout)
+        limits = conf.get("resource_limits", {})
+        self.inference_workers = limits.get("inference_workers", 2 * len(MODEL_TYPES))
+        self.executor = ThreadPoolExecutor(max_workers=self.inference_workers, thread_name_prefix="ai-infer")
+        self.timeouts = {t: 0 for t in MODEL_TYPES}
+        # Lời gọi model đã quá hạn nhưng vẫn chạy (thread không hủy được) -> không submit thêm tới khi xong
+        self.hung = {t: set() for t in MODEL_TYPES}
+        self.hung_lock = threading.Lock()
+        self.universe = None  # None = predict mọi symbol (xem set_universe)
         self.load_all_models()
+        self.registry.start_watcher(loading.get("watch_interval", 30))
+
+    @property
+    def models(self):
+        """{model_type: {symbol: model}} đang nằm trong cache của registry."""
+        models = {t: {} for t in MODEL_TYPES}
+        models.update(self.registry.snapshot())
+        return models
+
+    def model_path(self, model_type, symbol):
+        if model_type == "xgb" and self.xgb_compiled:
+            # Ưu tiên bản compiled (.npz, không cần import xgboost) nếu đã export
+            compiled = artifact_path(self.model_dir, model_type, symbol, ".npz")
+            if os.path.exists(compiled):
+                return compiled
+        return artifact_path(self.model_dir, model_type, symbol, ".pkl" if model_type != "lstm" else ".h5")
 
     def load_model(self, model_type, symbol):
         """
-        Load model từ file (pickle cho XGB/RL, H5 cho LSTM).
+        Load model từ file (pickle cho XGB/RL, H5 cho LSTM, .npz cho XGB compiled).
+        TensorFlow chỉ được import khi thực sự load model LSTM đầu tiên.
         """
-        model_path = os.path.join(self.model_dir, f"{model_type}_{symbol}.pkl" if model_type != "lstm" else f"{model_type}_{symbol}.h5")
+        model_path = self.model_path(model_type, symbol)
         if not os.path.exists(model_path):
-            self.logger.error(f"Model file not found: {model_path}")
             return None
+        start = time.perf_counter()
         if model_type == "lstm":
             from tensorflow.keras.models import load_model
             model = load_model(model_path)
+        elif model_path.endswith(".npz"):
+            model = CompiledTreeModel.load(model_path)
         else:
             with open(model_path, "rb") as f:
                 model = pickle.load(f)
-        self.logger.info(f"Loaded {model_type} model for {symbol}")
+        elapsed = time.perf_counter() - start
+        self.load_report[f"{model_type}_{symbol}"] = round(elapsed, 4)
+        self.logger.info(f"Loaded {model_type} model for {symbol} in {elapsed * 1000:.1f} ms")
         return model
 
     def load_all_models(self):
         """
         Load tất cả model đã train cho các symbol phổ biến.
+        Model "default" (vd: xgb_default.pkl) nếu có sẽ dùng chung cho các symbol không có model riêng.
+        - mode "parallel": load song song bằng thread pool lúc khởi động
+        - mode "lazy": chỉ load khi predict lần đầu cho symbol đó
         """
-        for model_type in ["xgb", "lstm", "rl"]:
-            self.models[model_type] = {}
-            # Giả định có danh sách symbol trong config
-            symbols = self.config.get("strategy", reload=True).get("symbols", ["BTCUSDT"])
-            for symbol in symbols:
-                model = self.load_model(model_type, symbol)
-                if model:
-                    self.models[model_type][symbol] = model
+        if self.loading_mode == "lazy":
+            self.logger.info(f"Lazy model loading enabled for {self.enabled_types}")
+            return
+        # Giả định có danh sách symbol trong config
+        symbols = self.config.get("strategy", reload=True).get("symbols", ["BTCUSDT"])
+        keys = [(t, s) for t in self.enabled_types for s in list(symbols) + [DEFAULT_MODEL]]
+        start = time.perf_counter()
+        self.registry.preload(keys, workers=self.loading_workers)
+        self.logger.info(f"Loaded models in {time.perf_counter() - start:.2f}s "
+                         f"(types={self.enabled_types}, workers={self.loading_workers}): {self.load_report}")
 
-    def predict_xgb(self, symbol, features):
-        model = self.models.get("xgb", {}).get(symbol)
-        if not model:
-            self.logger.error(f"No XGB model for {symbol}")
+    def get_model(self, model_type, symbol):
+        """Model riêng của symbol, nếu không có thì dùng model default (cùng feature schema)."""
+        if model_type not in self.enabled_types:
             return None
-        proba = model.predict_proba([features])[0][1]
-        return float(proba)
+        model = self.registry.get(model_type, symbol)
+        return model if model is not None else self.registry.get(model_type, DEFAULT_MODEL)
+
+    def _run_model(self, model_type, model, inputs):
+        """1 lần predict cho cả batch input của cùng 1 model, trả về xác suất lớp 1."""
+        if model_type == "xgb":
+            return model.predict_proba(np.asarray(inputs, dtype=np.float64))[:, 1]
+        if model_type == "lstm":
+            arr = np.asarray(inputs, dtype=np.float64)
+            return model.predict(arr.reshape((arr.shape[0], arr.shape[1], 1)))[:, 0]
+        # Giả lập: RL trả về Q-value hoặc xác suất hành động
+        return np.asarray(model.predict(np.asarray(inputs, dtype=np.float64)))[:, 1]
+
+    def predict_batch(self, model_type, symbols, inputs):
+        """
+        Predict nhiều symbol cùng lúc: gom các request dùng chung 1 model
+        (và cùng shape input) thành 1 ma trận, mỗi model chỉ gọi predict 1 lần.
+        Trả về list xác suất (None nếu thiếu model/input hoặc lỗi).
+        """
+        return self._predict_batch(model_type, symbols, inputs)[0]
+
+    def _predict_batch(self, model_type, symbols, inputs):
+        """predict_batch + tập index các row bị lỗi khi chạy model (chỉ các row này được fallback)."""
+        results, failed = [None] * len(symbols), set()
+        if model_type not in self.enabled_types:
+            return results, failed
+        with METRICS.timer(f"ai_{model_type}", symbols[0] if len(symbols) == 1 else "batch"):
+            self._predict_groups(model_type, symbols, inputs, results, failed)
+        return results, failed
+
+    def _predict_groups(self, model_type, symbols, inputs, results, failed):
+        groups = {}
+        for i, (symbol, x) in enumerate(zip(symbols, inputs)):
+            if x is None:
+                continue
+            model = self.get_model(model_type, symbol)
+            if model is None:
+                self.logger.error(f"No {model_type.upper()} model for {symbol}")
+                continue
+            groups.setdefault((id(model), len(x)), (model, []))[1].append(i)
+        for model, idx in groups.values():
+            try:
+                probas = self._run_model(model_type, model, [inputs[i] for i in idx])
+            except Exception as e:
+                self.logger.error(f"{model_type.upper()} batch predict failed ({len(idx)} rows): {e}")
+                failed.update(idx)
+                continue
+            for i, p in zip(idx, probas):
+                results[i] = float(p)
+        return results
+
+    def predict_xgb(self, symbol, features):
+        return self.predict_batch("xgb", [symbol], [features])[0]
 
     def predict_lstm(self, symbol, series):
-        model = self.models.get("lstm", {}).get(symbol)
-        if not model:
-            self.logger.error(f"No LSTM model for {symbol}")
-            return None
-        arr = np.array(series).reshape((1, len(series), 1))
-        proba = model.predict(arr)[0][0]
-        return float(proba)
+        return self.predict_batch("lstm", [symbol], [series])[0]
 
     def predict_rl(self, symbol, state):
-        model = self.models.get("rl", {}).get(symbol)
-        if not model:
-            self.logger.error(f"No RL model for {symbol}")
+        return self.predict_batch("rl", [symbol], [state])[0]
+
+    @staticmethod
+    def fallback_moving_average(series):
+        """
+        Fallback khi không có kết quả LSTM: độ lệch của giá cuối so với trung bình chuỗi
+        (tính theo std) đưa qua sigmoid -> xác suất tăng.
+        """
+        if series is None or len(series) < 2:
             return None
-        # Giả lập: RL trả về Q-value hoặc xác suất hành động
-        action_prob = model.predict([state])[0][1]
-        return float(action_prob)
+        arr = np.asarray(series, dtype=np.float64)
+        std = arr.std()
+        dev = (arr[-1] - arr.mean()) / std if std > 0 else 0.0
+        return float(1.0 / (1.0 + np.exp(-dev)))
+
+    def _apply_fallback(self, conf, model_type, values, inputs, rows):
+        """Fallback cho các row trong `rows` (model quá hạn / lỗi), model bị tắt hoặc thiếu thì giữ None."""
+        mode = conf.get(model_type, {}).get("fallback_mode")
+        if mode != "moving_average" or not rows:
+            return values
+        return [self.fallback_moving_average(x) if v is None and i in rows else v
+                for i, (v, x) in enumerate(zip(values, inputs))]
+
+    def _is_hung(self, model_type):
+        with self.hung_lock:
+            hung = self.hung[model_type]
+            hung.difference_update([f for f in hung if f.done()])
+            return bool(hung)
 
-    def ensemble_predict(self, symbol, features, series, state):
+    def _predict_with_deadline(self, conf, symbols, inputs_by_type):
         """
-        Gộp kết quả các model (weighted average hoặc voting/logic bạn chọn).
-        Trả về dict chuẩn hóa: ScoredSignal.
+        Chạy các model đang bật song song, chờ tối đa prediction_timeout giây cho cả batch.
+        Model quá hạn (hoặc lần gọi quá hạn trước vẫn đang chạy -> không submit thêm, tránh
+        chiếm hết worker pool): dùng fallback_mode nếu có, nếu không bỏ khỏi ensemble (None),
+        đồng thời báo RiskController.on_ai_error.
+        Trả về (results, model quá hạn, set row bị lỗi ở ít nhất 1 model).
         """
-        conf = self.config.get("ai", reload=True)
-        xgb_thres = conf.get("xgb", {}).get("threshold", 0.6)
-        lstm_thres = conf.get("lstm", {}).get("threshold", 0.7)
-        xgb = self.predict_xgb(symbol, features)
-        lstm = self.predict_lstm(symbol, series)
-        rl = self.predict_rl(symbol, state)
-        # Weighted confidence (tùy chỉnh logic)
-        weighted = np.mean([x for x in [xgb, lstm, rl] if x is not None])
-        signal = {
+        timeout = conf.get("resource_limits", {}).get("prediction_timeout", 5)
+        deadline = time.monotonic() + timeout
+        n = len(symbols)
+        results, timed_out, futures = {t: [None] * n for t in MODEL_TYPES}, [], {}
+        failed_rows = set()
+        for model_type in self.enabled_types:
+            if self._is_hung(model_type):
+                timed_out.append(model_type)
+                self.logger.warning(f"{model_type.upper()} still running a timed-out predict, skipped for {n} symbols")
+            else:
+                futures[model_type] = self.executor.submit(self._predict_batch, model_type, symbols, inputs_by_type[model_type])
+        for model_type, future in futures.items():
+            try:
+                results[model_type], failed = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FuturesTimeout:
+                if not future.cancel():
+                    with self.hung_lock:
+                        self.hung[model_type].add(future)
+                timed_out.append(model_type)
+                self.timeouts[model_type] += 1
+                self.logger.error(f"{model_type.upper()} predict exceeded {timeout}s deadline for {n} symbols")
+                continue
+            failed_rows.update(failed)
+            results[model_type] = self._apply_fallback(conf, model_type, results[model_type],
+                                                       inputs_by_type[model_type], failed)
+        all_rows = range(n)
+        for model_type in timed_out:
+            results[model_type] = self._apply_fallback(conf, model_type, results[model_type],
+                                                       inputs_by_type[model_type], all_rows)
+        if timed_out and self.risk_controller:
+            self.risk_controller.on_ai_error()
+        return results, timed_out, failed_rows
+
+    def _build_signal(self, conf, symbol, xgb, lstm, rl):
+        # Weighted confidence theo general.ensemble.weights, model không có kết quả bị loại
+        weights = conf.get("general", {}).get("ensemble", {}).get("weights", {})
+        scored = [(weights.get(t, 1.0), p) for t, p in (("xgb", xgb), ("lstm", lstm), ("rl", rl)) if p is not None]
+        total = sum(w for w, _ in scored)
+        weighted = float(sum(w * p for w, p in scored) / total) if total > 0 else 0.0
+        # Gate chỉ gồm model đang bật: model tắt (vd lstm.enabled: false) luôn None, không được chặn mọi lệnh
+        preds = {"xgb": xgb, "lstm": lstm}
+        passed = bool(self.gate_types) and all(
+            preds[t] is not None and preds[t] > conf.get(t, {}).get("threshold", DEFAULT_THRESHOLDS[t])
+            for t in self.gate_types)
+        return {
             "symbol": symbol,
             "xgb": xgb,
             "lstm": lstm,
             "rl": rl,
             "confidence": weighted,
-            "pass": (xgb is not None and xgb > xgb_thres) and (lstm is not None and lstm > lstm_thres),
+            "pass": passed,
         }
-        self.logger.info(f"AI Ensemble: {signal}")
-        return signal
+
+    def ensemble_predict(self, symbol, features, series, state, timeframe=None, candle_ts=None):
+        """
+        Gộp kết quả các model (weighted average hoặc voting/logic bạn chọn).
+        Trả về dict chuẩn hóa: ScoredSignal.
+        Truyền timeframe + candle_ts (timestamp nến cuối) để dùng prediction cache.
+        """
+        request = {"symbol": symbol, "features": features, "series": series, "state": state,
+                   "timeframe": timeframe, "candle_ts": candle_ts}
+        return self.ensemble_predict_batch([request])[0]
+
+    def _model_version(self, model_type, symbol):
+        """Version model sẽ dùng cho symbol, đọc sau khi registry load xong (lazy / vừa hot-reload)."""
+        entry = self.registry.get_entry(model_type, symbol) or self.registry.get_entry(model_type, DEFAULT_MODEL)
+        return entry.version if entry else None
+
+    def _cache_key(self, request):
+        if not self.cache or request.get("candle_ts") is None:
+            return None
+        symbol = request["symbol"]
+        versions = tuple(self._model_version(t, symbol) for t in self.enabled_types)
+        return (symbol, request.get("timeframe"), int(request["candle_ts"]), versions)
+
+    def set_universe(self, symbols):
+        """
+        Subscriber của UniverseScanner: chỉ predict cho symbol trong tập active,
+        preload model của symbol mới vào (trừ mode lazy).
+        """
+        symbols = frozenset(symbols)
+        added = symbols - (self.universe or frozenset())
+        self.universe = symbols
+        if added and self.loading_mode != "lazy":
+            self.registry.preload([(t, s) for t in self.enabled_types for s in added], workers=self.loading_workers)
+
+    def _on_model_reload(self, model_type, symbol, version):
+        # Model default dùng chung cho nhiều symbol -> xóa toàn bộ cache
+        self.cache.invalidate(None if symbol == DEFAULT_MODEL else symbol)
+
+    def ensemble_predict_batch(self, requests):
+        """
+        Predict cho tất cả symbol có nến đóng cùng tick.
+        requests: list dict {symbol, features, series, state, [timeframe, candle_ts]}.
+        Request đã có trong prediction cache trả về ngay, symbol ngoài universe trả về signal
+        không pass; phần còn lại mỗi model chỉ chạy 1 lần predict trên ma trận đã stack.
+        Trả về list ScoredSignal cùng thứ tự.
+        """
+        signals = [None] * len(requests)
+        keys = [None] * len(requests)
+        todo = []
+        for i, request in enumerate(requests):
+            if self.universe is not None and request["symbol"] not in self.universe:
+                # Symbol không thể trade -> không tốn inference
+                signals[i] = self._build_signal({}, request["symbol"], None, None, None)
+                continue
+            key = keys[i] = self._cache_key(request)
+            cached = self.cache.get(key) if key else None
+            if cached is not None:
+                signals[i] = cached
+            else:
+                todo.append(i)
+        if not todo:
+            return signals
+        conf = self.config.get("ai")  # Snapshot trong memory, file đổi có hiệu lực sau <= 1s
+        pending = [requests[i] for i in todo]
+        symbols = [r["symbol"] for r in pending]
+        inputs = {
+            "xgb": [r.get("features") for r in pending],
+            "lstm": [r.get("series") for r in pending],
+            "rl": [r.get("state") for r in pending],
+        }
+        results, timed_out, failed_rows = self._predict_with_deadline(conf, symbols, inputs)
+        xgb, lstm, rl = results["xgb"], results["lstm"], results["rl"]
+        for j, i in enumerate(todo):
+            signal = self._build_signal(conf, symbols[j], xgb[j], lstm[j], rl[j])
+            self.logger.debug("AI Ensemble: %s", signal)
+            # Không cache kết quả đã bị degrade do timeout / lỗi model (lần sau predict lại)
+            if keys[i] and not timed_out and j not in failed_rows:
+                self.cache.put(keys[i], signal)
+            signals[i] = signal
+        return signals
 
     def reload_models(self):
-        """Reload all models (dùng khi retrain hoặc file mới)."""
-        self.load_all_models()
+        """Reload các model có file thay đổi (dùng khi retrain hoặc file mới), swap atomic."""
+        return self.registry.check_updates()
 
 # Usage example/test
 if __name__ == "__main__":
@@ -109,3 +358,12 @@ if __name__ == "__main__":
     state = [0.2]*10
     pred = ai.ensemble_predict("BTCUSDT", features, series, state)
     print(pred)
+    # Model tắt không được chặn gate: config mặc định (lstm.enabled: false) vẫn phải pass được
+    conf = ai.config.get("ai")
+    strong = {t: 0.99 if t in ai.enabled_types else None for t in MODEL_TYPES}
+    assert ai._build_signal(conf, "BTCUSDT", strong["xgb"], strong["lstm"], strong["rl"])["pass"], ai.enabled_types
+    batch = ai.ensemble_predict_batch([
+        {"symbol": s, "features": features, "series": series, "state": state}
+        for s in ["BTCUSDT", "ETHUSDT", "SOLUSDT"]
+    ])
+    print(batch)
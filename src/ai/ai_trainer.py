@@ -0,0 +1,139 @@
+import json
+import os
+import pickle
+import time
+import numpy as np
+from ai.feature_engine import Preprocessor
+
+def classification_metrics(y_true, y_pred):
+    """accuracy / precision / recall / f1 cho nhãn nhị phân 0/1."""
+    y_true = np.asarray(y_true).astype(bool)
+    y_pred = np.asarray(y_pred).astype(bool)
+    tp = float(np.sum(y_true & y_pred))
+    fp = float(np.sum(~y_true & y_pred))
+    fn = float(np.sum(y_true & ~y_pred))
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    return {
+        "accuracy": float(np.mean(y_true == y_pred)) if len(y_true) else 0.0,
+        "precision": precision,
+        "recall": recall,
+        "f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+    }
+
+def walk_forward_splits(n, n_splits=3, test_size=0.2):
+    """
+    Các fold walk-forward: train mở rộng dần, test nằm ngay sau train (không nhìn tương lai).
+    Tổng các fold test chiếm test_size ở cuối chuỗi. Trả về list (train_end, test_end).
+    """
+    test_len = int(n * test_size / n_splits)
+    first = n - n_splits * test_len
+    if test_len < 1 or first <= 0:
+        raise ValueError(f"Not enough samples ({n}) for {n_splits} walk-forward splits")
+    return [(first + k * test_len, first + (k + 1) * test_len) for k in range(n_splits)]
+
+class AITrainer:
+    """
+    Train model AI (hiện hỗ trợ XGBoost) từ ma trận feature bulk của FeatureEngine:
+    - Preprocessor (robust scaling + lọc outlier IQR) fit trên đúng phần train
+    - Early stopping trên validation_split cuối phần train, không đụng tới fold test
+    - Ghi artifact vào thư mục version, đổi symlink live 1 lần (atomic) để AIEngine hot-reload
+    """
+    def __init__(self, model_type, params, model_dir="models", preprocessing=None,
+                 validation_split=0.25, n_jobs=1):
+        if model_type != "xgb":
+            raise ValueError(f"Unsupported model type for training: {model_type}")
+        self.model_type = model_type
+        self.params = dict(params or {})
+        self.model_dir = model_dir
+        self.preprocessing = preprocessing or {}
+        self.validation_split = validation_split
+        self.n_jobs = n_jobs
+        self.model = None
+        self.preprocessor = None
+        self.sample = None
+
+    def _build(self):
+        from xgboost import XGBClassifier
+        params = dict(self.params)
+        params.setdefault("n_jobs", self.n_jobs)
+        params.setdefault("eval_metric", "logloss")
+        return XGBClassifier(**params)
+
+    def _prepare(self, X, y):
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y)
+        pp = self.preprocessing
+        scale = pp.get("normalize", True) and pp.get("feature_scaling", "robust") == "robust"
+        outliers = pp.get("outlier_removal") == "iqr"
+        self.preprocessor = Preprocessor().fit(X, k=pp.get("iqr_k", 3.0)) if scale or outliers else None
+        if outliers:
+            mask = self.preprocessor.inlier_mask(X)
+            X, y = X[mask], y[mask]
+        if not scale:
+            self.preprocessor = None
+        return self.transform(X), y
+
+    def transform(self, X):
+        return self.preprocessor.transform(X) if self.preprocessor else np.asarray(X, dtype=np.float64)
+
+    def train(self, X, y):
+        X, y = self._prepare(X, y)
+        model = self._build()
+        n_val = int(len(X) * self.validation_split)
+        if model.get_params().get("early_stopping_rounds") and n_val > 0:
+            model.fit(X[:-n_val], y[:-n_val], eval_set=[(X[-n_val:], y[-n_val:])], verbose=False)
+        else:
+            model.set_params(early_stopping_rounds=None)
+            model.fit(X, y)
+        self.model = model
+        self.sample = X[-256:]
+        return model
+
+    def predict(self, X):
+        return self.model.predict_proba(self.transform(X))[:, 1]
+
+    def evaluate(self, X, y, threshold=0.5):
+        metrics = classification_metrics(y, self.predict(X) > threshold)
+        metrics["n_test"] = int(len(y))
+        return metrics
+
+    def save(self, symbol, metrics=None, compiled=False):
+        """
+        Ghi artifact:
+        - models/versions/<type>_<symbol>_<version>/<type>_<symbol>.pkl (+ _scaler.json, .npz, .json metadata)
+        - models/<type>_<symbol> -> symlink tới thư mục version trên, đổi bằng 1 lần os.replace nên
+          AIEngine / FeatureEngine không bao giờ thấy scaler mới đi với model cũ (xem artifact_path)
+        Trả về version.
+        """
+        name = f"{self.model_type}_{symbol}"
+        versions_dir = os.path.join(self.model_dir, "versions")
+        version = stamp = time.strftime("%Y%m%d%H%M%S")
+        k = 1
+        while os.path.exists(os.path.join(versions_dir, f"{name}_{version}")):
+            version, k = f"{stamp}_{k}", k + 1
+        version_dir = os.path.join(versions_dir, f"{name}_{version}")
+        os.makedirs(version_dir)
+        versioned = os.path.join(version_dir, name)
+
+        with open(versioned + ".pkl", "wb") as f:
+            pickle.dump(self.model, f)
+        if self.preprocessor is not None:
+            self.preprocessor.save(versioned + "_scaler.json")
+        if compiled:
+            from ai.tree_predictor import CompiledTreeModel, verify
+            compiled_model = CompiledTreeModel.from_xgboost(self.model)
+            verify(compiled_model, self.model, self.sample)
+            compiled_model.save(versioned + ".npz")
+        with open(versioned + ".json", "w") as f:
+            json.dump({"symbol": symbol, "model_type": self.model_type, "version": version,
+                       "params": self.params, "metrics": metrics or {}}, f, indent=2)
+
+        # Publish: symlink tạm trỏ tới thư mục version rồi rename đè lên symlink live
+        live = os.path.join(self.model_dir, name)
+        tmp = live + ".tmp"
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        os.symlink(os.path.relpath(version_dir, self.model_dir), tmp)
+        os.replace(tmp, live)
+        return version
@@ -0,0 +1,278 @@
+import json
+import os
+import threading
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from utils.config_loader import ConfigLoader
+
+def artifact_path(model_dir, model_type, symbol, suffix):
+    """
+    File artifact live của model (suffix: .pkl / .npz / .h5 / _scaler.json).
+    models/<type>_<symbol> là symlink tới thư mục version đang active (AITrainer.save đổi bằng
+    1 lần rename), nếu chưa có thì dùng file phẳng models/<type>_<symbol><suffix>.
+    """
+    name = f"{model_type}_{symbol}"
+    live = os.path.join(model_dir, name)
+    return os.path.join(live, name + suffix) if os.path.isdir(live) else live + suffix
+
+def _as_columns(candles):
+    """CandleView / structured array / list-of-dict -> (close, high, low, volume) float64."""
+    if hasattr(candles, "close") or getattr(getattr(candles, "dtype", None), "names", None):
+        close = np.asarray(candles["close"], dtype=np.float64)
+        high = np.asarray(candles["high"], dtype=np.float64)
+        low = np.asarray(candles["low"], dtype=np.float64)
+        volume = np.asarray(candles["volume"], dtype=np.float64)
+        return close, high, low, volume
+    close = np.array([c["close"] for c in candles], dtype=np.float64)
+    high = np.array([c.get("high", c["close"]) for c in candles], dtype=np.float64)
+    low = np.array([c.get("low", c["close"]) for c in candles], dtype=np.float64)
+    volume = np.array([c.get("volume", np.nan) for c in candles], dtype=np.float64)
+    return close, high, low, volume
+
+def ewm(x, alpha, seed=None):
+    """
+    EMA vector hóa: y_t = (1 - alpha) * y_{t-1} + alpha * x_t, y_0 = x_0 (hoặc seed cho y_{-1}).
+    Giải dạng đóng theo từng block ngắn để hệ số (1 - alpha)^-k không làm mất độ chính xác.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    out = np.empty_like(x)
+    if not len(x):
+        return out
+    beta = 1.0 - alpha
+    block = max(1, int(4 * np.log(10) / -np.log(beta))) if beta > 0 else len(x)
+    prev = seed
+    start = 0
+    if prev is None:
+        out[0] = prev = x[0]
+        start = 1
+    while start < len(x):
+        chunk = x[start:start + block]
+        k = np.arange(len(chunk))
+        inv = beta ** -k
+        out[start:start + len(chunk)] = beta ** (k + 1) * prev + alpha * beta ** k * np.cumsum(chunk * inv)
+        prev = out[start + len(chunk) - 1]
+        start += len(chunk)
+    return out
+
+def rolling(x, window, fn):
+    """Áp fn(axis=1) trên cửa sổ trượt, NaN cho window-1 phần tử đầu."""
+    out = np.full(len(x), np.nan)
+    if len(x) >= window:
+        out[window - 1:] = fn(sliding_window_view(x, window), axis=1)
+    return out
+
+def wilder_rsi(close, period):
+    """RSI Wilder, seed bằng SMA của `period` delta đầu (giống IndicatorState)."""
+    rsi = np.full(len(close), np.nan)
+    if len(close) <= period:
+        return rsi
+    delta = np.diff(close)
+    gain, loss = np.maximum(delta, 0.0), np.maximum(-delta, 0.0)
+    alpha = 1.0 / period
+    avg_gain = np.empty(len(delta) - period + 1)
+    avg_loss = np.empty_like(avg_gain)
+    avg_gain[0], avg_loss[0] = gain[:period].mean(), loss[:period].mean()
+    avg_gain[1:] = ewm(gain[period:], alpha, seed=avg_gain[0])
+    avg_loss[1:] = ewm(loss[period:], alpha, seed=avg_loss[0])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+    values = np.where(avg_loss == 0, np.where(avg_gain > 0, 100.0, 50.0), values)
+    rsi[period:] = values
+    return rsi
+
+class Preprocessor:
+    """
+    Robust scaling (median / IQR) + lọc outlier theo IQR, fit 1 lần lúc train
+    và lưu cạnh file model để serving dùng đúng tham số.
+    """
+    def __init__(self, median=None, iqr=None, lower=None, upper=None):
+        self.median = None if median is None else np.asarray(median, dtype=np.float64)
+        self.iqr = None if iqr is None else np.asarray(iqr, dtype=np.float64)
+        self.lower = None if lower is None else np.asarray(lower, dtype=np.float64)
+        self.upper = None if upper is None else np.asarray(upper, dtype=np.float64)
+
+    def fit(self, X, k=1.5):
+        X = np.asarray(X, dtype=np.float64)
+        q25, self.median, q75 = np.nanpercentile(X, [25, 50, 75], axis=0)
+        iqr = q75 - q25
+        self.iqr = np.where(iqr > 0, iqr, 1.0)
+        self.lower, self.upper = q25 - k * iqr, q75 + k * iqr
+        return self
+
+    def inlier_mask(self, X):
+        """True cho các dòng không có feature nào nằm ngoài [Q1 - k*IQR, Q3 + k*IQR]."""
+        X = np.asarray(X, dtype=np.float64)
+        return np.all((X >= self.lower) & (X <= self.upper), axis=-1)
+
+    def transform(self, X):
+        return (np.asarray(X, dtype=np.float64) - self.median) / self.iqr
+
+    def to_dict(self):
+        return {k: getattr(self, k).tolist() for k in ("median", "iqr", "lower", "upper")}
+
+    def save(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(**json.load(f))
+
+class FeatureEngine:
+    """
+    Xây feature cho XGB (xgb.features), state cho RL (rl.state_features) và chuỗi cho LSTM
+    từ dữ liệu nến dạng cột, hoàn toàn bằng NumPy vector hóa.
+    - Bulk: build_matrix / build_state_matrix / build_sequences trên toàn lịch sử (train)
+    - Incremental: build_features / build_state / build_series cho nến mới nhất (live),
+      chạy đúng cùng hàm trên cửa sổ `feature_lookback` nến cuối -> train/serve khớp nhau
+    Feature dạng tỉ lệ (không phụ thuộc mức giá) để dùng chung model giữa các symbol.
+    """
+    def __init__(self, config_dir="config", model_dir="models"):
+        self.config = ConfigLoader(config_dir)
+        self.model_dir = model_dir
+        ai_cfg = self.config.get("ai")
+        strategy_cfg = self.config.get("strategy")
+        rsi_macd = strategy_cfg.get("strategies", {}).get("rsi_macd", {})
+        ind = strategy_cfg.get("indicators", {})
+        self.rsi_period = rsi_macd.get("rsi_period", 14)
+        self.macd_fast = rsi_macd.get("macd_fast", 12)
+        self.macd_slow = rsi_macd.get("macd_slow", 26)
+        self.macd_signal = rsi_macd.get("macd_signal", 9)
+        self.bb_period = ind.get("bb_period", 20)
+        self.bb_std = ind.get("bb_std", 2.0)
+        self.volume_sma_period = ind.get("volume_sma_period", 20)
+        self.xgb_features = ai_cfg.get("xgb", {}).get("features", [])
+        self.state_features = ai_cfg.get("rl", {}).get("state_features", [])
+        self.sequence_length = ai_cfg.get("lstm", {}).get("sequence_length", 50)
+        self.lookback = ai_cfg.get("general", {}).get("feature_lookback", 300)
+        self._preprocessors = {}
+        self._lock = threading.Lock()
+
+    # ---------- core (dùng chung cho bulk và live) ----------
+    def compute(self, candles, position_pnl=0.0):
+        """Toàn bộ cột feature (mỗi cột dài bằng số nến, NaN ở giai đoạn warm-up)."""
+        close, high, low, volume = _as_columns(candles)
+        n = len(close)
+        ema_fast = ewm(close, 2.0 / (self.macd_fast + 1))
+        ema_slow = ewm(close, 2.0 / (self.macd_slow + 1))
+        macd = ema_fast - ema_slow
+        signal = ewm(macd, 2.0 / (self.macd_signal + 1))
+        bb_mid = rolling(close, self.bb_period, np.mean)
+        bb_dev = rolling(close, self.bb_period, np.std)
+        volume_sma = rolling(volume, self.volume_sma_period, np.mean)
+        log_ret = np.full(n, np.nan)
+        log_ret[1:] = np.diff(np.log(close))
+        w = self.bb_period
+        trend = np.full(n, np.nan)
+        if n >= w:
+            t = np.arange(w) - (w - 1) / 2.0
+            windows = sliding_window_view(close, w)
+            trend[w - 1:] = (windows @ t) / (t @ t) * w / windows.mean(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            price_change = np.full(n, np.nan)
+            price_change[1:] = close[1:] / close[:-1] - 1.0
+            z = (close - bb_mid) / bb_dev
+            volume_ratio = volume / volume_sma
+        regime = np.where((close > ema_slow) & (trend > 0), 1.0, np.where((close < ema_slow) & (trend < 0), -1.0, 0.0))
+        regime[np.isnan(trend)] = np.nan
+        return {
+            "rsi": wilder_rsi(close, self.rsi_period),
+            "macd": macd / close,
+            "macd_signal": (macd - signal) / close,
+            "bb_upper": (bb_mid + self.bb_std * bb_dev) / close - 1.0,
+            "bb_lower": (bb_mid - self.bb_std * bb_dev) / close - 1.0,
+            "volume_sma": volume_ratio,
+            "price_change": price_change,
+            "volatility": rolling(log_ret, w, np.std),
+            "trend_strength": trend,
+            "price_normalized": z,
+            "volume_normalized": volume_ratio,
+            "position_pnl": np.broadcast_to(np.asarray(position_pnl, dtype=np.float64), (n,)),
+            "market_regime": regime,
+        }
+
+    def _matrix(self, candles, names, position_pnl=0.0):
+        cols = self.compute(candles, position_pnl)
+        return np.column_stack([cols[name] for name in names]) if names else np.empty((len(cols["rsi"]), 0))
+
+    def _tail(self, candles):
+        return candles[-self.lookback:]
+
+    def _last_row(self, X, symbol, model_type):
+        if not len(X) or np.isnan(X[-1]).any():
+            return None
+        row = X[-1]
+        pre = self.get_preprocessor(model_type, symbol)
+        return pre.transform(row) if pre else row
+
+    # ---------- bulk (train) ----------
+    def build_matrix(self, candles):
+        """Ma trận feature XGB (n_nến x n_feature) cho toàn lịch sử."""
+        return self._matrix(candles, self.xgb_features)
+
+    def build_state_matrix(self, candles, position_pnl=0.0):
+        """Ma trận state RL cho toàn lịch sử (position_pnl: scalar hoặc mảng theo nến)."""
+        return self._matrix(candles, self.state_features, position_pnl)
+
+    def build_sequences(self, candles):
+        """Các chuỗi close chuẩn hóa dài sequence_length (n - L + 1 x L) cho LSTM."""
+        close = _as_columns(candles)[0]
+        if len(close) < self.sequence_length:
+            return np.empty((0, self.sequence_length))
+        windows = sliding_window_view(close, self.sequence_length)
+        return windows / windows[:, -1:] - 1.0
+
+    # ---------- incremental (live) ----------
+    def build_features(self, candles, symbol=None):
+        """Vector feature XGB của nến cuối (đã scale nếu model có preprocessor), None nếu thiếu dữ liệu."""
+        return self._last_row(self.build_matrix(self._tail(candles)), symbol, "xgb")
+
+    def build_state(self, candles, symbol=None, position_pnl=0.0):
+        """Vector state RL của nến cuối."""
+        return self._last_row(self.build_state_matrix(self._tail(candles), position_pnl), symbol, "rl")
+
+    def build_series(self, candles, symbol=None):
+        """Chuỗi LSTM của nến cuối."""
+        seq = self.build_sequences(candles[-self.sequence_length:])
+        return seq[-1] if len(seq) else None
+
+    # ---------- preprocessing cache ----------
+    def preprocessor_path(self, model_type, symbol):
+        return artifact_path(self.model_dir, model_type, symbol, "_scaler.json")
+
+    def get_preprocessor(self, model_type, symbol):
+        """Preprocessor đã fit của model (file riêng của symbol, nếu không có thì của model default)."""
+        for name in ([symbol] if symbol else []) + ["default"]:
+            path = self.preprocessor_path(model_type, name)
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            key = (model_type, name)
+            cached = self._preprocessors.get(key)
+            if cached and cached[0] == mtime:
+                return cached[1]
+            with self._lock:
+                pre = Preprocessor.load(path)
+                self._preprocessors[key] = (mtime, pre)
+            return pre
+        return None
+
+# Usage example/test
+if __name__ == "__main__":
+    import time
+    rng = np.random.default_rng(0)
+    close = 100 + np.cumsum(rng.normal(0, 1, 4000))
+    candles = np.zeros(4000, dtype=[("close", "f8"), ("high", "f8"), ("low", "f8"), ("volume", "f8")])
+    candles["close"], candles["high"], candles["low"] = close, close + 1, close - 1
+    candles["volume"] = rng.uniform(100, 200, 4000)
+    fe = FeatureEngine()
+    t0 = time.perf_counter()
+    X = fe.build_matrix(candles)
+    print("bulk", X.shape, f"{(time.perf_counter() - t0) * 1000:.1f} ms")
+    t0 = time.perf_counter()
+    row = fe.build_features(candles)
+    print("live", f"{(time.perf_counter() - t0) * 1000:.2f} ms", np.abs(row - X[-1]).max())
@@ -0,0 +1,230 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+class ModelEntry:
+    __slots__ = ("model", "path", "mtime_ns", "size", "version", "loaded_at")
+
+    def __init__(self, model, path, mtime_ns, size):
+        self.model = model
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.version = mtime_ns
+        self.loaded_at = time.time()
+
+class ModelRegistry:
+    """
+    Registry model cho AIEngine:
+    - Cache LRU giới hạn theo memory budget (ước lượng bằng kích thước file model),
+      model bị evict sẽ được load lại khi cần
+    - Watcher nền theo dõi mtime/size trong model_dir, chỉ reload model thay đổi
+    - Model mới được load xong mới swap vào (atomic), predict đang chạy vẫn dùng model cũ
+    - File load lỗi (pickle hỏng / ghi dở) được ghi nhớ theo (path, mtime, size), chỉ thử lại khi file đổi
+    """
+    def __init__(self, loader, path_fn, memory_budget_mb=300, logger=None):
+        self.loader = loader
+        self.path_fn = path_fn
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.logger = logger
+        self.lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._missing = set()
+        self._failed = {}  # key -> (path, mtime_ns, size) của file load lỗi
+        self._loading = {}
+        self.listeners = []
+        self.evictions = 0
+        self.reloads = 0
+        self._watcher = None
+        self._stop = threading.Event()
+
+    # ---------- đọc ----------
+    def get(self, model_type, symbol):
+        """Model hiện tại (load lazy nếu chưa có trong cache), None nếu không có file."""
+        entry = self.get_entry(model_type, symbol)
+        return entry.model if entry else None
+
+    def get_entry(self, model_type, symbol):
+        """Như get() nhưng trả về ModelEntry (model + version cùng 1 lần load)."""
+        key = (model_type, symbol)
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+            if key in self._missing or key in self._failed:
+                return None
+        return self._load(key)
+
+    def version(self, model_type, symbol):
+        """Version (mtime_ns) của model đang dùng, None nếu chưa load."""
+        entry = self._entries.get((model_type, symbol))
+        return entry.version if entry else None
+
+    def snapshot(self):
+        """{model_type: {symbol: model}} của các model đang trong cache."""
+        with self.lock:
+            models = {}
+            for (model_type, symbol), entry in self._entries.items():
+                models.setdefault(model_type, {})[symbol] = entry.model
+            return models
+
+    def memory_usage(self):
+        with self.lock:
+            return sum(e.size for e in self._entries.values())
+
+    # ---------- load / swap ----------
+    def _load(self, key):
+        # Tránh 2 thread cùng load 1 model: thread sau chờ kết quả của thread trước
+        with self.lock:
+            event = self._loading.get(key)
+            owner = event is None
+            if owner:
+                event = self._loading[key] = threading.Event()
+        if not owner:
+            event.wait()
+            return self._entries.get(key)
+        try:
+            return self._load_file(key)
+        finally:
+            with self.lock:
+                self._loading.pop(key, None)
+            event.set()
+
+    def _load_file(self, key):
+        model_type, symbol = key
+        path = self.path_fn(model_type, symbol)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            with self.lock:
+                self._missing.add(key)
+            return None
+        try:
+            model = self.loader(model_type, symbol)
+        except Exception as e:
+            with self.lock:
+                self._failed[key] = (path, stat.st_mtime_ns, stat.st_size)
+            if self.logger:
+                self.logger.error(f"Failed to load {model_type} model for {symbol}: {e} (retry when the file changes)")
+            return None
+        if model is None:
+            with self.lock:
+                self._missing.add(key)
+            return None
+        entry = ModelEntry(model, path, stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            old = self._entries.get(key)
+            self._entries[key] = entry  # atomic swap
+            self._entries.move_to_end(key)
+            self._missing.discard(key)
+            self._failed.pop(key, None)
+            self._evict(keep=key)
+        if old is not None:
+            self.reloads += 1
+            for listener in list(self.listeners):
+                try:
+                    listener(model_type, symbol, entry.version)
+                except Exception as e:
+                    if self.logger:
+                        self.logger.error(f"Model reload listener failed: {e}")
+        return entry
+
+    def _file_changed(self, key, path, mtime_ns, size):
+        """True nếu file model của key khác (path, mtime, size) đã ghi nhận."""
+        current = self.path_fn(*key)
+        try:
+            stat = os.stat(current)
+        except FileNotFoundError:
+            return False
+        # path_fn có thể trỏ sang file khác (vd: bản .npz compiled vừa được export)
+        return current != path or stat.st_mtime_ns != mtime_ns or stat.st_size != size
+
+    def _evict(self, keep):
+        total = sum(e.size for e in self._entries.values())
+        while total > self.memory_budget and len(self._entries) > 1:
+            key, entry = next(iter(self._entries.items()))
+            if key == keep:
+                self._entries.move_to_end(key)
+                key, entry = next(iter(self._entries.items()))
+            del self._entries[key]
+            total -= entry.size
+            self.evictions += 1
+            if self.logger:
+                self.logger.info(f"Evicted {key[0]} model for {key[1]} (cache {total / 1e6:.1f}MB)")
+
+    def preload(self, keys, workers=4):
+        """Load song song danh sách (model_type, symbol)."""
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(self._load, keys))
+
+    def add_listener(self, callback):
+        """callback(model_type, symbol, version) khi model được hot-reload."""
+        self.listeners.append(callback)
+
+    # ---------- hot reload ----------
+    def check_updates(self):
+        """
+        So sánh mtime/size file với model đang cache, reload model thay đổi.
+        File model mới xuất hiện (trước đó không có) sẽ được load lại ở lần get kế tiếp.
+        Trả về list key đã reload.
+        """
+        with self.lock:
+            entries = list(self._entries.items())
+            missing = list(self._missing)
+            failed = dict(self._failed)
+        changed = []
+        for key, entry in entries:
+            if key in failed and not self._file_changed(key, *failed[key]):
+                continue  # bản mới bị lỗi, giữ model cũ tới khi file đổi tiếp
+            # Mất file tạm thời -> _file_changed False, giữ model cũ
+            if self._file_changed(key, entry.path, entry.mtime_ns, entry.size):
+                if self._load(key):
+                    changed.append(key)
+        for key, record in failed.items():
+            if key not in self._entries and self._file_changed(key, *record):
+                with self.lock:
+                    self._failed.pop(key, None)
+                changed.append(key)  # load lại ở lần get kế tiếp
+        for key in missing:
+            if os.path.exists(self.path_fn(*key)):
+                with self.lock:
+                    self._missing.discard(key)
+                changed.append(key)
+        if changed and self.logger:
+            self.logger.info(f"Hot-reloaded models: {changed}")
+        return changed
+
+    def start_watcher(self, interval=30):
+        if self._watcher or interval <= 0:
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.check_updates()
+                except Exception as e:
+                    if self.logger:
+                        self.logger.error(f"Model watcher error: {e}")
+
+        self._watcher = threading.Thread(target=loop, name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop.set()
+        if self._watcher:
+            self._watcher.join()
+            self._watcher = None
+
+    def stats(self):
+        with self.lock:
+            return {
+                "cached": len(self._entries),
+                "memory_mb": round(sum(e.size for e in self._entries.values()) / 1e6, 2),
+                "budget_mb": round(self.memory_budget / 1e6, 2),
+                "evictions": self.evictions,
+                "reloads": self.reloads,
+            }
@@ -0,0 +1,63 @@
+import threading
+import time
+from collections import OrderedDict
+
+class PredictionCache:
+    """
+    Cache kết quả ensemble (TTL + LRU) theo key (symbol, timeframe, timestamp nến cuối, version model).
+    Cùng 1 nến đã đóng đi vào AIEngine nhiều lần (candle loop, webhook, trigger tay)
+    chỉ tốn 1 lần lookup dict thay vì chạy lại toàn bộ model.
+    """
+    def __init__(self, max_size=2048, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self.lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return dict(item[1])
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self._data[key] = (time.monotonic() + self.ttl, dict(value))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, symbol=None):
+        """Xóa cache của 1 symbol (key[0]) hoặc toàn bộ nếu symbol=None."""
+        with self.lock:
+            if symbol is None:
+                removed = len(self._data)
+                self._data.clear()
+            else:
+                keys = [k for k in self._data if k[0] == symbol]
+                for k in keys:
+                    del self._data[k]
+                removed = len(keys)
+            self.invalidations += removed
+            return removed
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "invalidations": self.invalidations,
+            }
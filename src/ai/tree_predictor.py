@@ -0,0 +1,155 @@
+import json
+import time
+import numpy as np
+
+class CompiledTreeModel:
+    """
+    Bản "biên dịch" của model XGBoost (binary:logistic / reg:*) thành các mảng node phẳng,
+    predict bằng duyệt cây vector hóa NumPy (tất cả dòng x tất cả cây cùng lúc).
+    - Không cần import xgboost khi inference, load từ file .npz
+    - API predict_proba giống XGBClassifier để AIEngine dùng trực tiếp
+    - Split so sánh trên float32 giống xgboost (x < threshold -> nhánh trái, NaN -> nhánh default)
+    """
+    def __init__(self, feature, threshold, left, right, default, value, roots, max_depth, base_margin, objective):
+        self.feature = np.asarray(feature, dtype=np.int32)
+        self.threshold = np.asarray(threshold, dtype=np.float32)
+        self.left = np.asarray(left, dtype=np.int32)
+        self.right = np.asarray(right, dtype=np.int32)
+        self.default = np.asarray(default, dtype=np.int32)
+        self.value = np.asarray(value, dtype=np.float32)
+        self.roots = np.asarray(roots, dtype=np.int32)
+        self.max_depth = int(max_depth)
+        self.base_margin = float(base_margin)
+        self.objective = str(objective)
+
+    @classmethod
+    def from_xgboost(cls, model):
+        """Export từ XGBClassifier/Booster đã train (dùng best_iteration nếu có early stopping)."""
+        booster = model.get_booster() if hasattr(model, "get_booster") else model
+        raw = json.loads(bytes(booster.save_raw("json")).decode())
+        learner = raw["learner"]
+        objective = learner["objective"]["name"]
+        if not (objective.startswith("binary:logistic") or objective.startswith("reg:")):
+            raise ValueError(f"Unsupported objective for compiled model: {objective}")
+        gbm = learner["gradient_booster"]
+        if gbm.get("name", "gbtree") != "gbtree":
+            raise ValueError(f"Unsupported booster: {gbm.get('name')}")
+        trees = gbm["model"]["trees"]
+        try:
+            best = model.best_iteration
+        except AttributeError:
+            best = None
+        if best is not None:
+            trees = trees[:best + 1]
+        base_score = float(str(learner["learner_model_param"]["base_score"]).strip("[]"))
+        base_margin = np.log(base_score / (1 - base_score)) if objective.startswith("binary:") else base_score
+
+        feature, threshold, left, right, default, value, roots = [], [], [], [], [], [], []
+        max_depth = 0
+        offset = 0
+        for tree in trees:
+            if any(tree.get("split_type", [])):
+                raise ValueError("Categorical splits are not supported")
+            lc = np.asarray(tree["left_children"], dtype=np.int64)
+            rc = np.asarray(tree["right_children"], dtype=np.int64)
+            cond = np.asarray(tree["split_conditions"], dtype=np.float32)
+            leaf = lc < 0
+            feature.append(np.where(leaf, -1, tree["split_indices"]))
+            threshold.append(np.where(leaf, 0.0, cond))
+            value.append(np.where(leaf, cond, 0.0))
+            # Leaf trỏ về chính nó để vòng duyệt dừng tự nhiên
+            self_idx = np.arange(len(lc)) + offset
+            left.append(np.where(leaf, self_idx, lc + offset))
+            right.append(np.where(leaf, self_idx, rc + offset))
+            dl = np.asarray(tree["default_left"], dtype=bool)
+            default.append(np.where(leaf, self_idx, np.where(dl, lc + offset, rc + offset)))
+            roots.append(offset)
+            max_depth = max(max_depth, cls._depth(lc, rc))
+            offset += len(lc)
+        cat = np.concatenate
+        return cls(cat(feature), cat(threshold), cat(left), cat(right), cat(default), cat(value),
+                   roots, max_depth, base_margin, objective)
+
+    @staticmethod
+    def _depth(left, right):
+        depth, frontier = 0, [0]
+        while True:
+            nxt = [c for n in frontier for c in (left[n], right[n]) if c >= 0]
+            if not nxt:
+                return depth
+            depth += 1
+            frontier = nxt
+
+    def predict_margin(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        n = X.shape[0]
+        rows = np.arange(n)[:, None]
+        idx = np.broadcast_to(self.roots, (n, len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            f = self.feature[idx]
+            x = X[rows, np.maximum(f, 0)]
+            go = np.where(x < self.threshold[idx], self.left[idx], self.right[idx])
+            idx = np.where(np.isnan(x), self.default[idx], go)
+        return self.value[idx].astype(np.float64).sum(axis=1) + self.base_margin
+
+    def predict(self, X):
+        margin = self.predict_margin(X)
+        if self.objective.startswith("binary:"):
+            return 1.0 / (1.0 + np.exp(-margin))
+        return margin
+
+    def predict_proba(self, X):
+        p = self.predict(X)
+        return np.column_stack([1.0 - p, p])
+
+    def save(self, path):
+        np.savez(path, feature=self.feature, threshold=self.threshold, left=self.left, right=self.right,
+                 default=self.default, value=self.value, roots=self.roots, max_depth=self.max_depth,
+                 base_margin=self.base_margin, objective=self.objective)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(**{k: data[k] for k in data.files})
+
+def verify(compiled, model, X, atol=1e-5):
+    """So sánh xác suất với xgboost trên X; raise ValueError nếu lệch > atol. Trả về sai số max."""
+    expected = np.asarray(model.predict_proba(X))[:, 1]
+    diff = float(np.abs(compiled.predict_proba(X)[:, 1] - expected).max())
+    if diff > atol:
+        raise ValueError(f"Compiled model mismatch: max diff {diff:.2e} > {atol:.0e}")
+    return diff
+
+def benchmark(compiled, model, X, batch_sizes=(1, 8, 64), repeats=200):
+    """Thời gian trung bình (ms) mỗi lần predict_proba của xgboost và bản compiled theo batch size."""
+    report = {}
+    for bs in batch_sizes:
+        batch = X[:bs]
+        row = {}
+        for name, m in (("xgboost", model), ("compiled", compiled)):
+            m.predict_proba(batch)
+            start = time.perf_counter()
+            for _ in range(repeats):
+                m.predict_proba(batch)
+            row[name] = round((time.perf_counter() - start) / repeats * 1000, 4)
+        report[bs] = row
+    return report
+
+# Export + verify + benchmark: python tree_predictor.py models/xgb_BTCUSDT.pkl
+if __name__ == "__main__":
+    import pickle
+    import sys
+    src = sys.argv[1]
+    with open(src, "rb") as f:
+        model = pickle.load(f)
+    compiled = CompiledTreeModel.from_xgboost(model)
+    n_features = model.get_booster().num_features()
+    X = np.random.default_rng(0).normal(size=(512, n_features))
+    X[::17, 0] = np.nan
+    print("max diff:", verify(compiled, model, X))
+    print("benchmark (ms/call):", benchmark(compiled, model, X))
+    dst = src.rsplit(".", 1)[0] + ".npz"
+    compiled.save(dst)
+    print("saved", dst)
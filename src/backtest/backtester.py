@@ -0,0 +1,406 @@
+import heapq
+import logging
+from collections import OrderedDict
+import numpy as np
+from ai.feature_engine import ewm, rolling, wilder_rsi
+from capital.capital_manager import CapitalManager
+from execution.execution_engine import ExecutionEngine
+from execution.order_book import price_levels
+from pipeline.candle_store import CandleStore
+from pipeline.indicators import IndicatorState
+from risk.risk_controller import RiskController
+from strategy.strategies import derive_indicators
+from strategy.strategy_engine import StrategyEngine
+from utils.config_loader import ConfigLoader
+from utils.log_manager import LogManager
+
+# Level log của các module live trong lúc backtest (mỗi lệnh / mỗi lần SafeMode đều log)
+QUIET_LOGGERS = {"strategy": logging.WARNING, "order": logging.WARNING, "capital": logging.WARNING,
+                 "risk": logging.CRITICAL}
+
+class IndicatorCache:
+    """
+    LRU cache các mảng indicator theo (chuỗi nến, tên, period), giới hạn theo dung lượng.
+    Các bộ tham số dùng chung period (optimizer) không phải tính lại indicator.
+    """
+    def __init__(self, max_mb=256):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._data = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, fn):
+        value = self._data.get(key)
+        if value is not None:
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = self._data[key] = fn()
+        self.nbytes += value.nbytes
+        while self.nbytes > self.max_bytes and len(self._data) > 1:
+            _, old = self._data.popitem(last=False)
+            self.nbytes -= old.nbytes
+        return value
+
+def compute_indicators(candles, strategy_cfg, cache=None, key=None):
+    """
+    Bản vector hóa của IndicatorState trên toàn chuỗi: mỗi cột [i] bằng snapshot() sau nến i.
+    cache (IndicatorCache) + key (định danh chuỗi nến, vd: symbol + khoảng thời gian) để dùng lại
+    từng indicator giữa các lần gọi. Trả về (dict cột, mask ready).
+    """
+    state = IndicatorState.from_config(strategy_cfg)
+    close = np.asarray(candles["close"], dtype=np.float64)
+    n = len(close)
+
+    def cached(name, period, fn):
+        return fn() if cache is None else cache.get((key, name, period), fn)
+
+    def atr_fn():
+        high = np.asarray(candles["high"], dtype=np.float64)
+        low = np.asarray(candles["low"], dtype=np.float64)
+        prev = np.concatenate((close[:1], close[:-1]))
+        tr = np.maximum(high - low, np.maximum(np.abs(high - prev), np.abs(low - prev)))
+        if n:
+            tr[0] = high[0] - low[0]
+        p = state.atr_period
+        atr = np.full(n, np.nan)
+        if n >= p:
+            atr[p - 1] = tr[:p].mean()
+            atr[p:] = ewm(tr[p:], 1.0 / p, seed=atr[p - 1])
+        return atr
+
+    ema_fast = cached("ema", state.macd_fast, lambda: ewm(close, 2.0 / (state.macd_fast + 1)))
+    ema_slow = cached("ema", state.macd_slow, lambda: ewm(close, 2.0 / (state.macd_slow + 1)))
+    macd = ema_fast - ema_slow
+    signal = cached("macd_signal", (state.macd_fast, state.macd_slow, state.macd_signal),
+                    lambda: ewm(macd, 2.0 / (state.macd_signal + 1)))
+    bb_mid = cached("sma", state.bb_period, lambda: rolling(close, state.bb_period, np.mean))
+    width = state.bb_std * cached("std", state.bb_period, lambda: rolling(close, state.bb_period, np.std))
+    volume = np.asarray(candles["volume"], dtype=np.float64)
+    cols = {
+        "close": close,
+        "volume": volume,
+        "rsi": cached("rsi", state.rsi_period, lambda: wilder_rsi(close, state.rsi_period)),
+        "ema_fast": ema_fast,
+        "ema_slow": ema_slow,
+        "macd": macd,
+        "macd_signal": signal,
+        "macd_hist": macd - signal,
+        "atr": cached("atr", state.atr_period, atr_fn),
+        "bb_mid": bb_mid,
+        "bb_upper": bb_mid + width,
+        "bb_lower": bb_mid - width,
+        "volume_sma": cached("volume_sma", state.volume_sma_period,
+                             lambda: rolling(volume, state.volume_sma_period, np.mean)),
+    }
+    warmup = max(state.rsi_period + 1, state.atr_period, state.bb_period, state.macd_slow + state.macd_signal)
+    return cols, np.arange(n) >= warmup - 1
+
+def summarize(trades, equity, initial_balance):
+    """Win rate, profit factor, max drawdown... từ danh sách trade và equity curve."""
+    pnl = np.array([t["pnl"] for t in trades], dtype=np.float64)
+    gross_win = float(pnl[pnl > 0].sum())
+    gross_loss = float(-pnl[pnl < 0].sum())
+    curve = np.array([initial_balance] + [balance for _, balance in equity], dtype=np.float64)
+    peak = np.maximum.accumulate(curve)
+    final = float(curve[-1])
+    return {
+        "trades": len(trades),
+        "win_rate": float(np.mean(pnl > 0)) if len(pnl) else 0.0,
+        "profit_factor": gross_win / gross_loss if gross_loss else (float("inf") if gross_win else 0.0),
+        "total_pnl": float(pnl.sum()),
+        "return_pct": (final / initial_balance - 1.0) * 100,
+        "max_drawdown_pct": float(((peak - curve) / peak).max() * 100),
+        "final_balance": final,
+    }
+
+class SimClient:
+    """Client sàn mô phỏng cho ExecutionEngine: khớp ngay tại giá đề xuất."""
+    def __init__(self):
+        self.next_id = 0
+
+    def create_order(self, **kwargs):
+        self.next_id += 1
+        return {**kwargs, "id": self.next_id}
+
+    def update_stop_loss(self, order_id, sl):
+        pass
+
+class Backtester:
+    """
+    Replay lịch sử nến (CandleStore) qua đúng code quyết định live:
+    StrategyEngine (plugin + combine với AI), CapitalManager (sizing, PnL), RiskController (SafeMode),
+    ExecutionEngine.update_trailing (trailing SL).
+    - mode="event": từng nến đi qua IndicatorState -> propose_trade -> place_order/update_trailing
+    - mode="fast": indicator + tín hiệu tính vector hóa trên cả chuỗi, chỉ lặp qua các điểm vào lệnh,
+      điểm thoát (SL/TP/trailing giống update_trailing) tìm bằng NumPy
+    Fill model: vào lệnh ở close nến tín hiệu; từ nến sau, chạm SL (ưu tiên) / TP trong high-low thì thoát
+    tại SL/TP, gap qua thì thoát tại open; trailing cập nhật theo close. Phí + trượt giá tính vào giá khớp.
+    """
+    def __init__(self, config_dir="config", store=None, strategy_cfg=None, indicator_cache=None):
+        self.config_dir = config_dir
+        self.config = ConfigLoader(config_dir)
+        self.strategy_cfg = strategy_cfg or self.config.get("strategy")
+        self.indicator_cache = indicator_cache
+        self.params = self.strategy_cfg.get("strategy", {})
+        fetch_cfg = self.strategy_cfg.get("data_fetcher", {})
+        self.store = store or CandleStore(fetch_cfg.get("history_dir", "data/candles"))
+        bt = self.strategy_cfg.get("backtest", {})
+        self.initial_balance = bt.get("initial_balance", 10000.0)
+        self.cost = (bt.get("fee_pct", 0.1) + bt.get("slippage_pct", 0.0)) / 100
+        self.ai_confidence = bt.get("ai_confidence", 1.0)
+        self.strategy_stats = bt.get("strategy_stats", {"winrate": 0.6, "rr": 2.0})
+        self.max_positions = self.strategy_cfg.get("risk_management", {}).get("max_concurrent_positions", 2)
+        self.logger = LogManager.get_logger("backtest")
+
+    # ---------- dữ liệu ----------
+    def load(self, symbols, timeframe=None, start=None, end=None):
+        timeframe = timeframe or self.params.get("timeframe", "1h")
+        data = {}
+        for symbol in symbols:
+            records = self.store.range(symbol, timeframe, start, end)
+            if len(records):
+                data[symbol] = records
+        return data
+
+    def _setup(self):
+        strategy = StrategyEngine(self.config_dir, self.strategy_cfg)
+        capital = CapitalManager(self.config_dir, self.strategy_cfg)
+        capital.balance = capital.equity = self.initial_balance
+        risk = RiskController(self.config_dir)
+        now = [0.0]
+        risk.clock = lambda: now[0]
+        execution = ExecutionEngine(SimClient(), capital, risk, self.config_dir, rate_limit=False)
+        return strategy, capital, risk, execution, now
+
+    # ---------- fill model ----------
+    def _entry_order(self, symbol, side, close, size):
+        entry = close * (1 + self.cost) if side == "buy" else close * (1 - self.cost)
+        sl, tp = price_levels(side, entry, self.params.get("sl", 2.5), self.params.get("tp", 5.0))
+        return {
+            "symbol": symbol, "side": side, "size": size, "entry_price": entry, "sl": sl, "tp": tp,
+            "trailing": self.params.get("trailing", {}),
+        }
+
+    def _exit_price(self, price, side):
+        return price * (1 - self.cost) if side == "buy" else price * (1 + self.cost)
+
+    @staticmethod
+    def _hit(side, sl, tp, o, h, l):
+        """Giá thoát (trước phí) + lý do nếu nến chạm SL/TP, None nếu không."""
+        if side == "buy":
+            if l <= sl:
+                return min(o, sl), "sl"
+            if h >= tp:
+                return max(o, tp), "tp"
+        else:
+            if h >= sl:
+                return max(o, sl), "sl"
+            if l <= tp:
+                return min(o, tp), "tp"
+        return None
+
+    def _find_exit(self, cols, i, order):
+        """
+        Nến thoát đầu tiên sau nến vào i, vector hóa theo block.
+        SL tại nến j = max(SL ban đầu, trailing từ close các nến trước j), đúng như gọi update_trailing
+        sau mỗi nến. Trả về (index, giá thoát trước phí, lý do).
+        """
+        o, h, l, c = cols["open"], cols["high"], cols["low"], cols["close"]
+        n = len(c)
+        side, entry, tp = order["side"], order["entry_price"], order["tp"]
+        trailing = order["trailing"]
+        trail_on = trailing.get("enabled", False)
+        trigger = trailing.get("trigger_pct", 1.5) / 100
+        trail = trailing.get("trail_pct", 0.4) / 100
+        buy = side == "buy"
+        sl = order["sl"]
+        start, chunk = i + 1, 256
+        while start < n:
+            end = min(n, start + chunk)
+            cs = c[start:end]
+            if trail_on:
+                if buy:
+                    cand = np.maximum.accumulate(np.where(cs >= entry * (1 + trigger), cs * (1 - trail), -np.inf))
+                else:
+                    cand = np.minimum.accumulate(np.where(cs <= entry * (1 - trigger), cs * (1 + trail), np.inf))
+                prior = np.concatenate(([-np.inf if buy else np.inf], cand[:-1]))
+                sl_bar = np.maximum(sl, prior) if buy else np.minimum(sl, prior)
+            else:
+                sl_bar = np.full(len(cs), sl)
+            if buy:
+                hit_sl, hit_tp = l[start:end] <= sl_bar, h[start:end] >= tp
+            else:
+                hit_sl, hit_tp = h[start:end] >= sl_bar, l[start:end] <= tp
+            hit = hit_sl | hit_tp
+            if hit.any():
+                k = int(np.argmax(hit))
+                price, reason = self._hit(side, sl_bar[k], tp, o[start + k], h[start + k], l[start + k])
+                if reason == "sl" and sl_bar[k] != order["sl"]:
+                    reason = "trailing"
+                return start + k, price, reason
+            if trail_on:
+                sl = max(sl, cand[-1]) if buy else min(sl, cand[-1])
+            start, chunk = end, chunk * 2
+        return n - 1, c[-1], "end"
+
+    # ---------- fast path ----------
+    def signals(self, symbol, candles, strategy, ai_scores=None):
+        """Mask vào lệnh, side (+1/-1) và confidence cho toàn chuỗi, tính 1 lần vector hóa."""
+        key = (symbol, len(candles), int(candles["timestamp"][0]), int(candles["timestamp"][-1])) if len(candles) else None
+        cols, ready = compute_indicators(candles, self.strategy_cfg, self.indicator_cache, key)
+        ind = derive_indicators(cols)
+        n = len(ready)
+        tech, _ = strategy.score(ind, [symbol] * n)
+        ai_conf = np.full(n, self.ai_confidence) if ai_scores is None else np.asarray(ai_scores, dtype=np.float64)
+        confidence, mask = strategy.combine(tech, ai_conf, np.isfinite(ai_conf))
+        return mask & ready, np.sign(tech), confidence
+
+    def run_fast(self, data, ai_scores=None):
+        strategy, capital, risk, _, now = self._setup()
+        ai_scores = ai_scores or {}
+        cols, events = {}, []
+        for k, (symbol, candles) in enumerate(data.items()):
+            cols[symbol] = {f: np.asarray(candles[f], dtype=np.float64) for f in ("open", "high", "low", "close")}
+            cols[symbol]["quote_volume"] = np.asarray(candles["quote_volume"], dtype=np.float64)
+            cols[symbol]["volume"] = np.asarray(candles["volume"], dtype=np.float64)
+            cols[symbol]["timestamp"] = np.asarray(candles["timestamp"])
+            mask, side, _ = self.signals(symbol, candles, strategy, ai_scores.get(symbol))
+            for i in np.flatnonzero(mask):
+                events.append((int(cols[symbol]["timestamp"][i]), k, int(i), symbol, "buy" if side[i] > 0 else "sell"))
+        events.sort()
+
+        trades, equity, exits, open_until = [], [], [], {}
+
+        def close_until(ts):
+            while exits and exits[0][0] <= ts:
+                exit_ts, _, symbol, order, price, reason = heapq.heappop(exits)
+                now[0] = exit_ts / 1000
+                pnl = capital.close_position(order["position_id"], self._exit_price(price, order["side"]))
+                risk.on_trade_result(pnl)
+                del open_until[symbol]
+                trades.append(self._trade(order, exit_ts, self._exit_price(price, order["side"]), pnl, reason))
+                equity.append((exit_ts, capital.balance))
+
+        seq = 0
+        for ts, _, i, symbol, side in events:
+            close_until(ts)
+            if symbol in open_until or len(open_until) >= self.max_positions:
+                continue
+            now[0] = ts / 1000
+            c = cols[symbol]
+            row = {"quote_volume": c["quote_volume"][i], "volume": c["volume"][i]}
+            if not risk.should_trade() or not strategy.check_filter(symbol, [row], side):
+                continue
+            size = capital.get_position_size(self.strategy_stats)
+            if not risk.check_max_position(size, capital.balance):
+                continue
+            order = self._entry_order(symbol, side, c["close"][i], size)
+            order["entry_ts"] = ts
+            order["position_id"] = capital.add_position(symbol, size, order["entry_price"], side)
+            j, price, reason = self._find_exit(c, i, order)
+            seq += 1
+            heapq.heappush(exits, (int(c["timestamp"][j]), seq, symbol, order, price, reason))
+            open_until[symbol] = j
+        close_until(float("inf"))
+        return trades, equity
+
+    # ---------- event-driven ----------
+    def run_event(self, data):
+        strategy, capital, risk, execution, now = self._setup()
+        symbols = list(data)
+        ts_all = np.concatenate([np.asarray(data[s]["timestamp"]) for s in symbols])
+        sym_all = np.concatenate([np.full(len(data[s]), k) for k, s in enumerate(symbols)])
+        idx_all = np.concatenate([np.arange(len(data[s])) for s in symbols])
+        order_idx = np.lexsort((sym_all, ts_all))
+        ts_all, sym_all, idx_all = ts_all[order_idx], sym_all[order_idx], idx_all[order_idx]
+        bounds = np.flatnonzero(np.diff(ts_all)) + 1
+        states = {s: IndicatorState.from_config(self.strategy_cfg) for s in symbols}
+        open_orders = {}
+        trades, equity = [], []
+
+        def close(order, ts, price, reason):
+            exit_price = self._exit_price(price, order["side"])
+            pnl = execution.close_order(order["id"], exit_price)
+            del open_orders[order["symbol"]]
+            trades.append(self._trade(order, ts, exit_price, pnl, reason))
+            equity.append((ts, capital.balance))
+
+        for group_sym, group_idx, group_ts in zip(np.split(sym_all, bounds), np.split(idx_all, bounds),
+                                                 np.split(ts_all, bounds)):
+            ts = int(group_ts[0])
+            now[0] = ts / 1000
+            bars = [(symbols[k], data[symbols[k]][i]) for k, i in zip(group_sym.tolist(), group_idx.tolist())]
+            # Thoát lệnh + trailing trước, vào lệnh mới sau (cùng thứ tự với fast path)
+            for symbol, bar in bars:
+                order = open_orders.get(symbol)
+                if order is None:
+                    continue
+                hit = self._hit(order["side"], order["sl"], order["tp"], bar["open"], bar["high"], bar["low"])
+                if hit:
+                    price, reason = hit
+                    close(order, ts, price, "trailing" if reason == "sl" and order["sl"] != order["initial_sl"] else reason)
+                else:
+                    execution.update_trailing(order, float(bar["close"]))
+            for symbol, bar in bars:
+                state = states[symbol]
+                state.update(float(bar["high"]), float(bar["low"]), float(bar["close"]), float(bar["volume"]), ts)
+                if symbol in open_orders or len(open_orders) >= self.max_positions or not state.ready:
+                    continue
+                candle = {"close": float(bar["close"]), "volume": float(bar["volume"]),
+                          "quote_volume": float(bar["quote_volume"])}
+                ai_signal = {"symbol": symbol, "confidence": self.ai_confidence, "pass": True}
+                proposal = strategy.propose_trade(ai_signal, [candle], indicators=state.snapshot())
+                if not proposal:
+                    continue
+                size = capital.get_position_size(self.strategy_stats)
+                sim = self._entry_order(symbol, proposal["side"], candle["close"], size)
+                order = execution.place_order({**proposal, **sim})
+                if order:
+                    order["initial_sl"], order["entry_ts"] = order["sl"], ts
+                    open_orders[symbol] = order
+        for symbol, order in list(open_orders.items()):
+            last = data[symbol][-1]
+            close(order, int(last["timestamp"]), float(last["close"]), "end")
+        return trades, equity
+
+    @staticmethod
+    def _trade(order, exit_ts, exit_price, pnl, reason):
+        return {
+            "symbol": order["symbol"], "side": order["side"], "size": order["size"],
+            "entry_ts": order["entry_ts"], "entry_price": order["entry_price"],
+            "exit_ts": int(exit_ts), "exit_price": float(exit_price), "pnl": float(pnl), "reason": reason,
+        }
+
+    def run(self, symbols, timeframe=None, start=None, end=None, mode="fast", ai_scores=None):
+        """
+        Backtest các symbol trên lịch sử [start, end) (epoch ms).
+        ai_scores: {symbol: mảng confidence AI theo nến} (fast mode), mặc định backtest.ai_confidence.
+        Trả về {"trades", "equity", "metrics"}.
+        """
+        data = self.load(symbols, timeframe, start, end)
+        loggers = [LogManager.get_logger(name) for name in QUIET_LOGGERS]
+        levels = [lg.level for lg in loggers]
+        for lg, level in zip(loggers, QUIET_LOGGERS.values()):
+            lg.setLevel(level)
+        try:
+            trades, equity = self.run_fast(data, ai_scores) if mode == "fast" else self.run_event(data)
+        finally:
+            for lg, level in zip(loggers, levels):
+                lg.setLevel(level)
+        metrics = summarize(trades, equity, self.initial_balance)
+        self.logger.info(f"Backtest {mode} {list(data)}: {metrics}")
+        return {"trades": trades, "equity": equity, "metrics": metrics}
+
+# Usage: python backtester.py [fast|event] BTCUSDT ETHUSDT ...
+if __name__ == "__main__":
+    import sys
+    import time
+    mode = sys.argv[1] if len(sys.argv) > 1 else "fast"
+    symbols = sys.argv[2:] or ["BTCUSDT"]
+    t0 = time.perf_counter()
+    result = Backtester().run(symbols, mode=mode)
+    print(result["metrics"])
+    print(f"{len(result['trades'])} trades in {time.perf_counter() - t0:.2f}s")
@@ -0,0 +1,163 @@
+import copy
+import itertools
+import json
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+import yaml
+from backtest.backtester import Backtester, IndicatorCache
+from pipeline.candle_store import CandleStore
+from utils.config_loader import ConfigLoader
+from utils.log_manager import LogManager
+
+# State riêng của từng worker process: store memmap + cache indicator sống qua nhiều bộ tham số
+_WORKER = {}
+
+def _init_worker(config_dir, history_dir, cache_mb):
+    _WORKER["config_dir"] = config_dir
+    _WORKER["store"] = CandleStore(history_dir)
+    _WORKER["cache"] = IndicatorCache(cache_mb)
+
+def _evaluate(job):
+    base_cfg, params, symbols, timeframe, start, end = job
+    bt = Backtester(_WORKER["config_dir"], store=_WORKER["store"], strategy_cfg=apply_params(base_cfg, params),
+                    indicator_cache=_WORKER["cache"])
+    return params, bt.run(symbols, timeframe, start, end)["metrics"]
+
+def apply_params(cfg, params):
+    """Bản copy của config với các giá trị theo đường dẫn dạng 'strategy.trailing.trail_pct'."""
+    cfg = copy.deepcopy(cfg)
+    for path, value in params.items():
+        node = cfg
+        *parents, leaf = path.split(".")
+        for name in parents:
+            node = node.setdefault(name, {})
+        node[leaf] = value
+    return cfg
+
+class Optimizer:
+    """
+    Dò tham số strategy/risk (optimizer.space trong strategy.yaml) bằng backtest fast mode
+    chạy song song trên process pool:
+    - method: grid (toàn bộ tổ hợp), random (samples tổ hợp), halving (successive halving:
+      chạy nhiều tổ hợp trên đoạn lịch sử ngắn, giữ 1/eta tốt nhất, tăng dần độ dài)
+    - Mỗi worker tự mở CandleStore (memmap, dùng chung page cache) thay vì nhận bản copy dữ liệu,
+      và giữ IndicatorCache: các tổ hợp cùng period chỉ tính indicator 1 lần
+    - Kết quả xếp hạng theo objective, ghi report JSON và có thể ghi ra strategy.yaml ứng viên
+    """
+    def __init__(self, config_dir="config"):
+        self.config_dir = config_dir
+        self.config = ConfigLoader(config_dir)
+        self.base_cfg = self.config.get("strategy", reload=True)
+        opt = self.base_cfg.get("optimizer", {})
+        self.space = opt.get("space", {})
+        self.method = opt.get("method", "random")
+        self.samples = opt.get("samples", 50)
+        self.workers = max(1, min(os.cpu_count() or 1, opt.get("workers", 4)))
+        self.objective = opt.get("objective", "return_pct")
+        self.min_trades = opt.get("min_trades", 30)
+        self.eta = opt.get("halving_eta", 3)
+        self.seed = opt.get("seed", 42)
+        self.cache_mb = opt.get("cache_mb", 256)
+        self.report_dir = opt.get("report_dir", "reports")
+        self.history_dir = self.base_cfg.get("data_fetcher", {}).get("history_dir", "data/candles")
+        self.timeframe = self.base_cfg.get("strategy", {}).get("timeframe", "1h")
+        self.logger = LogManager.get_logger("optimizer")
+
+    # ---------- không gian tham số ----------
+    def grid(self):
+        names = list(self.space)
+        return [dict(zip(names, values)) for values in itertools.product(*(self.space[n] for n in names))]
+
+    def candidates(self):
+        combos = self.grid()
+        if self.method in ("random", "halving") and len(combos) > self.samples:
+            combos = random.Random(self.seed).sample(combos, self.samples)
+        # Gom các tổ hợp cùng period indicator cạnh nhau để worker dùng lại cache
+        return sorted(combos, key=lambda p: sorted((k, str(v)) for k, v in p.items() if "strategies." in k))
+
+    def score(self, metrics):
+        if metrics["trades"] < self.min_trades:
+            return -math.inf
+        return metrics[self.objective]
+
+    # ---------- chạy ----------
+    def _run_round(self, pool, combos, symbols, start, end):
+        jobs = [(self.base_cfg, params, symbols, self.timeframe, start, end) for params in combos]
+        chunksize = max(1, len(jobs) // (self.workers * 4))
+        return [{"params": params, "metrics": metrics, "score": self.score(metrics)}
+                for params, metrics in pool.map(_evaluate, jobs, chunksize=chunksize)]
+
+    def run(self, symbols, start=None, end=None):
+        """Chạy search, trả về list kết quả đã xếp hạng (tốt nhất trước)."""
+        combos = self.candidates()
+        t0 = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(self.config_dir, self.history_dir, self.cache_mb)) as pool:
+            if self.method == "halving":
+                results = self._halving(pool, combos, symbols, start, end)
+            else:
+                results = sorted(self._run_round(pool, combos, symbols, start, end),
+                                 key=lambda r: r["score"], reverse=True)
+        self.logger.info(f"{self.method} search: {len(combos)} candidates in {time.perf_counter() - t0:.1f}s, "
+                         f"best {self.objective}={results[0]['score'] if results else None}")
+        return results
+
+    def _halving(self, pool, combos, symbols, start, end):
+        """
+        Vòng r chạy trên eta^(r - rounds) phần cuối của lịch sử, chỉ 1/eta tổ hợp tốt nhất đi tiếp.
+        Xếp hạng: tổ hợp vào vòng sau cùng trước, tổ hợp bị loại sớm hơn xếp sau.
+        """
+        store = CandleStore(self.history_dir)
+        stamps = [store.range(s, self.timeframe, start, end)["timestamp"] for s in symbols]
+        stamps = [ts for ts in stamps if len(ts)]
+        if not stamps or not combos:
+            return []
+        first = min(int(ts[0]) for ts in stamps)
+        last = max(int(ts[-1]) for ts in stamps) + 1
+        rounds = max(0, math.ceil(math.log(len(combos), self.eta)) - 1)
+        eliminated = []
+        for r in range(rounds + 1):
+            span = (last - first) * self.eta ** (r - rounds)
+            results = sorted(self._run_round(pool, combos, symbols, int(last - span), end),
+                             key=lambda x: x["score"], reverse=True)
+            for item in results:
+                item["round"] = r
+            keep = len(results) if r == rounds else max(1, len(results) // self.eta)
+            eliminated = results[keep:] + eliminated
+            combos = [item["params"] for item in results[:keep]]
+        return results + eliminated
+
+    # ---------- output ----------
+    def write_report(self, results, symbols, path=None):
+        os.makedirs(self.report_dir, exist_ok=True)
+        path = path or os.path.join(self.report_dir, f"optimizer_{time.strftime('%Y%m%d%H%M%S')}.json")
+        report = {"method": self.method, "objective": self.objective, "symbols": symbols, "timeframe": self.timeframe,
+                  "results": [{**r, "rank": i + 1, "score": None if r["score"] == -math.inf else r["score"]}
+                              for i, r in enumerate(results)]}
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2, default=float)
+        return path
+
+    def write_candidate(self, params, path=None):
+        """Ghi strategy.yaml ứng viên (không ghi đè file đang chạy)."""
+        path = path or os.path.join(self.config_dir, "strategy.candidate.yaml")
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            yaml.safe_dump(apply_params(self.base_cfg, params), f, sort_keys=False, allow_unicode=True)
+        os.replace(tmp, path)
+        return path
+
+# Usage: python optimizer.py BTCUSDT ETHUSDT ...
+if __name__ == "__main__":
+    import sys
+    symbols = sys.argv[1:] or ["BTCUSDT"]
+    optimizer = Optimizer()
+    ranked = optimizer.run(symbols)
+    for item in ranked[:10]:
+        print(round(item["score"], 3), item["params"], item["metrics"]["trades"])
+    print("report:", optimizer.write_report(ranked, symbols))
+    if ranked and ranked[0]["score"] != -math.inf:
+        print("candidate:", optimizer.write_candidate(ranked[0]["params"]))
@@ -1,3 +1,4 @@
+import itertools
 import math
 from utils.config_loader import ConfigLoader
 from utils.log_manager import LogManager
@@ -7,21 +8,29 @@ class CapitalManager:
     Quản lý vốn, position sizing (Kelly/fixed), scaling (pyramiding),
     theo dõi PnL, cập nhật balance và báo cáo vốn cho các module khác.
     """
-    def __init__(self, config_dir="config"):
+    def __init__(self, config_dir="config", strategy_cfg=None):
         self.config = ConfigLoader(config_dir)
         self.logger = LogManager.get_logger("capital")
         self.reset_state()
+        self.reload_config(strategy_cfg)
+        if strategy_cfg is None:
+            self.config.subscribe("strategy", self._on_config_change)
 
-        cfg = self.config.get("strategy", reload=True)
+    def reload_config(self, strategy_cfg=None):
+        """Đọc thông số từ strategy.yaml (hoặc dict config có sẵn khi backtest / optimizer)."""
+        cfg = (strategy_cfg or self.config.get("strategy", reload=True)).get("strategy", {})
+        self.max_position_pct = cfg.get("max_position_size", 4.0) / 100.0
+        self.kelly_fraction = cfg.get("kelly_fraction", 0.12)
+        self.sizing_method = cfg.get("position_sizing_method", "kelly")
 
-        # Đọc thông số từ strategy.yaml
-        self.max_position_pct = cfg.get("strategy", {}).get("max_position_size", 4.0) / 100.0
-        self.kelly_fraction = cfg.get("strategy", {}).get("kelly_fraction", 0.12)
+    def _on_config_change(self, name, config):
+        self.reload_config(config)
 
     def reset_state(self):
         self.balance = 10000.0  # Khởi tạo giả định, cần lấy từ API thực tế
         self.equity = self.balance
-        self.open_positions = []
+        self.open_positions = {}  # position id (= order id khi đặt qua ExecutionEngine) -> position
+        self._next_id = itertools.count(1)
         self.total_pnl = 0.0
         self.daily_pnl = 0.0
         self.current_day = None
@@ -45,20 +54,20 @@ class CapitalManager:
         kelly = max(0, min(kelly, 1))  # Clamp 0-1
         risk_pct = fraction if risk_pct is None else risk_pct
         size = self.balance * min(kelly * risk_pct, self.max_position_pct)
-        self.logger.debug(f"Kelly size: {size:.2f} ({kelly=:.2f}, {risk_pct=:.2f})")
+        self.logger.debug("Kelly size: %.2f (kelly=%.2f, risk_pct=%.2f)", size, kelly, risk_pct)
         return round(size, 2)
 
     def fixed_position_size(self, risk_pct=None):
         risk_pct = risk_pct if risk_pct is not None else self.kelly_fraction
         size = self.balance * min(risk_pct, self.max_position_pct)
-        self.logger.debug(f"Fixed size: {size:.2f} ({risk_pct=:.2f})")
+        self.logger.debug("Fixed size: %.2f (risk_pct=%.2f)", size, risk_pct)
         return round(size, 2)
 
     def get_position_size(self, strategy_stats, method=None, risk_pct=None):
         """
         strategy_stats: dict with keys 'winrate', 'rr'
         """
-        method = method or self.config.get("strategy", {}).get("strategy", {}).get("position_sizing_method", "kelly")
+        method = method or self.sizing_method
         if method == "kelly":
             return self.kelly_position_size(
                 strategy_stats.get("winrate", 0.55),
@@ -68,32 +77,45 @@ class CapitalManager:
         else:
             return self.fixed_position_size(risk_pct)
 
-    def add_position(self, symbol, size, entry_price, side):
-        pos = {"symbol": symbol, "size": size, "entry": entry_price, "side": side}
-        self.open_positions.append(pos)
+    def add_position(self, symbol, size, entry_price, side, position_id=None):
+        """Mở vị thế, trả về position id (tự sinh nếu không truyền)."""
+        if position_id is None:
+            position_id = f"pos-{next(self._next_id)}"
+        pos = {"id": position_id, "symbol": symbol, "size": size, "entry": entry_price, "side": side}
+        self.open_positions[position_id] = pos
         self.logger.info(f"Opened {side} {symbol} size {size} at {entry_price}")
+        return position_id
 
-    def close_position(self, pos_idx, exit_price):
-        pos = self.open_positions[pos_idx]
-        pnl = (exit_price - pos["entry"]) * pos["size"] if pos["side"] == "buy" else (pos["entry"] - exit_price) * pos["size"]
+    def close_position(self, position_id, exit_price):
+        """
+        Đóng vị thế, trả về PnL (None nếu position_id không còn mở).
+        size là giá trị vị thế theo USDT (get_position_size), không phải số lượng coin:
+        PnL = (exit / entry - 1) * size (buy), đảo dấu với sell.
+        """
+        pos = self.open_positions.pop(position_id, None)
+        if pos is None:
+            self.logger.warning(f"Position {position_id} not found for closing.")
+            return None
+        change = exit_price / pos["entry"] - 1.0
+        pnl = change * pos["size"] if pos["side"] == "buy" else -change * pos["size"]
         self.update_balance(pnl)
         self.logger.info(f"Closed {pos['side']} {pos['symbol']} at {exit_price}, PnL: {pnl:.2f}")
-        del self.open_positions[pos_idx]
         return pnl
 
     def scale_position(self, symbol, add_size, entry_price, side):
         """
         Pyramiding: thêm vị thế mới cùng chiều
         """
-        self.add_position(symbol, add_size, entry_price, side)
+        position_id = self.add_position(symbol, add_size, entry_price, side)
         self.logger.info(f"Pyramiding {side} {symbol}: +{add_size} at {entry_price}")
+        return position_id
 
     def report(self):
         report = {
             "balance": round(self.balance, 2),
             "daily_pnl": round(self.daily_pnl, 2),
             "total_pnl": round(self.total_pnl, 2),
-            "open_positions": list(self.open_positions)
+            "open_positions": list(self.open_positions.values())
         }
         self.logger.info(f"Capital Report: {report}")
         return report
@@ -103,7 +125,7 @@ if __name__ == "__main__":
     cm = CapitalManager()
     stats = {"winrate": 0.60, "rr": 2.0}
     size = cm.get_position_size(stats)
-    cm.add_position("BTCUSDT", size, 29000, "buy")
-    pnl = cm.close_position(0, 29200)
+    pos_id = cm.add_position("BTCUSDT", size, 29000, "buy")
+    pnl = cm.close_position(pos_id, 29200)
     print("PnL Closed:", pnl)
     print("Report:", cm.report())
@@ -43,7 +43,7 @@ class DashboardApp:
             # Orders
             with col3:
                 st.header("📈 Open Orders")
-                for order in self.execution_engine.open_orders:
+                for order in self.execution_engine.book.values():
                     st.write(order)
 
             # AI Engine status (optional)
@@ -10,7 +10,7 @@ class DiscordBot(commands.Bot):
     """
     Discord bot cho trading: slash command, push notify, nhận lệnh tay, báo cáo trạng thái, SafeMode...
     """
-    def __init__(self, capital_manager, risk_controller, execution_engine, config_dir="config"):
+    def __init__(self, capital_manager, risk_controller, execution_engine, config_dir="config", price_source=None):
         intents = discord.Intents.default()
         intents.messages = True
         intents.message_content = True
@@ -20,6 +20,7 @@ class DiscordBot(commands.Bot):
         self.capital_manager = capital_manager
         self.risk_controller = risk_controller
         self.execution_engine = execution_engine
+        self.price_source = price_source  # callable(symbols) -> {symbol: giá thị trường}, dùng cho !closeall
 
         # Load .env và lấy channel_id từ biến môi trường
         load_dotenv()
@@ -57,13 +58,16 @@ class DiscordBot(commands.Bot):
                 await ctx.send("Đặt lệnh thất bại hoặc đang SafeMode.")
 
         @self.command(name="closeall")
-        async def closeall(ctx):
-            """Đóng toàn bộ lệnh đang mở"""
-            count = 0
-            for order in list(self.execution_engine.open_orders):
-                self.execution_engine.close_order(order["id"], order.get("tp", order["entry_price"]))
-                count += 1
-            await ctx.send(f"Đã đóng {count} lệnh.")
+        async def closeall(ctx, symbol: str = None):
+            """Đóng toàn bộ lệnh đang mở (hoặc chỉ của 1 symbol) theo giá thị trường hiện tại"""
+            symbol = symbol.upper() if symbol else None
+            symbols = [symbol] if symbol else self.execution_engine.book.symbols()
+            prices = self.price_source(symbols) if self.price_source else {}
+            closed, skipped = self.execution_engine.close_all(prices, symbol)
+            msg = f"Đã đóng {closed} lệnh."
+            if skipped:
+                msg += f" Bỏ qua {len(skipped)} lệnh chưa có giá thị trường: {', '.join(sorted({o['symbol'] for o in skipped}))}"
+            await ctx.send(msg)
 
         @self.command(name="help")
         async def help_cmd(ctx):
@@ -72,7 +76,7 @@ class DiscordBot(commands.Bot):
                 "`!status` - Xem trạng thái vốn/risk\n"
                 "`!safemode on/off` - Bật/tắt SafeMode thủ công\n"
                 "`!order SYMBOL SIDE SIZE [PRICE]` - Đặt lệnh tay (ví dụ: !order BTCUSDT buy 100 30000)\n"
-                "`!closeall` - Đóng toàn bộ lệnh\n"
+                "`!closeall [SYMBOL]` - Đóng toàn bộ lệnh (hoặc của 1 symbol)\n"
             )
             await ctx.send(msg)
 
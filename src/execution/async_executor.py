@@ -0,0 +1,296 @@
+import asyncio
+import functools
+import http.client
+import json
+import queue
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+from utils.metrics import METRICS
+
+_LOOP = None
+_LOOP_LOCK = threading.Lock()
+IO_THREADS = 32
+
+def event_loop():
+    """
+    Event loop dùng chung cho mọi executor trong process (1 thread nền, khởi tạo lần đầu dùng).
+    Lời gọi client blocking chạy trên default executor của loop (pool IO_THREADS thread).
+    """
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            loop = asyncio.new_event_loop()
+            loop.set_default_executor(ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix="exchange-io"))
+            threading.Thread(target=loop.run_forever, name="exchange-loop", daemon=True).start()
+            _LOOP = loop
+        return _LOOP
+
+def new_client_order_id(prefix="thp"):
+    """Client order id duy nhất (<= 36 ký tự như Binance newClientOrderId), giữ nguyên qua các lần retry."""
+    return f"{prefix}-{uuid.uuid4().hex[:24]}"
+
+class ExchangeError(Exception):
+    """Lỗi từ sàn. retryable: 429 / 418 / 5xx (thử lại được), lỗi 4xx khác thì không."""
+    def __init__(self, message, status=None, payload=None):
+        super().__init__(message)
+        self.status = status
+        self.payload = payload
+        self.retryable = status is None or status in (418, 429) or status >= 500
+
+def is_retryable(exc):
+    if isinstance(exc, ExchangeError):
+        return exc.retryable
+    return isinstance(exc, (ConnectionError, TimeoutError, asyncio.TimeoutError, http.client.HTTPException, OSError))
+
+# Lệnh chắc chắn đã có trên sàn (trùng client_order_id) nhưng chưa tra được: id tạm = client_order_id
+UNCONFIRMED = "unconfirmed"
+
+# Mã lỗi trùng client order id: Binance futures -4116, Bybit 110072
+DUPLICATE_CODES = (-4116, 110072)
+
+def is_duplicate(exc):
+    """Sàn từ chối vì client_order_id đã tồn tại, tức lần gửi trước đã vào sổ."""
+    if not isinstance(exc, ExchangeError):
+        return False
+    payload = exc.payload if isinstance(exc.payload, dict) else {}
+    return (exc.status == 409 or payload.get("code") in DUPLICATE_CODES
+            or "duplicate" in str(payload.get("msg", "")).lower())
+
+class HttpSession:
+    """
+    Pool kết nối HTTP(S) keep-alive (stdlib http.client) tới 1 host, dùng an toàn từ nhiều thread.
+    Kết nối lỗi bị đóng và bỏ khỏi pool, request sau tự mở kết nối mới.
+    """
+    def __init__(self, base_url, pool_size=8, timeout=10.0, headers=None):
+        url = urlsplit(base_url)
+        self.https = url.scheme == "https"
+        self.host = url.hostname
+        self.port = url.port
+        self.prefix = url.path.rstrip("/")
+        self.timeout = timeout
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+        self.pool = queue.LifoQueue(pool_size)
+
+    def _connect(self, timeout):
+        cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=timeout)
+
+    def request(self, method, path, params=None, body=None, timeout=None):
+        """Gửi request JSON, trả về payload đã decode; status >= 400 -> ExchangeError."""
+        url = self.prefix + path + (f"?{urlencode(params)}" if params else "")
+        data = json.dumps(body).encode() if body is not None else None
+        try:
+            conn = self.pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect(timeout or self.timeout)
+        try:
+            conn.timeout = timeout or self.timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(conn.timeout)
+            conn.request(method, url, body=data, headers=self.headers)
+            resp = conn.getresponse()
+            raw = resp.read()
+        except Exception:
+            conn.close()
+            raise
+        try:
+            self.pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+        payload = json.loads(raw) if raw else None
+        if resp.status >= 400:
+            message = payload.get("msg") if isinstance(payload, dict) else raw[:200]
+            raise ExchangeError(f"HTTP {resp.status} {method} {path}: {message}", resp.status, payload)
+        return payload
+
+    def close(self):
+        while True:
+            try:
+                self.pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+class HttpExchangeClient:
+    """
+    Client REST JSON tối giản theo interface ExecutionEngine dùng
+    (create_order / update_stop_loss / cancel_order / fetch_order) qua HttpSession.
+    Dùng với exchange giả lập local hoặc gateway nội bộ; sàn thật cần thêm ký request.
+    """
+    def __init__(self, base_url, pool_size=8, timeout=10.0, headers=None):
+        self.session = HttpSession(base_url, pool_size, timeout, headers)
+
+    def create_order(self, symbol, side, size, price=None, sl=None, tp=None, client_order_id=None, timeout=None):
+        body = {"symbol": symbol, "side": side, "size": size, "price": price, "sl": sl, "tp": tp,
+                "client_order_id": client_order_id}
+        return self.session.request("POST", "/orders", body=body, timeout=timeout)
+
+    def update_stop_loss(self, order_id, sl, timeout=None):
+        return self.session.request("POST", f"/orders/{order_id}/stop_loss", body={"sl": sl}, timeout=timeout)
+
+    def cancel_order(self, order_id, timeout=None):
+        return self.session.request("DELETE", f"/orders/{order_id}", timeout=timeout)
+
+    def fetch_order(self, order_id=None, client_order_id=None, timeout=None):
+        path, params = (f"/orders/{order_id}", None) if order_id is not None else ("/orders", {"client_order_id": client_order_id})
+        try:
+            return self.session.request("GET", path, params=params, timeout=timeout)
+        except ExchangeError as e:
+            if e.status == 404:
+                return None
+            raise
+
+    def close(self):
+        self.session.close()
+
+class AsyncOrderExecutor:
+    """
+    Gửi lệnh lên sàn bất đồng bộ trên event loop dùng chung:
+    - Tối đa max_concurrency lời gọi client cùng lúc, lệnh độc lập chạy song song (place_many)
+    - Mỗi lệnh có client_order_id cố định qua các lần retry; sau lỗi tạm thời tra lại
+      fetch_order(client_order_id=...) (nếu client hỗ trợ) để không đặt trùng lệnh
+    - Lần gửi create_order quá order_timeout vẫn chạy trên thread (không hủy được): không gửi lại
+      mà chờ nó kết thúc rồi mới quyết định; sàn báo trùng client_order_id -> coi là đã đặt, tra lại lệnh;
+      tra mãi không được thì trả về lệnh tạm status UNCONFIRMED (id = client_order_id) chờ reconcile,
+      không báo lỗi (lệnh đang sống trên sàn)
+    - Retry lỗi tạm thời với exponential backoff + full jitter (asyncio.sleep, không chiếm thread)
+    - Timeout riêng cho từng lần gọi (order_timeout); lời gọi quá hạn vẫn giữ slot max_concurrency
+      tới khi thread thực sự xong
+    - Client bọc RateLimitedClient: token được lấy trên event loop trước khi chiếm slot / thread,
+      thời gian chờ rate limit không tính vào order_timeout
+    """
+    def __init__(self, client, max_concurrency=8, max_retries=3, backoff_base=0.2, backoff_max=5.0,
+                 order_timeout=10.0, logger=None):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.order_timeout = order_timeout
+        self.logger = logger
+        self.loop = event_loop()
+        self._semaphore = None
+
+    @classmethod
+    def from_config(cls, client, cfg, logger=None):
+        """cfg: mục execution trong strategy.yaml."""
+        return cls(client, max_concurrency=cfg.get("max_concurrency", 8), max_retries=cfg.get("max_retries", 3),
+                   backoff_base=cfg.get("backoff_base", 0.2), backoff_max=cfg.get("backoff_max", 5.0),
+                   order_timeout=cfg.get("order_timeout", 10.0), logger=logger)
+
+    def backoff(self, attempt):
+        """Full jitter: ngẫu nhiên trong [0, min(backoff_max, base * 2^attempt)]."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _start(self, label, fn, *args, **kwargs):
+        """
+        Chạy fn trên thread pool, trả về future đang chạy; slot semaphore giữ tới khi thread xong.
+        fn có rate_limit (RateLimitedClient): chờ token trước, thread chỉ còn gọi sàn.
+        """
+        limit = getattr(fn, "rate_limit", None)
+        if limit is not None:
+            limiter, weight, priority = limit
+            await limiter.acquire_async(weight, priority)
+            fn = fn.acquired
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        semaphore = self._semaphore
+        await semaphore.acquire()
+        start = time.perf_counter()
+        future = self.loop.run_in_executor(None, functools.partial(fn, *args, **kwargs))
+
+        def done(_):
+            semaphore.release()
+            METRICS.observe("exchange", time.perf_counter() - start, label)
+        future.add_done_callback(done)
+        return future
+
+    async def _call(self, label, fn, *args, **kwargs):
+        future = await self._start(label, fn, *args, **kwargs)
+        return await asyncio.wait_for(asyncio.shield(future), self.order_timeout)
+
+    async def _send(self, symbol, order):
+        """1 lần create_order. Quá order_timeout: chờ chính lần gửi này kết thúc, không gửi chồng."""
+        future = await self._start(symbol, self.client.create_order, **order)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.order_timeout)
+        except asyncio.TimeoutError:
+            METRICS.inc("order_timeouts")
+            if self.logger:
+                self.logger.warning("Order %s %s exceeded %.1fs, waiting for the in-flight request",
+                                    symbol, order["client_order_id"], self.order_timeout)
+            return await future
+
+    async def _lookup(self, client_order_id, symbol):
+        fetch = getattr(self.client, "fetch_order", None)
+        if fetch is None:
+            return None
+        try:
+            return await self._call(symbol, fetch, client_order_id=client_order_id)
+        except Exception:
+            return None
+
+    async def _place(self, order):
+        order = dict(order)
+        client_order_id = order.setdefault("client_order_id", new_client_order_id())
+        symbol = order.get("symbol", "")
+        error, resend = None, True
+        for attempt in range(self.max_retries + 1):
+            if resend:
+                try:
+                    return await self._send(symbol, order)
+                except Exception as e:
+                    error = e
+                if is_duplicate(error):
+                    resend = False  # Lệnh đã có trên sàn: từ giờ chỉ tra lại, không gửi nữa
+                elif not is_retryable(error):
+                    raise error
+            # Lệnh có thể đã tới sàn dù client báo lỗi
+            existing = await self._lookup(client_order_id, symbol)
+            if existing:
+                return existing
+            if attempt == self.max_retries:
+                break
+            delay = self.backoff(attempt)
+            METRICS.inc("order_retries")
+            if self.logger:
+                self.logger.warning("Order %s %s failed (%r), %s %d in %.2fs", symbol, client_order_id, error,
+                                    "retry" if resend else "lookup", attempt + 1, delay)
+            await asyncio.sleep(delay)
+        if not resend:
+            METRICS.inc("order_unconfirmed")
+            if self.logger:
+                self.logger.error("Order %s %s exists on the exchange but lookup failed (%r), tracking as unconfirmed",
+                                  symbol, client_order_id, error)
+            return {**order, "id": client_order_id, "status": UNCONFIRMED}
+        raise error
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def submit(self, **order):
+        """Đặt 1 lệnh (kwargs của client.create_order), trả về concurrent.futures.Future."""
+        return self._run(self._place(order))
+
+    def place(self, **order):
+        """Đặt 1 lệnh, chờ kết quả (raise lỗi cuối cùng nếu hết retry)."""
+        return self.submit(**order).result()
+
+    def place_many(self, orders):
+        """Đặt nhiều lệnh độc lập song song. Trả về list cùng thứ tự: order dict hoặc Exception."""
+        async def gather():
+            return await asyncio.gather(*(self._place(o) for o in orders), return_exceptions=True)
+        return self._run(gather()).result() if orders else []
+
+    def call(self, fn, *args, label="", **kwargs):
+        """Lời gọi client khác (update_stop_loss, cancel_order...) với timeout, không retry."""
+        return self._run(self._call(label, fn, *args, **kwargs)).result()
+
+    def call_many(self, fn, arg_list, label=""):
+        """Gọi fn(*args) song song cho từng args trong arg_list. Trả về list kết quả hoặc Exception."""
+        async def gather():
+            return await asyncio.gather(*(self._call(label, fn, *args) for args in arg_list), return_exceptions=True)
+        return self._run(gather()).result() if arg_list else []
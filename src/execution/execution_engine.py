@@ -1,72 +1,119 @@
 import time
+from execution.async_executor import UNCONFIRMED, AsyncOrderExecutor, new_client_order_id
+from execution.order_book import OrderBook, level_error, price_levels
+from execution.rate_limiter import RateLimitedClient
+from execution.trailing_monitor import TrailingMonitor
 from utils.config_loader import ConfigLoader
 from utils.log_manager import LogManager
+from utils.metrics import METRICS
 
 class ExecutionEngine:
     """
-    Đặt lệnh, quản lý trạng thái, trailing SL/TP, retry, batch.
+    Đặt lệnh (qua AsyncOrderExecutor), quản lý trạng thái, trailing SL/TP, retry, batch.
     Tích hợp với CapitalManager, RiskController, log mọi hoạt động order.
     """
-    def __init__(self, client, capital_manager, risk_controller, config_dir="config"):
-        self.client = client  # Instance sàn (Binance, Bybit API wrapper)
+    def __init__(self, client, capital_manager, risk_controller, config_dir="config", executor=None, rate_limit=True):
         self.capital_manager = capital_manager
         self.risk_controller = risk_controller
         self.config = ConfigLoader(config_dir)
         self.logger = LogManager.get_logger("order")
-        self.open_orders = []
+        exec_cfg = self.config.get("strategy").get("execution", {})
+        limit_cfg = exec_cfg.get("rate_limit", {})
+        # Mọi lời gọi sàn (đặt lệnh, retry, trailing SL, lệnh tay Discord) đi qua 1 rate limiter
+        if rate_limit and limit_cfg.get("enabled", True):
+            client = RateLimitedClient.from_config(client, limit_cfg)
+            METRICS.register_gauge("ratelimit", client.limiter.stats)
+        self.client = client  # Instance sàn (Binance, Bybit API wrapper)
+        self.executor = executor or AsyncOrderExecutor.from_config(client, exec_cfg, logger=self.logger)
+        self.book = OrderBook()  # order id -> order, vị thế trong CapitalManager dùng cùng id
+        self.trailing = TrailingMonitor()
+        self.unconfirmed = {}  # client_order_id -> order đã có trên sàn nhưng chưa biết id (xem reconcile)
 
     def place_order(self, proposal):
         """
         Đặt lệnh mua/bán theo đề xuất từ Strategy, đã kiểm soát risk/capital.
+        Retry / timeout do AsyncOrderExecutor xử lý (không sleep trên thread gọi).
         """
-        if not self.risk_controller.should_trade():
-            self.logger.warning("Trading in SafeMode, order skipped.")
+        request = self._check(proposal)
+        if request is None:
             return None
+        try:
+            order = self.executor.place(**request)
+        except Exception as e:
+            return self._on_failed(proposal, e)
+        return self._on_placed(order, proposal)
 
+    def _check(self, proposal):
+        """Risk check; trả về kwargs cho client.create_order hoặc None nếu lệnh bị chặn."""
         size = proposal.get("size")
         symbol = proposal["symbol"]
-        side = proposal["side"]
-        sl = proposal.get("sl")
-        tp = proposal.get("tp")
-        trailing = proposal.get("trailing", {})
-        price = proposal.get("entry_price")
-
+        with METRICS.timer("risk", symbol):
+            safe_mode = not self.risk_controller.should_trade()
+            too_large = not safe_mode and not self.risk_controller.check_max_position(size, self.capital_manager.balance)
+        if safe_mode:
+            METRICS.inc("order_rejects", reason="safe_mode")
+            self.logger.warning("Trading in SafeMode, order skipped.")
+            return None
         # Check max position size
-        if not self.risk_controller.check_max_position(size, self.capital_manager.balance):
+        if too_large:
+            METRICS.inc("order_rejects", reason="max_position")
             self.logger.warning(f"Order skipped: size {size} > max allowed.")
             return None
+        # SL/TP của StrategyEngine là % (sl_pct / tp_pct): quy đổi 1 lần ra mức giá theo entry_price
+        side, entry = proposal["side"], proposal.get("entry_price")
+        sl, tp = proposal.get("sl"), proposal.get("tp")
+        if entry:
+            pct_sl, pct_tp = price_levels(side, entry, proposal.get("sl_pct"), proposal.get("tp_pct"))
+            sl = sl if sl is not None else pct_sl
+            tp = tp if tp is not None else pct_tp
+        elif proposal.get("sl_pct") is not None or proposal.get("tp_pct") is not None:
+            METRICS.inc("order_rejects", reason="invalid_levels")
+            self.logger.warning(f"Order skipped: {symbol} SL/TP given in % without entry_price.")
+            return None
+        error = level_error(side, entry, sl, tp)
+        if error:
+            METRICS.inc("order_rejects", reason="invalid_levels")
+            self.logger.warning(f"Order skipped: {symbol} {error}.")
+            return None
+        return {
+            "symbol": symbol,
+            "side": side,
+            "size": size,
+            "price": entry,  # hoặc market nếu None
+            "sl": sl,
+            "tp": tp,
+            "client_order_id": proposal.get("client_order_id") or new_client_order_id(),
+        }
 
-        try:
-            # Thực tế: gọi API client để đặt lệnh
-            order = self.client.create_order(
-                symbol=symbol,
-                side=side,
-                size=size,
-                price=price,  # hoặc market nếu None
-                sl=sl,
-                tp=tp
-            )
-            self.open_orders.append(order)
-            self.logger.info(f"ORDER PLACED: {order}")
-            # Ghi nhận position cho CapitalManager
-            self.capital_manager.add_position(symbol, size, price, side)
-            return order
-        except Exception as e:
-            self.logger.error(f"ORDER FAILED: {symbol} {side} {size}: {e}")
-            # Retry logic: thử lại 1 lần nếu lỗi mạng
-            time.sleep(1)
-            try:
-                order = self.client.create_order(
-                    symbol=symbol, side=side, size=size, price=price, sl=sl, tp=tp
-                )
-                self.open_orders.append(order)
-                self.capital_manager.add_position(symbol, size, price, side)
-                self.logger.info(f"ORDER RETRY SUCCESS: {order}")
-                return order
-            except Exception as e2:
-                self.logger.error(f"ORDER RETRY FAILED: {e2}")
-                self.risk_controller.on_trade_result(-size * 0.01)  # Giả lập loss nhẹ do fail
-                return None
+    def _on_placed(self, order, proposal):
+        self._track(order, proposal)
+        if order["id"] in self.book:
+            self.logger.error(f"Duplicate order id {order['id']} from exchange, replacing tracked order")
+            self.capital_manager.open_positions.pop(order["id"], None)
+        self.book.add(order)
+        self.trailing.add(order)
+        if order.get("status") == UNCONFIRMED:
+            self.unconfirmed[order["client_order_id"]] = order
+        METRICS.inc("orders", result="placed")
+        self.logger.info(f"ORDER PLACED: {order}")
+        # Ghi nhận position cho CapitalManager, liên kết với order qua id
+        self.capital_manager.add_position(proposal["symbol"], proposal.get("size"), proposal.get("entry_price"),
+                                          proposal["side"], position_id=order["id"])
+        return order
+
+    def _on_failed(self, proposal, error):
+        METRICS.inc("orders", result="failed")
+        self.logger.error(f"ORDER FAILED: {proposal['symbol']} {proposal['side']} {proposal.get('size')}: {error!r}")
+        self.risk_controller.on_trade_result(-(proposal.get("size") or 0) * 0.01)  # Giả lập loss nhẹ do fail
+        return None
+
+    @staticmethod
+    def _track(order, proposal):
+        """Bổ sung các field update_trailing cần nếu client không trả về."""
+        for key in ("symbol", "side", "size", "sl", "tp"):
+            order.setdefault(key, proposal.get(key))
+        order.setdefault("entry_price", proposal.get("entry_price"))
+        order.setdefault("trailing", proposal.get("trailing", {}))
 
     def update_trailing(self, order, market_price):
         """
@@ -80,54 +127,151 @@ class ExecutionEngine:
         entry = order["entry_price"]
         side = order["side"]
         sl = order.get("sl")
+        new_sl = None
         # Nếu market vượt trigger, cập nhật SL mới
         if side == "buy" and market_price >= entry * (1 + trigger_pct / 100):
-            new_sl = market_price * (1 - trail_pct / 100)
-            if not sl or new_sl > sl:
-                self.client.update_stop_loss(order["id"], new_sl)
-                order["sl"] = new_sl
-                self.logger.info(f"Trailing SL updated for {order['symbol']}: {new_sl}")
+            candidate = market_price * (1 - trail_pct / 100)
+            if not sl or candidate > sl:
+                new_sl = candidate
         if side == "sell" and market_price <= entry * (1 - trigger_pct / 100):
-            new_sl = market_price * (1 + trail_pct / 100)
-            if not sl or new_sl < sl:
-                self.client.update_stop_loss(order["id"], new_sl)
-                order["sl"] = new_sl
-                self.logger.info(f"Trailing SL updated for {order['symbol']}: {new_sl}")
+            candidate = market_price * (1 + trail_pct / 100)
+            if not sl or candidate < sl:
+                new_sl = candidate
+        if new_sl is not None:
+            self._push_stop_losses([(order, new_sl)])
+
+    def reconcile(self):
+        """
+        Tra lại các lệnh UNCONFIRMED theo client_order_id, đổi id tạm sang id sàn (sổ lệnh, trailing,
+        vị thế CapitalManager). Lệnh chưa tra được giữ lại cho lần sau. Trả về số lệnh đã xác nhận.
+        """
+        fetch = getattr(self.client, "fetch_order", None)
+        if not self.unconfirmed or fetch is None:
+            return 0
+        confirmed = 0
+        for client_order_id, order in list(self.unconfirmed.items()):
+            try:
+                existing = self.executor.call(fetch, client_order_id=client_order_id, label=order["symbol"])
+            except Exception as e:
+                self.logger.warning(f"Reconcile {client_order_id} failed: {e!r}")
+                continue
+            if not existing:
+                continue
+            del self.unconfirmed[client_order_id]
+            if self.book.remove(client_order_id) is None:
+                continue  # Đã đóng trong lúc chờ
+            self.trailing.remove(client_order_id)
+            position = self.capital_manager.open_positions.pop(client_order_id, None)
+            order["id"], order["status"] = existing["id"], existing.get("status")
+            self.book.add(order)
+            self.trailing.add(order)
+            if position is not None:
+                position["id"] = order["id"]
+                self.capital_manager.open_positions[order["id"]] = position
+            confirmed += 1
+            self.logger.info(f"Order {client_order_id} confirmed as {order['id']}")
+        return confirmed
 
     def close_order(self, order_id, exit_price):
         """
         Chốt lệnh, cập nhật PnL, trạng thái.
         """
-        for idx, order in enumerate(self.open_orders):
-            if order["id"] == order_id:
-                pnl = self.capital_manager.close_position(idx, exit_price)
-                self.logger.info(f"ORDER CLOSED: {order_id}, PnL: {pnl:.2f}")
-                # Thông báo RiskController
-                self.risk_controller.on_trade_result(pnl)
-                del self.open_orders[idx]
-                return pnl
-        self.logger.warning(f"Order {order_id} not found for closing.")
-        return None
+        order = self.book.remove(order_id)
+        self.trailing.remove(order_id)
+        if order is None:
+            self.logger.warning(f"Order {order_id} not found for closing.")
+            return None
+        self.unconfirmed.pop(order.get("client_order_id"), None)
+        pnl = self.capital_manager.close_position(order_id, exit_price)
+        if pnl is None:
+            # Order còn trong sổ nhưng vị thế đã đóng (vd đóng tay qua CapitalManager): không tính PnL lần 2
+            return None
+        self.logger.info(f"ORDER CLOSED: {order_id}, PnL: {pnl:.2f}")
+        # Thông báo RiskController
+        self.risk_controller.on_trade_result(pnl)
+        return pnl
+
+    def close_all(self, exit_prices, symbol=None):
+        """
+        Đóng mọi lệnh đang mở (hoặc chỉ của 1 symbol) tại giá thị trường exit_prices {symbol: giá}.
+        Lệnh của symbol không có giá bị bỏ qua (không đoán giá thoát từ TP / giá vào).
+        Trả về (số lệnh đã đóng, list order bị bỏ qua).
+        """
+        orders = self.book.for_symbol(symbol) if symbol else self.book.values()
+        closed, skipped = 0, []
+        for order in orders:
+            price = exit_prices.get(order["symbol"])
+            if not price:
+                skipped.append(order)
+                continue
+            self.close_order(order["id"], price)
+            closed += 1
+        if skipped:
+            self.logger.warning(f"close_all: no market price, skipped {len(skipped)} orders "
+                                f"({', '.join(sorted({o['symbol'] for o in skipped}))})")
+        return closed, skipped
 
     def batch_orders(self, proposals):
         """
-        Đặt nhiều lệnh cùng lúc (batch processing).
+        Đặt nhiều lệnh cùng lúc: risk check tuần tự, gửi lên sàn song song.
+        Trả về list cùng thứ tự proposals (order hoặc None).
         """
-        results = []
-        for proposal in proposals:
-            res = self.place_order(proposal)
-            results.append(res)
+        requests = [self._check(p) for p in proposals]
+        todo = [i for i, r in enumerate(requests) if r is not None]
+        placed = self.executor.place_many([requests[i] for i in todo])
+        results = [None] * len(proposals)
+        for i, order in zip(todo, placed):
+            if isinstance(order, BaseException):
+                results[i] = self._on_failed(proposals[i], order)
+            else:
+                results[i] = self._on_placed(order, proposals[i])
         return results
 
     def monitor_orders(self, market_data):
         """
-        Theo dõi trạng thái lệnh, update trailing SL/TP nếu cần.
+        Theo dõi trạng thái lệnh trên snapshot giá {symbol: price} (1 lượt vector hóa cho mọi lệnh):
+        đóng lệnh chạm SL/TP tại giá snapshot, gom các trailing SL mới thành 1 batch gọi sàn.
+        Trả về list (order, giá, "sl" | "tp") đã đóng.
+        """
+        if self.unconfirmed:
+            self.reconcile()  # id tạm không gọi được update_stop_loss
+        with METRICS.timer("trailing"):
+            hits, updates = self.trailing.evaluate(market_data)
+        if updates:
+            self._push_stop_losses(updates)
+        for order, price, reason in hits:
+            self.logger.info("%s hit for %s %s at %s", reason.upper(), order["symbol"], order["id"], price)
+            self.close_order(order["id"], price)
+        return hits
+
+    def _push_stop_losses(self, updates):
         """
-        for order in list(self.open_orders):
-            symbol = order["symbol"]
-            price = market_data.get(symbol)
-            if price:
-                self.update_trailing(order, price)
+        Gửi SL mới lên sàn (qua executor, có timeout): 1 lời gọi batch nếu client hỗ trợ
+        update_stop_losses, không thì song song. Chỉ lệnh sàn đã nhận mới được ghi SL mới
+        (order + TrailingMonitor); lệnh lỗi giữ SL cũ và được đề xuất lại ở snapshot giá sau.
+        """
+        pairs = [(order["id"], sl) for order, sl in updates]
+        batch = getattr(self.client, "update_stop_losses", None)
+        try:
+            if batch:
+                results = self.executor.call(batch, pairs, label="batch")
+                # Batch trả về kết quả từng lệnh (dict có "error" = lỗi), kiểu khác coi như cả batch OK
+                results = results if isinstance(results, list) and len(results) == len(pairs) else [results] * len(pairs)
+            else:
+                results = self.executor.call_many(self.client.update_stop_loss, pairs, label="stop_loss")
+        except Exception as e:
+            results = [e] * len(pairs)
+        failed = []
+        for (order, sl), result in zip(updates, results):
+            if isinstance(result, BaseException) or (isinstance(result, dict) and result.get("error")):
+                failed.append(result)
+                continue
+            order["sl"] = sl
+            self.trailing.set_sl(order["id"], sl)
+        if failed:
+            METRICS.inc("stop_loss_failures", len(failed))
+            self.logger.error(f"Trailing SL update failed for {len(failed)}/{len(pairs)} orders: {failed[0]!r}")
+        self.logger.debug("Trailing SL updated for %d orders", len(pairs) - len(failed))
 
 # Usage example/test
 if __name__ == "__main__":
@@ -0,0 +1,98 @@
+import threading
+
+# SL/TP cách giá vào quá 50% gần như chắc chắn là % chưa quy đổi (vd sl: 1.8), không phải mức giá
+MAX_LEVEL_DISTANCE = 0.5
+
+def price_levels(side, entry, sl_pct=None, tp_pct=None):
+    """(sl, tp) mức giá từ % so với giá vào (strategy.sl / strategy.tp), None nếu không có %."""
+    sign = 1 if side == "buy" else -1
+    sl = entry * (1 - sign * sl_pct / 100) if sl_pct is not None else None
+    tp = entry * (1 + sign * tp_pct / 100) if tp_pct is not None else None
+    return sl, tp
+
+def level_error(side, entry, sl=None, tp=None):
+    """
+    Lý do SL/TP không phải mức giá dùng được cho lệnh (None nếu hợp lệ): phải dương, đúng phía
+    so với giá vào và trong MAX_LEVEL_DISTANCE. Không tự sửa / bỏ qua, caller từ chối lệnh.
+    """
+    sign = 1 if side == "buy" else -1
+    for name, level, direction in (("sl", sl, -1), ("tp", tp, 1)):
+        if level is None:
+            continue
+        if not entry or entry <= 0:
+            return f"{name} {level} set without an entry price"
+        if level <= 0 or sign * direction * (level - entry) <= 0:
+            return f"{name} {level} is on the wrong side of entry {entry} for a {side}"
+        if abs(level / entry - 1) > MAX_LEVEL_DISTANCE:
+            return f"{name} {level} is too far from entry {entry} (percentage instead of price?)"
+    return None
+
+class OrderBook:
+    """
+    Sổ lệnh đang mở dùng chung (ExecutionEngine, Discord, dashboard):
+    - orders: dict order id -> order (lookup / thêm / đóng O(1))
+    - Index phụ theo symbol và side (dict id giữ thứ tự vào lệnh) để duyệt nhanh theo symbol
+      (trailing, !closeall SYMBOL) mà không copy / quét toàn bộ sổ
+    - Vị thế tương ứng trong CapitalManager dùng cùng id (không dựa vào vị trí trong list)
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.orders = {}
+        self.by_symbol = {}
+        self.by_side = {}
+
+    def add(self, order):
+        """Thêm order (cần field id, symbol, side). Trùng id thì thay order cũ."""
+        order_id = order["id"]
+        with self.lock:
+            if order_id in self.orders:
+                self._unindex(self.orders[order_id])
+            self.orders[order_id] = order
+            self.by_symbol.setdefault(order["symbol"], {})[order_id] = order
+            self.by_side.setdefault(order["side"], {})[order_id] = order
+        return order
+
+    def _unindex(self, order):
+        for index, key in ((self.by_symbol, order["symbol"]), (self.by_side, order["side"])):
+            bucket = index.get(key)
+            if bucket is not None:
+                bucket.pop(order["id"], None)
+                if not bucket:
+                    del index[key]
+
+    def remove(self, order_id):
+        """Bỏ order khỏi sổ, trả về order (None nếu không có)."""
+        with self.lock:
+            order = self.orders.pop(order_id, None)
+            if order is not None:
+                self._unindex(order)
+            return order
+
+    def get(self, order_id):
+        return self.orders.get(order_id)
+
+    def for_symbol(self, symbol):
+        """Các order đang mở của symbol (list mới, an toàn khi đóng lệnh trong lúc duyệt)."""
+        with self.lock:
+            return list(self.by_symbol.get(symbol, {}).values())
+
+    def for_side(self, side):
+        with self.lock:
+            return list(self.by_side.get(side, {}).values())
+
+    def symbols(self):
+        with self.lock:
+            return list(self.by_symbol)
+
+    def values(self):
+        with self.lock:
+            return list(self.orders.values())
+
+    def __contains__(self, order_id):
+        return order_id in self.orders
+
+    def __len__(self):
+        return len(self.orders)
+
+    def __iter__(self):
+        return iter(self.values())
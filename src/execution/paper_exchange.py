@@ -0,0 +1,300 @@
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from execution.async_executor import ExchangeError
+from execution.order_book import level_error
+
+class PaperExchange:
+    """
+    Sàn giả lập local (paper trading) theo interface client ExecutionEngine dùng:
+    create_order / update_stop_loss / update_stop_losses / cancel_order / fetch_order.
+    - Giá thị trường lấy từ nến DataPipeline qua feed(symbol, candle); chưa có nến thì dùng giá lệnh
+    - Lệnh khớp ngay tại giá tham chiếu + trượt giá (slippage_bps), có thể khớp 1 phần
+      (phần còn lại khớp dần ở các nến sau); SL/TP khớp khi high/low của nến chạm tới
+    - Latency (latency_ms ± jitter_ms) và lỗi giả lập: 5xx (error_rate), 429 (throttle_rate),
+      mất phản hồi sau khi lệnh đã vào sổ (ack_loss_rate, để kiểm tra retry idempotent);
+      gửi lại client_order_id đã có -> 409 (code -4116)
+    - Lệnh đóng bởi SL/TP trả về từ feed(): caller phải báo lại ExecutionEngine.close_order
+    - serve() chạy HTTP stand-in cùng route với HttpExchangeClient
+    """
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, slippage_bps=2.0, fee_bps=4.0, partial_fill_rate=0.0,
+                 min_fill_ratio=0.3, error_rate=0.0, throttle_rate=0.0, ack_loss_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.slippage_bps = slippage_bps
+        self.fee_bps = fee_bps
+        self.partial_fill_rate = partial_fill_rate
+        self.min_fill_ratio = min_fill_ratio
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.ack_loss_rate = ack_loss_rate
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+        self.ids = itertools.count(1)
+        self.orders = {}
+        self.by_client_id = {}
+        self.prices = {}
+        self.counts = {"calls": 0, "orders": 0, "errors": 0, "throttled": 0, "ack_lost": 0, "closed": 0}
+
+    @classmethod
+    def from_config(cls, cfg, seed=None):
+        """cfg: mục paper_exchange trong strategy.yaml."""
+        keys = ("latency_ms", "jitter_ms", "slippage_bps", "fee_bps", "partial_fill_rate", "min_fill_ratio",
+                "error_rate", "throttle_rate", "ack_loss_rate")
+        return cls(seed=seed, **{k: cfg[k] for k in keys if k in cfg})
+
+    # ---- giả lập mạng / lỗi ----
+    def _network(self, method):
+        """Latency + lỗi ngẫu nhiên trước khi request tới sổ lệnh."""
+        delay = self.latency_ms + (self.random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        with self.lock:
+            self.counts["calls"] += 1
+            roll = self.random.random()
+            if roll < self.throttle_rate:
+                self.counts["throttled"] += 1
+                raise ExchangeError(f"HTTP 429 {method}: too many requests", 429, {"msg": "too many requests", "retry_after": 1.0})
+            if roll < self.throttle_rate + self.error_rate:
+                self.counts["errors"] += 1
+                raise ExchangeError(f"HTTP 503 {method}: service unavailable", 503, {"msg": "service unavailable"})
+
+    def _ack_lost(self, method):
+        with self.lock:
+            lost = self.random.random() < self.ack_loss_rate
+            if lost:
+                self.counts["ack_lost"] += 1
+        if lost:
+            raise ExchangeError(f"HTTP 504 {method}: gateway timeout", 504, {"msg": "gateway timeout"})
+
+    # ---- khớp lệnh ----
+    def _fill_price(self, side, price):
+        slip = self.slippage_bps * self.random.uniform(0.5, 1.5) / 10000
+        return price * (1 + slip) if side == "buy" else price * (1 - slip)
+
+    def _fill(self, order, qty, price):
+        """Khớp thêm qty tại price: cập nhật giá khớp trung bình, phí, trạng thái."""
+        px = self._fill_price(order["side"], price)
+        filled = order["filled"] + qty
+        order["avg_price"] = (order["avg_price"] * order["filled"] + px * qty) / filled
+        order["filled"] = filled
+        order["fee"] += px * qty * self.fee_bps / 10000
+        order["status"] = "filled" if filled >= order["size"] else "partially_filled"
+
+    def create_order(self, symbol, side, size, price=None, sl=None, tp=None, client_order_id=None, timeout=None, **_):
+        self._network("POST /orders")
+        with self.lock:
+            if client_order_id and client_order_id in self.by_client_id:
+                # Trùng client_order_id: từ chối như sàn thật (Binance -4116), lệnh cũ giữ nguyên
+                raise ExchangeError(f"HTTP 409 POST /orders: duplicate client_order_id {client_order_id}", 409,
+                                    {"msg": "duplicate client_order_id", "code": -4116})
+            ref = self.prices.get(symbol) or price
+            if not ref:
+                raise ExchangeError(f"HTTP 400 POST /orders: no market price for {symbol}", 400, {"msg": "no market price"})
+            if side not in ("buy", "sell") or not size or size <= 0:
+                raise ExchangeError(f"HTTP 400 POST /orders: invalid order {side} {size}", 400, {"msg": "invalid order"})
+            error = level_error(side, ref, sl, tp)
+            if error:
+                # Như sàn thật (Binance -2021): SL/TP sai phía giá hiện tại bị từ chối, không bỏ qua
+                raise ExchangeError(f"HTTP 400 POST /orders: {error}", 400, {"msg": error, "code": -2021})
+            order = {"id": next(self.ids), "client_order_id": client_order_id, "symbol": symbol, "side": side,
+                     "size": size, "price": price, "filled": 0.0, "avg_price": 0.0, "fee": 0.0, "status": "new",
+                     "sl": sl, "tp": tp,
+                     "exit_price": None, "exit_reason": None, "created_at": time.time()}
+            partial = self.random.random() < self.partial_fill_rate
+            self._fill(order, size * self.random.uniform(self.min_fill_ratio, 1.0) if partial else size, ref)
+            self.orders[order["id"]] = order
+            if client_order_id:
+                self.by_client_id[client_order_id] = order["id"]
+            self.counts["orders"] += 1
+            result = dict(order)
+        self._ack_lost("POST /orders")
+        return result
+
+    def _get(self, order_id, method):
+        order = self.orders.get(order_id)
+        if order is None:
+            raise ExchangeError(f"HTTP 404 {method}: order {order_id} not found", 404, {"msg": "order not found"})
+        return order
+
+    def update_stop_loss(self, order_id, sl, timeout=None):
+        self._network("POST /orders/{id}/stop_loss")
+        with self.lock:
+            order = self._get(order_id, "POST /orders/{id}/stop_loss")
+            if order["status"] in ("closed", "canceled"):
+                raise ExchangeError(f"HTTP 400 stop_loss: order {order_id} is {order['status']}", 400, {"msg": "order not open"})
+            order["sl"] = sl
+            return dict(order)
+
+    def update_stop_losses(self, pairs, timeout=None):
+        """Batch: 1 lời gọi cho nhiều (order_id, sl). Lệnh lỗi trả về dict có field error."""
+        self._network("POST /orders/stop_loss")
+        results = []
+        with self.lock:
+            for order_id, sl in pairs:
+                order = self.orders.get(order_id)
+                if order is None or order["status"] in ("closed", "canceled"):
+                    results.append({"id": order_id, "error": "order not open"})
+                else:
+                    order["sl"] = sl
+                    results.append({"id": order_id, "sl": sl})
+        return results
+
+    def cancel_order(self, order_id, timeout=None):
+        """Hủy phần chưa khớp và SL/TP. Chưa khớp gì -> canceled, đã khớp 1 phần -> giữ vị thế bằng phần đã khớp."""
+        self._network("DELETE /orders/{id}")
+        with self.lock:
+            order = self._get(order_id, "DELETE /orders/{id}")
+            if order["status"] in ("new", "partially_filled"):
+                order["size"] = order["filled"]
+                order["status"] = "canceled" if not order["filled"] else "filled"
+            order["sl"] = order["tp"] = None
+            return dict(order)
+
+    def fetch_order(self, order_id=None, client_order_id=None, timeout=None):
+        self._network("GET /orders")
+        with self.lock:
+            if order_id is None:
+                order_id = self.by_client_id.get(client_order_id)
+            order = self.orders.get(order_id)
+            return dict(order) if order else None
+
+    def feed(self, symbol, candle):
+        """
+        Nến mới từ DataPipeline: cập nhật giá, khớp tiếp phần còn lại của lệnh khớp 1 phần (tại open),
+        đóng vị thế chạm SL (ưu tiên) / TP trong high-low. Trả về list lệnh vừa đóng.
+        """
+        closed = []
+        with self.lock:
+            self.prices[symbol] = candle["close"]
+            for order in self.orders.values():
+                if order["symbol"] != symbol or order["status"] in ("closed", "canceled"):
+                    continue
+                if order["status"] == "partially_filled":
+                    self._fill(order, order["size"] - order["filled"], candle["open"])
+                sign = 1 if order["side"] == "buy" else -1
+                worst, best = (candle["low"], candle["high"]) if sign > 0 else (candle["high"], candle["low"])
+                sl, tp = order["sl"], order["tp"]
+                if sl and sign * (worst - sl) <= 0:
+                    order["exit_price"], order["exit_reason"] = sl, "sl"
+                elif tp and sign * (best - tp) >= 0:
+                    order["exit_price"], order["exit_reason"] = tp, "tp"
+                else:
+                    continue
+                order["status"] = "closed"
+                self.counts["closed"] += 1
+                closed.append(dict(order))
+        return closed
+
+    def stats(self):
+        with self.lock:
+            open_orders = sum(o["status"] in ("new", "partially_filled", "filled") for o in self.orders.values())
+            return {**self.counts, "open": open_orders}
+
+    # ---- HTTP stand-in ----
+    def serve(self, host="127.0.0.1", port=0):
+        """Chạy HTTP server nền (port=0 -> chọn port trống). Trả về server (server.server_port, shutdown())."""
+        handler = type("Handler", (PaperExchangeHandler,), {"exchange": self})
+        server = ThreadingHTTPServer((host, port), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="paper-exchange", daemon=True).start()
+        return server
+
+class PaperExchangeHandler(BaseHTTPRequestHandler):
+    """
+    Route giống HttpExchangeClient: POST /orders, POST /orders/{id}/stop_loss, DELETE /orders/{id},
+    GET /orders/{id}, GET /orders?client_order_id=... ExchangeError -> HTTP status + {"msg": ...}.
+    """
+    exchange = None
+    protocol_version = "HTTP/1.1"  # keep-alive cho pool kết nối của HttpSession
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def _handle(self, fn):
+        try:
+            result = fn()
+        except ExchangeError as e:
+            self._reply(e.status or 500, e.payload or {"msg": str(e)})
+        except (KeyError, TypeError, ValueError) as e:
+            self._reply(400, {"msg": f"bad request: {e!r}"})
+        else:
+            if result is None:
+                self._reply(404, {"msg": "order not found"})
+            else:
+                self._reply(200, result)
+
+    def _parts(self):
+        url = urlsplit(self.path)
+        return [p for p in url.path.split("/") if p], parse_qs(url.query)
+
+    @staticmethod
+    def _order_id(raw):
+        return int(raw) if raw.isdigit() else raw
+
+    def do_POST(self):
+        parts, _ = self._parts()
+        body = self._body()
+        if parts == ["orders"]:
+            self._handle(lambda: self.exchange.create_order(**body))
+        elif len(parts) == 3 and parts[0] == "orders" and parts[2] == "stop_loss":
+            self._handle(lambda: self.exchange.update_stop_loss(self._order_id(parts[1]), body["sl"]))
+        else:
+            self._reply(404, {"msg": "not found"})
+
+    def do_DELETE(self):
+        parts, _ = self._parts()
+        if len(parts) == 2 and parts[0] == "orders":
+            self._handle(lambda: self.exchange.cancel_order(self._order_id(parts[1])))
+        else:
+            self._reply(404, {"msg": "not found"})
+
+    def do_GET(self):
+        parts, query = self._parts()
+        if len(parts) == 2 and parts[0] == "orders":
+            self._handle(lambda: self.exchange.fetch_order(order_id=self._order_id(parts[1])))
+        elif parts == ["orders"] and "client_order_id" in query:
+            self._handle(lambda: self.exchange.fetch_order(client_order_id=query["client_order_id"][0]))
+        else:
+            self._reply(404, {"msg": "not found"})
+
+    def log_message(self, format, *args):
+        pass
+
+# Benchmark: ExecutionEngine -> HttpExchangeClient -> PaperExchange (HTTP local), không cần mạng
+if __name__ == "__main__":
+    import sys
+    from execution.async_executor import HttpExchangeClient
+    from execution.execution_engine import ExecutionEngine
+    from capital.capital_manager import CapitalManager
+    from risk.risk_controller import RiskController
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    exchange = PaperExchange(latency_ms=20, jitter_ms=10, partial_fill_rate=0.2, error_rate=0.05, ack_loss_rate=0.02, seed=1)
+    server = exchange.serve()
+    client = HttpExchangeClient(f"http://127.0.0.1:{server.server_port}")
+    symbols = [f"S{i}USDT" for i in range(20)]
+    for s in symbols:
+        exchange.feed(s, {"open": 100.0, "high": 101.0, "low": 99.0, "close": 100.0})
+    ee = ExecutionEngine(client, CapitalManager(), RiskController(), rate_limit=False)
+    proposals = [{"symbol": symbols[i % len(symbols)], "side": "buy" if i % 2 else "sell", "size": 1,
+                  "entry_price": 100.0} for i in range(n)]
+    start = time.perf_counter()
+    placed = ee.batch_orders(proposals)
+    elapsed = time.perf_counter() - start
+    ok = sum(o is not None for o in placed)
+    print(f"{ok}/{n} orders in {elapsed:.2f}s ({ok / elapsed:.0f} orders/s)", exchange.stats())
+    server.shutdown()
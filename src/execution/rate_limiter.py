@@ -0,0 +1,158 @@
+import asyncio
+import functools
+import threading
+import time
+from execution.async_executor import ExchangeError
+from utils.metrics import METRICS
+
+HIGH, NORMAL = "high", "normal"
+
+class RateLimiter:
+    """
+    Token bucket có trọng số dùng chung cho mọi lời gọi API sàn:
+    - rate token/giây (vd: request weight 1200/phút -> 20/s), tối đa burst token
+    - acquire() chờ (không báo lỗi) tới khi đủ token; lane HIGH (SL / cancel) được cấp trước,
+      lane NORMAL chỉ lấy token khi không còn lời gọi HIGH đang chờ
+    - acquire_async(): như acquire nhưng chờ trên event loop (AsyncOrderExecutor lấy token
+      trước khi chiếm thread / tính order_timeout)
+    - penalize(): khi sàn trả 429/418 thì xả hết token và tạm dừng theo Retry-After
+    - Thời gian chờ ghi vào metrics (stage ratelimit_wait, label = lane)
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.cond = threading.Condition()
+        self.waiting = {HIGH: 0, NORMAL: 0}
+        self.penalties = 0
+
+    @classmethod
+    def from_config(cls, cfg):
+        """cfg: mục execution.rate_limit trong strategy.yaml."""
+        return cls(cfg.get("weight_per_minute", 1200) / 60.0, cfg.get("burst", 100))
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def _try_take(self, weight, priority):
+        """
+        Gọi khi đang giữ cond. Trả về (True, 0) nếu đã lấy token, không thì (False, số giây nên chờ;
+        None = chờ lane HIGH xong).
+        """
+        now = time.monotonic()
+        self._refill(now)
+        lane_free = priority == HIGH or not self.waiting[HIGH]
+        if now >= self.blocked_until and lane_free and self.tokens >= weight:
+            self.tokens -= weight
+            return True, 0.0
+        if now < self.blocked_until:
+            return False, self.blocked_until - now
+        if self.tokens < weight:
+            return False, (weight - self.tokens) / self.rate
+        return False, None
+
+    def _done(self, priority, start):
+        with self.cond:
+            self.waiting[priority] -= 1
+            self.cond.notify_all()
+        waited = time.monotonic() - start
+        METRICS.observe("ratelimit_wait", waited, priority)
+        return waited
+
+    def acquire(self, weight=1, priority=NORMAL):
+        """Chờ đủ `weight` token (weight > burst bị giới hạn về burst). Trả về số giây đã chờ."""
+        weight = min(float(weight), self.burst)
+        start = time.monotonic()
+        with self.cond:
+            self.waiting[priority] += 1
+        try:
+            with self.cond:
+                while True:
+                    taken, delay = self._try_take(weight, priority)
+                    if taken:
+                        break
+                    self.cond.wait(delay)
+        finally:
+            waited = self._done(priority, start)
+        return waited
+
+    async def acquire_async(self, weight=1, priority=NORMAL):
+        """acquire() không chặn thread: chờ bằng asyncio.sleep trên event loop."""
+        weight = min(float(weight), self.burst)
+        start = time.monotonic()
+        with self.cond:
+            self.waiting[priority] += 1
+        try:
+            while True:
+                with self.cond:
+                    taken, delay = self._try_take(weight, priority)
+                if taken:
+                    break
+                # Không nhận được notify trên event loop: chờ lane HIGH bằng polling ngắn
+                await asyncio.sleep(0.005 if delay is None else delay)
+        finally:
+            waited = self._done(priority, start)
+        return waited
+
+    def penalize(self, seconds=1.0):
+        """Sàn báo vượt giới hạn: xả token, không cấp token mới trong `seconds` giây."""
+        with self.cond:
+            now = time.monotonic()
+            self.tokens = 0.0
+            self.updated = max(self.updated, now + seconds)
+            self.blocked_until = max(self.blocked_until, now + seconds)
+            self.penalties += 1
+            self.cond.notify_all()
+        METRICS.inc("ratelimit_penalties")
+
+    def stats(self):
+        with self.cond:
+            self._refill(time.monotonic())
+            return {"tokens": round(self.tokens, 2), "waiting_high": self.waiting[HIGH],
+                    "waiting_normal": self.waiting[NORMAL], "penalties": self.penalties}
+
+class RateLimitedClient:
+    """
+    Bọc client sàn: mọi method đi qua RateLimiter theo weights / lane của endpoint.
+    Method bọc có thêm rate_limit = (limiter, weight, lane) và acquired (gọi sàn, bỏ qua bước
+    lấy token) để AsyncOrderExecutor lấy token trên event loop trước khi tính timeout.
+    Lỗi 429/418 từ sàn -> penalize limiter (theo Retry-After nếu có) rồi raise lại cho executor retry.
+    """
+    def __init__(self, client, limiter, weights=None, high_priority=()):
+        self.client = client
+        self.limiter = limiter
+        self.weights = dict(weights or {})
+        self.high_priority = set(high_priority)
+
+    @classmethod
+    def from_config(cls, client, cfg):
+        return cls(client, RateLimiter.from_config(cfg), cfg.get("weights", {}), cfg.get("high_priority", ()))
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if not callable(attr):
+            return attr
+        weight = self.weights.get(name, 1)
+        priority = HIGH if name in self.high_priority else NORMAL
+
+        @functools.wraps(attr)
+        def acquired(*args, **kwargs):
+            try:
+                return attr(*args, **kwargs)
+            except ExchangeError as e:
+                if e.status in (418, 429):
+                    retry_after = (e.payload or {}).get("retry_after", 1.0) if isinstance(e.payload, dict) else 1.0
+                    self.limiter.penalize(float(retry_after))
+                raise
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            self.limiter.acquire(weight, priority)
+            return acquired(*args, **kwargs)
+        call.rate_limit = (self.limiter, weight, priority)
+        call.acquired = acquired
+        return call
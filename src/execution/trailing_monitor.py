@@ -0,0 +1,134 @@
+import threading
+import numpy as np
+from execution.order_book import level_error
+
+BUY, SELL = 1, -1
+
+class TrailingMonitor:
+    """
+    Trailing SL và phát hiện chạm SL/TP cho mọi lệnh đang mở bằng 1 lượt vector hóa / snapshot giá:
+    - Mỗi lệnh là 1 hàng trong các mảng entry / side / sl / tp / trigger / trail (mảng dày,
+      xóa lệnh bằng cách chuyển hàng cuối vào chỗ trống -> O(1))
+    - evaluate(prices) trả về (lệnh chạm SL/TP, SL mới cần đẩy lên sàn); SL mới chỉ được ghi
+      (set_sl) sau khi sàn nhận, lần gửi lỗi sẽ được đề xuất lại ở snapshot sau
+    - Cùng công thức với ExecutionEngine.update_trailing (trigger_pct / trail_pct tính theo %)
+    """
+    FIELDS = ("entry", "side", "sl", "tp", "trigger", "trail", "enabled", "code")
+
+    def __init__(self, capacity=256):
+        self.lock = threading.Lock()
+        self.n = 0
+        self.ids = []
+        self.orders = []
+        self.slots = {}
+        self.codes = {}
+        self._alloc(capacity)
+
+    def _alloc(self, capacity):
+        old = {f: getattr(self, f, None) for f in self.FIELDS}
+        self.entry = np.zeros(capacity)
+        self.side = np.zeros(capacity, dtype=np.int8)
+        self.sl = np.full(capacity, np.nan)
+        self.tp = np.full(capacity, np.nan)
+        self.trigger = np.zeros(capacity)
+        self.trail = np.zeros(capacity)
+        self.enabled = np.zeros(capacity, dtype=bool)
+        self.code = np.zeros(capacity, dtype=np.int64)
+        for field, values in old.items():
+            if values is not None:
+                getattr(self, field)[:self.n] = values[:self.n]
+
+    def _code(self, symbol):
+        code = self.codes.get(symbol)
+        if code is None:
+            code = self.codes[symbol] = len(self.codes)
+        return code
+
+    def add(self, order):
+        """
+        Theo dõi order (field id, symbol, side, entry_price, sl, tp, trailing).
+        sl / tp phải là mức giá (xem order_book.level_error), không thì ValueError.
+        """
+        trailing = order.get("trailing") or {}
+        entry, sl, tp = order["entry_price"], order.get("sl"), order.get("tp")
+        error = level_error(order["side"], entry, sl, tp)
+        if error:
+            raise ValueError(f"Order {order['id']}: {error}")
+        with self.lock:
+            if order["id"] in self.slots:
+                self._remove(order["id"])
+            if self.n == len(self.entry):
+                self._alloc(2 * len(self.entry))
+            i = self.n
+            self.entry[i] = entry
+            self.side[i] = BUY if order["side"] == "buy" else SELL
+            self.sl[i] = sl if sl is not None else np.nan
+            self.tp[i] = tp if tp is not None else np.nan
+            self.trigger[i] = trailing.get("trigger_pct", 1.5) / 100
+            self.trail[i] = trailing.get("trail_pct", 0.4) / 100
+            self.enabled[i] = trailing.get("enabled", False)
+            self.code[i] = self._code(order["symbol"])
+            self.ids.append(order["id"])
+            self.orders.append(order)
+            self.slots[order["id"]] = i
+            self.n += 1
+
+    def _remove(self, order_id):
+        i = self.slots.pop(order_id, None)
+        if i is None:
+            return False
+        last = self.n - 1
+        if i != last:
+            for field in self.FIELDS:
+                values = getattr(self, field)
+                values[i] = values[last]
+            self.ids[i], self.orders[i] = self.ids[last], self.orders[last]
+            self.slots[self.ids[i]] = i
+        self.ids.pop()
+        self.orders.pop()
+        self.n = last
+        return True
+
+    def remove(self, order_id):
+        with self.lock:
+            return self._remove(order_id)
+
+    def set_sl(self, order_id, sl):
+        """Ghi SL sàn đã nhận (trailing push, update_trailing, lệnh tay)."""
+        with self.lock:
+            i = self.slots.get(order_id)
+            if i is not None:
+                self.sl[i] = sl if sl else np.nan
+
+    def __len__(self):
+        return self.n
+
+    def evaluate(self, prices):
+        """
+        prices: {symbol: giá}. Trả về (hits, updates):
+        hits = [(order, giá, "sl" | "tp")] lệnh đã chạm SL/TP (cần đóng),
+        updates = [(order, sl mới)] các lệnh cần kéo trailing SL (chưa ghi, chờ sàn xác nhận).
+        """
+        with self.lock:
+            n = self.n
+            if not n:
+                return [], []
+            px_by_code = np.full(len(self.codes), np.nan)
+            for symbol, price in prices.items():
+                code = self.codes.get(symbol)
+                if code is not None and price:
+                    px_by_code[code] = price
+            px = px_by_code[self.code[:n]]
+            side, entry, sl, tp = self.side[:n], self.entry[:n], self.sl[:n], self.tp[:n]
+            # Lợi nhuận theo chiều lệnh: > 0 là giá đi đúng hướng
+            move = side * (px - entry)
+            with np.errstate(invalid="ignore"):
+                hit_sl = side * (px - sl) <= 0
+                hit_tp = side * (px - tp) >= 0
+                hit = hit_sl | hit_tp
+                new_sl = px * (1 - side * self.trail[:n])
+                improve = (self.enabled[:n] & ~hit & (move >= entry * self.trigger[:n])
+                           & (np.isnan(sl) | (side * (new_sl - sl) > 0)))
+            hits = [(self.orders[i], float(px[i]), "sl" if hit_sl[i] else "tp") for i in np.flatnonzero(hit)]
+            updates = [(self.orders[i], float(new_sl[i])) for i in np.flatnonzero(improve)]
+            return hits, updates
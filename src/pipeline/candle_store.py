@@ -0,0 +1,189 @@
+import os
+import threading
+from typing import Dict, Optional
+import numpy as np
+
+# Record cố định 56 bytes: timestamp (epoch ms) + OHLCV + quote_volume
+RECORD_DTYPE = np.dtype([
+    ("timestamp", "<i8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<f8"),
+    ("quote_volume", "<f8"),
+])
+
+class CandleStore:
+    """
+    Lưu lịch sử nến xuống đĩa, append-only, 1 file binary/symbol/timeframe
+    (record cố định RECORD_DTYPE), đọc lại bằng NumPy memmap.
+    - Range query theo timestamp O(log n) (searchsorted trên cột timestamp đã sort)
+    - tail(n) cho warm-up CandleBuffer / load data train
+    - compact() sort + bỏ record trùng timestamp (giữ bản ghi mới nhất), ghi atomic
+    """
+    def __init__(self, root="data/candles"):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+        self.lock = threading.Lock()
+        self._files = {}
+        self._last_ts: Dict[str, int] = {}
+        self._maps = {}
+
+    def _key(self, symbol, timeframe):
+        return f"{symbol}_{timeframe}"
+
+    def path(self, symbol, timeframe):
+        return os.path.join(self.root, f"{self._key(symbol, timeframe)}.bin")
+
+    def symbols(self, timeframe):
+        """Các symbol đã có file lịch sử cho timeframe."""
+        suffix = f"_{timeframe}.bin"
+        return sorted(name[:-len(suffix)] for name in os.listdir(self.root) if name.endswith(suffix))
+
+    def _file(self, key, path):
+        f = self._files.get(key)
+        if f is None:
+            f = open(path, "ab")
+            self._files[key] = f
+        return f
+
+    def _last_timestamp(self, key, path):
+        if key not in self._last_ts:
+            data = self._map(path)
+            self._last_ts[key] = int(data["timestamp"][-1]) if len(data) else None
+        return self._last_ts[key]
+
+    def append(self, symbol, timeframe, timestamp, candle: dict):
+        """
+        Ghi 1 nến. Nến cũ hơn nến cuối cùng sẽ bị bỏ qua (dùng append_many + compact để backfill);
+        nến trùng timestamp (nến đang chạy) được ghi thêm, bản mới nhất thắng khi đọc.
+        """
+        record = np.zeros(1, dtype=RECORD_DTYPE)
+        record["timestamp"] = timestamp
+        for name in RECORD_DTYPE.names[1:]:
+            value = candle.get(name)
+            record[name] = np.nan if value is None else value
+        key, path = self._key(symbol, timeframe), self.path(symbol, timeframe)
+        with self.lock:
+            last = self._last_timestamp(key, path)
+            if last is not None and timestamp < last:
+                return False
+            f = self._file(key, path)
+            f.write(record.tobytes())
+            f.flush()
+            self._last_ts[key] = int(timestamp)
+        return True
+
+    def append_many(self, symbol, timeframe, records: np.ndarray, compact=True):
+        """Ghi bulk (structured array RECORD_DTYPE), mặc định compact lại để giữ thứ tự timestamp."""
+        records = np.asarray(records, dtype=RECORD_DTYPE)
+        key, path = self._key(symbol, timeframe), self.path(symbol, timeframe)
+        with self.lock:
+            f = self._file(key, path)
+            f.write(records.tobytes())
+            f.flush()
+            self._last_ts.pop(key, None)
+        if compact:
+            self.compact(symbol, timeframe)
+
+    def _map(self, path):
+        """Memmap read-only của file (tái sử dụng nếu kích thước file chưa đổi)."""
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        n = size // RECORD_DTYPE.itemsize
+        if n == 0:
+            return np.zeros(0, dtype=RECORD_DTYPE)
+        cached = self._maps.get(path)
+        if cached is not None and len(cached) == n:
+            return cached
+        data = np.memmap(path, dtype=RECORD_DTYPE, mode="r", shape=(n,))
+        self._maps[path] = data
+        return data
+
+    @staticmethod
+    def _dedupe(data):
+        """Giữ bản ghi cuối cùng cho mỗi timestamp (data đã sort theo timestamp)."""
+        if len(data) < 2:
+            return data
+        ts = data["timestamp"]
+        keep = np.empty(len(ts), dtype=bool)
+        keep[:-1] = ts[1:] != ts[:-1]
+        keep[-1] = True
+        return data if keep.all() else data[keep]
+
+    def load(self, symbol, timeframe):
+        """Toàn bộ lịch sử (memmap, không copy)."""
+        with self.lock:
+            return self._map(self.path(symbol, timeframe))
+
+    def range(self, symbol, timeframe, start: Optional[int] = None, end: Optional[int] = None):
+        """Các nến có start <= timestamp < end (epoch ms). O(log n) + kích thước kết quả."""
+        data = self.load(symbol, timeframe)
+        ts = data["timestamp"]
+        lo = 0 if start is None else int(np.searchsorted(ts, start, side="left"))
+        hi = len(ts) if end is None else int(np.searchsorted(ts, end, side="left"))
+        return self._dedupe(data[lo:hi])
+
+    def tail(self, symbol, timeframe, n: int):
+        """n nến cuối cùng (đã bỏ record trùng timestamp)."""
+        data = self.load(symbol, timeframe)
+        if not n:
+            return data[:0]
+        # Nới cửa sổ đọc tới khi đủ n nến sau dedupe (record trùng chưa compact) hoặc hết file
+        window = n
+        while True:
+            rows = self._dedupe(data[-window:])
+            if len(rows) >= n or window >= len(data):
+                return rows[-n:]
+            window = min(len(data), 2 * window + n - len(rows))
+
+    def count(self, symbol, timeframe):
+        return len(self.load(symbol, timeframe))
+
+    def has_duplicates(self, symbol, timeframe):
+        """True nếu file có record trùng hoặc lệch thứ tự timestamp (cần compact)."""
+        ts = self.load(symbol, timeframe)["timestamp"]
+        return len(ts) > 1 and bool(np.any(ts[1:] <= ts[:-1]))
+
+    def compact(self, symbol, timeframe):
+        """Sort theo timestamp, bỏ record trùng, ghi đè file atomic (tmp + os.replace)."""
+        key, path = self._key(symbol, timeframe), self.path(symbol, timeframe)
+        with self.lock:
+            f = self._files.pop(key, None)
+            if f is not None:
+                f.close()
+            data = self._map(path)
+            if not len(data):
+                return 0
+            order = np.argsort(data["timestamp"], kind="stable")
+            compacted = self._dedupe(np.array(data[order]))
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as out:
+                out.write(compacted.tobytes())
+                out.flush()
+                os.fsync(out.fileno())
+            self._maps.pop(path, None)
+            del data
+            os.replace(tmp, path)
+            self._last_ts[key] = int(compacted["timestamp"][-1])
+            return len(compacted)
+
+    def close(self):
+        with self.lock:
+            for f in self._files.values():
+                f.close()
+            self._files.clear()
+            self._maps.clear()
+
+# Usage example/test
+if __name__ == "__main__":
+    import tempfile
+    import time
+    store = CandleStore(tempfile.mkdtemp())
+    now = int(time.time() * 1000)
+    for i in range(1000):
+        store.append("BTCUSDT", "1h", now + i * 3600_000, {"open": 1, "high": 2, "low": 0.5, "close": 1.5, "volume": 10})
+    t0 = time.perf_counter()
+    rows = store.range("BTCUSDT", "1h", now + 100 * 3600_000, now + 200 * 3600_000)
+    print(len(rows), "rows in", f"{(time.perf_counter() - t0) * 1000:.3f} ms")
+    print(store.tail("BTCUSDT", "1h", 3))
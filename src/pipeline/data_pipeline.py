@@ -1,34 +1,169 @@
 import threading
-from collections import deque
-from datetime import datetime
-from typing import Dict, Deque, Any
-from src.utils.config_loader import ConfigLoader
-from src.utils.log_manager import LogManager
+from collections.abc import Sequence
+from datetime import datetime, timezone
+from typing import Dict, Optional
+import numpy as np
+from pipeline.candle_store import CandleStore
+from pipeline.dispatcher import CandleDispatcher
+from pipeline.indicators import IndicatorState
+from pipeline.resampler import Resampler
+from utils.config_loader import ConfigLoader
+from utils.log_manager import LogManager
+from utils.metrics import METRICS
+
+CANDLE_FIELDS = ("open", "high", "low", "close", "volume", "quote_volume")
+
+def to_epoch_ms(ts) -> int:
+    """
+    Chuẩn hóa timestamp nến về epoch milliseconds (int64).
+    Nhận int/float (ms), datetime hoặc chuỗi ISO; None -> thời điểm hiện tại.
+    """
+    if ts is None:
+        return int(datetime.now(timezone.utc).timestamp() * 1000)
+    if isinstance(ts, (int, np.integer)):
+        return int(ts)
+    if isinstance(ts, (float, np.floating)):
+        return int(ts)
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts)
+    if isinstance(ts, datetime):
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        return int(ts.timestamp() * 1000)
+    raise TypeError(f"Unsupported candle timestamp: {ts!r}")
+
+class CandleView(Sequence):
+    """
+    Cửa sổ read-only trên các cột của CandleBuffer (không copy dữ liệu).
+    - Truy cập cột NumPy: view.close, view["close"], view.timestamp
+    - Tương thích list-of-dict: view[-1]["close"], view[-30:], for c in view
+    """
+    __slots__ = ("timestamp",) + CANDLE_FIELDS
+
+    def __init__(self, timestamp, columns):
+        self.timestamp = timestamp
+        for name in CANDLE_FIELDS:
+            setattr(self, name, columns[name])
+
+    def _columns(self):
+        return {name: getattr(self, name) for name in CANDLE_FIELDS}
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, str):
+            return getattr(self, idx)
+        if isinstance(idx, slice):
+            return CandleView(self.timestamp[idx], {k: v[idx] for k, v in self._columns().items()})
+        return self.row(idx)
+
+    def row(self, idx):
+        """Trả về 1 nến dạng dict (bỏ qua các field NaN, vd: thiếu quote_volume)."""
+        candle = {"timestamp": int(self.timestamp[idx])}
+        for name in CANDLE_FIELDS:
+            value = float(getattr(self, name)[idx])
+            if value == value:
+                candle[name] = value
+        return candle
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.row(i)
+
+    def to_list(self):
+        """Copy ra list-of-dict (chỉ dùng khi thật sự cần, vd: serialize)."""
+        return list(self)
+
+    def __repr__(self):
+        return f"CandleView(len={len(self)})"
 
 class CandleBuffer:
     """
     Quản lý buffer nến cho 1 symbol/timeframe.
+    Lưu dạng cột NumPy cấp phát sẵn (timestamp int64 + OHLCV/quote_volume float64),
+    trả về view read-only của N nến cuối mà không copy.
     Tự động xóa 1000 nến cũ khi >max_candles.
     """
-    def __init__(self, max_candles=4000):
-        self.data: Deque[Dict[str, Any]] = deque()
+    def __init__(self, max_candles=4000, trim_size=1000):
         self.max_candles = max_candles
+        self.trim_size = min(trim_size, max_candles)
         self.lock = threading.Lock()
+        self._size = 0
+        self._timestamp, self._columns = self._allocate(max_candles + 1)
 
-    def append(self, candle: dict):
+    @staticmethod
+    def _allocate(capacity):
+        return np.empty(capacity, dtype=np.int64), {name: np.empty(capacity, dtype=np.float64) for name in CANDLE_FIELDS}
+
+    def _trim(self):
+        # Cấp phát mảng mới thay vì dịch tại chỗ: các view đã phát ra vẫn giữ nguyên dữ liệu
+        keep = self._size - self.trim_size
+        timestamp, columns = self._allocate(self.max_candles + 1)
+        timestamp[:keep] = self._timestamp[self.trim_size:self._size]
+        for name in CANDLE_FIELDS:
+            columns[name][:keep] = self._columns[name][self.trim_size:self._size]
+        self._timestamp, self._columns, self._size = timestamp, columns, keep
+
+    def append(self, candle: dict) -> int:
+        """Append 1 nến, trả về timestamp (epoch ms) đã chuẩn hóa."""
+        ts = to_epoch_ms(candle.get("timestamp"))
         with self.lock:
-            self.data.append(candle)
-            if len(self.data) > self.max_candles:
-                for _ in range(1000):
-                    if self.data:
-                        self.data.popleft()
+            i = self._size
+            self._timestamp[i] = ts
+            for name in CANDLE_FIELDS:
+                value = candle.get(name)
+                self._columns[name][i] = np.nan if value is None else value
+            self._size += 1
+            if self._size > self.max_candles:
+                self._trim()
+        return ts
 
-    def get_data(self):
+    def extend(self, records):
+        """
+        Append bulk từ mảng có các cột timestamp + CANDLE_FIELDS (vd: structured array của CandleStore).
+        Chỉ giữ tối đa max_candles nến cuối.
+        """
+        n = min(len(records), self.max_candles)
+        if n == 0:
+            return
+        records = records[-n:]
+        with self.lock:
+            if self._size + n > self.max_candles:
+                keep = max(0, self.max_candles - n)
+                timestamp, columns = self._allocate(self.max_candles + 1)
+                timestamp[:keep] = self._timestamp[self._size - keep:self._size]
+                for name in CANDLE_FIELDS:
+                    columns[name][:keep] = self._columns[name][self._size - keep:self._size]
+                self._timestamp, self._columns, self._size = timestamp, columns, keep
+            end = self._size + n
+            self._timestamp[self._size:end] = records["timestamp"]
+            for name in CANDLE_FIELDS:
+                self._columns[name][self._size:end] = records[name]
+            self._size = end
+
+    def view(self, n: Optional[int] = None) -> CandleView:
+        """View read-only của n nến cuối (mặc định toàn bộ buffer)."""
         with self.lock:
-            return list(self.data)
+            end = self._size
+            start = 0 if n is None else max(0, end - n)
+            timestamp = self._timestamp[start:end]
+            columns = {name: arr[start:end] for name, arr in self._columns.items()}
+        timestamp.flags.writeable = False
+        for arr in columns.values():
+            arr.flags.writeable = False
+        return CandleView(timestamp, columns)
+
+    def last(self) -> Optional[dict]:
+        """Nến mới nhất dạng dict, None nếu buffer rỗng."""
+        view = self.view(1)
+        return view[0] if len(view) else None
+
+    def get_data(self):
+        return self.view()
 
     def __len__(self):
-        return len(self.data)
+        return self._size
 
 class DataPipeline:
     """
@@ -38,8 +173,24 @@ class DataPipeline:
     def __init__(self, config_dir="config"):
         self.config = ConfigLoader(config_dir)
         cfg = self.config.get("strategy", reload=True)
-        self.max_candles = cfg.get("data_fetcher", {}).get("max_candles", 4000)
+        self.strategy_cfg = cfg
+        fetch_cfg = cfg.get("data_fetcher", {})
+        self.max_candles = fetch_cfg.get("max_candles", 4000)
+        self.store = CandleStore(fetch_cfg.get("history_dir", "data/candles")) if fetch_cfg.get("persist", False) else None
+        # Chỉ ingest base timeframe, các timeframe lớn hơn được gộp streaming từ base
+        self.base_timeframe = fetch_cfg.get("base_timeframe")
+        higher = [tf for tf in fetch_cfg.get("timeframes", []) if tf != self.base_timeframe]
+        self.resampler = Resampler(self.base_timeframe, higher) if self.base_timeframe and higher else None
+        # Timeframe chạy callback AI/strategy/order (mặc định strategy.timeframe); timeframe khác chỉ append
+        dispatch = fetch_cfg.get("dispatch_timeframes") or [cfg.get("strategy", {}).get("timeframe")]
+        self.dispatch_timeframes = frozenset(tf for tf in dispatch if tf) if self.resampler else None
+        self.max_workers = cfg.get("strategy", {}).get("max_workers", 4)
+        self.max_pending = fetch_cfg.get("max_pending", 1000)
+        self.dispatcher: Optional[CandleDispatcher] = None
+        self.universe: Optional[frozenset] = None  # None = xử lý mọi symbol
+        self.listeners = []  # fn(symbol, timeframe, candle) cho mọi nến ingest (add_listener)
         self.buffers: Dict[str, Dict[str, CandleBuffer]] = {}
+        self.indicators: Dict[str, Dict[str, IndicatorState]] = {}
         self.logger = LogManager.get_logger("data")
 
     def _get_buffer(self, symbol: str, timeframe: str):
@@ -49,26 +200,181 @@ class DataPipeline:
             self.buffers[symbol][timeframe] = CandleBuffer(max_candles=self.max_candles)
         return self.buffers[symbol][timeframe]
 
-    def append_candle(self, symbol: str, timeframe: str, candle: dict):
+    def _get_indicators(self, symbol: str, timeframe: str):
+        states = self.indicators.setdefault(symbol, {})
+        if timeframe not in states:
+            state = IndicatorState.from_config(self.strategy_cfg)
+            buf = self._get_buffer(symbol, timeframe)
+            if len(buf):
+                state.warmup(buf.view())
+            states[timeframe] = state
+        return states[timeframe]
+
+    def append_candle(self, symbol: str, timeframe: str, candle: dict) -> int:
         buf = self._get_buffer(symbol, timeframe)
-        buf.append(candle)
-        self.logger.debug(f"Appended candle for {symbol}-{timeframe}, total: {len(buf)}")
+        state = self._get_indicators(symbol, timeframe)
+        ts = buf.append(candle)
+        if self.store:
+            self.store.append(symbol, timeframe, ts, candle)
+        close = candle["close"]
+        volume = candle.get("volume")
+        state.update(candle.get("high", close), candle.get("low", close), close,
+                     np.nan if volume is None else volume, ts)
+        self.logger.debug("Appended candle for %s-%s, total: %d", symbol, timeframe, len(buf))
+        return ts
 
-    def get_data(self, symbol: str, timeframe: str):
+    def get_data(self, symbol: str, timeframe: str, limit: Optional[int] = None) -> CandleView:
+        """View read-only (zero-copy) của `limit` nến cuối, mặc định toàn bộ buffer."""
         buf = self._get_buffer(symbol, timeframe)
-        return buf.get_data()
+        return buf.view(limit)
+
+    def last_prices(self, symbols=None) -> Dict[str, float]:
+        """Giá close nến mới nhất {symbol: giá} (base timeframe, không có thì strategy timeframe)."""
+        timeframe = self.base_timeframe or self.strategy_cfg.get("strategy", {}).get("timeframe")
+        prices = {}
+        for symbol in (self.buffers if symbols is None else symbols):
+            buf = self.buffers.get(symbol, {}).get(timeframe)
+            last = buf.last() if buf is not None else None
+            if last is not None:
+                prices[symbol] = last["close"]
+        return prices
+
+    def tickers(self, window_ms: int = 24 * 3600 * 1000) -> Dict[str, list]:
+        """
+        Ticker 24h dựng từ nến đã ingest, dạng dict cột cho UniverseScanner.scan (dùng khi client
+        sàn không có get_ticker): symbol + quote_volume tổng trong window_ms tính tới nến mới nhất
+        (nến thiếu quote_volume tính bằng close * volume).
+        """
+        timeframe = self.base_timeframe or self.strategy_cfg.get("strategy", {}).get("timeframe")
+        symbols, quote_volume = [], []
+        for symbol, tfs in list(self.buffers.items()):
+            buf = tfs.get(timeframe)
+            view = buf.view() if buf is not None else None
+            if not view:
+                continue
+            recent = view.timestamp > view.timestamp[-1] - window_ms
+            qv = view.quote_volume[recent]
+            qv = np.where(np.isnan(qv), view.close[recent] * view.volume[recent], qv)
+            symbols.append(symbol)
+            quote_volume.append(float(qv.sum()))
+        return {"symbol": symbols, "quote_volume": quote_volume}
+
+    def get_indicators(self, symbol: str, timeframe: str) -> dict:
+        """Snapshot indicator đã cache (RSI/MACD/ATR/BB/volume SMA), không tính lại."""
+        return self._get_indicators(symbol, timeframe).snapshot()
+
+    def warmup_indicators(self, symbol: str, timeframe: str):
+        """Tính lại indicator từ toàn bộ lịch sử đang có trong buffer."""
+        state = self._get_indicators(symbol, timeframe)
+        state.warmup(self._get_buffer(symbol, timeframe).view())
+        return state.snapshot()
+
+    def backfill(self, symbol: str, timeframe: str, limit: Optional[int] = None) -> int:
+        """
+        Nạp lịch sử từ CandleStore vào CandleBuffer khi khởi động (không cần tải lại từ sàn),
+        rồi warm-up indicator. Trả về số nến đã nạp.
+        """
+        if not self.store:
+            return 0
+        self._compact_if_needed(symbol, timeframe)
+        records = self.store.tail(symbol, timeframe, limit or self.max_candles)
+        buf = self._get_buffer(symbol, timeframe)
+        buf.extend(records)
+        self.warmup_indicators(symbol, timeframe)
+        if self.resampler and timeframe == self.base_timeframe:
+            self.resampler.seed(symbol, records)
+        self.logger.info(f"Backfilled {len(records)} candles for {symbol}-{timeframe}")
+        return len(records)
+
+    def load_history(self, symbol: str, timeframe: str, start: Optional[int] = None,
+                     end: Optional[int] = None, limit: Optional[int] = None):
+        """
+        Lịch sử nến từ CandleStore (structured array, memmap) cho AI trainer/backtest.
+        start/end: epoch ms; limit: chỉ lấy N nến cuối (vd: candle_limit trong ai.yaml).
+        """
+        if not self.store:
+            return None
+        self._compact_if_needed(symbol, timeframe)
+        if start is None and end is None and limit:
+            return self.store.tail(symbol, timeframe, limit)
+        records = self.store.range(symbol, timeframe, start, end)
+        return records[-limit:] if limit else records
+
+    def _compact_if_needed(self, symbol: str, timeframe: str):
+        if self.store.has_duplicates(symbol, timeframe):
+            kept = self.store.compact(symbol, timeframe)
+            self.logger.info(f"Compacted candle history {symbol}-{timeframe}: {kept} records")
+
+    def compact_history(self):
+        """Compact toàn bộ file lịch sử của các buffer đang có."""
+        if not self.store:
+            return
+        for symbol, tfs in self.buffers.items():
+            for timeframe in tfs:
+                self.store.compact(symbol, timeframe)
+
+    def start_dispatcher(self, on_new, max_workers: Optional[int] = None):
+        """
+        Chạy callback on_new (AI/strategy/order) trên worker pool thay vì luồng ingest.
+        Sau khi start, trigger_on_new_candle không truyền on_new sẽ đi qua dispatcher.
+        """
+        self.dispatcher = CandleDispatcher(on_new, max_workers=max_workers or self.max_workers,
+                                           max_pending=self.max_pending, logger=self.logger, metrics=METRICS)
+        METRICS.register_gauge("dispatcher", self.dispatch_stats)
+        return self.dispatcher
+
+    def dispatch_stats(self):
+        return self.dispatcher.stats() if self.dispatcher else {}
+
+    def add_listener(self, fn):
+        """
+        fn(symbol, timeframe, candle) được gọi trên luồng ingest cho mọi nến nhận được,
+        trước lọc universe / dispatch_timeframes (vd: theo dõi SL/TP lệnh đang mở).
+        fn phải nhanh, việc nặng (gọi sàn) đẩy sang thread riêng.
+        """
+        self.listeners.append(fn)
+
+    def set_universe(self, symbols):
+        """Subscriber của UniverseScanner: chỉ symbol trong tập này mới chạy callback AI/strategy."""
+        self.universe = frozenset(symbols)
 
     def trigger_on_new_candle(self, symbol: str, timeframe: str, candle: dict, on_new=None):
         """
-        Gọi khi có nến mới realtime. 
-        Tự động append và gọi callback (on_new) nếu truyền vào (vd: trigger AI/strategy)
+        Gọi khi có nến mới realtime.
+        Tự động append và gọi callback (on_new) nếu truyền vào (vd: trigger AI/strategy),
+        hoặc đẩy sang dispatcher (start_dispatcher) để không block ingest.
+        Với nến base timeframe: gộp vào các timeframe lớn hơn, callback cho timeframe lớn
+        chỉ được gọi khi bar của timeframe đó đóng. Callback chỉ chạy cho dispatch_timeframes
+        (timeframe giao dịch), symbol ngoài universe chỉ được append.
         """
-        self.append_candle(symbol, timeframe, candle)
+        with METRICS.timer("ingest", symbol):
+            ts = self.append_candle(symbol, timeframe, candle)
+            closed = [timeframe]
+            if self.resampler and timeframe == self.base_timeframe:
+                for tf, bar in self.resampler.update(symbol, ts, candle):
+                    self.append_candle(symbol, tf, bar)
+                    closed.append(tf)
+        for fn in self.listeners:
+            try:
+                fn(symbol, timeframe, candle)
+            except Exception as e:
+                self.logger.error(f"Candle listener failed for {symbol} {timeframe}: {e!r}")
+        # Vẫn lưu nến để buffer/indicator luôn sẵn khi symbol quay lại universe
+        if self.universe is not None and symbol not in self.universe:
+            return
+        if self.dispatch_timeframes is not None:
+            closed = [tf for tf in closed if tf in self.dispatch_timeframes]
         if on_new:
-            on_new(symbol, timeframe, self.get_data(symbol, timeframe))
+            for tf in closed:
+                on_new(symbol, tf, self.get_data(symbol, tf))
+        elif self.dispatcher:
+            for tf in closed:
+                self.dispatcher.submit(symbol, tf, self.get_data(symbol, tf))
 
 # Usage example/test
 if __name__ == "__main__":
     dp = DataPipeline()
     dp.append_candle("BTCUSDT", "15m", {"timestamp": datetime.utcnow().isoformat(), "open": 29000, "high": 29100, "low": 28900, "close": 29050, "volume": 120})
-    print(dp.get_data("BTCUSDT", "15m"))
+    candles = dp.get_data("BTCUSDT", "15m")
+    print(candles[-1], candles.close)
+    print(dp.get_indicators("BTCUSDT", "15m"))
@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+class CandleDispatcher:
+    """
+    Tách ingest nến khỏi xử lý (AI/strategy/order):
+    - Worker pool giới hạn, mỗi symbol xử lý tuần tự (giữ thứ tự theo symbol)
+    - Symbol bị chậm: chỉ giữ nến mới nhất cho mỗi timeframe (coalesce nến cũ đang chờ)
+    - Backpressure: quá max_pending (symbol, timeframe) đang chờ thì bỏ nến mới và đếm dropped
+    - metrics (tùy chọn): latency chờ trong hàng đợi (dispatch_wait) và handler (handler)
+    """
+    def __init__(self, handler: Callable, max_workers=4, max_pending=1000, logger=None, metrics=None):
+        self.handler = handler
+        self.max_pending = max_pending
+        self.logger = logger
+        self.metrics = metrics
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="candle-dispatch")
+        self.lock = threading.Lock()
+        self._pending: Dict[str, OrderedDict] = {}
+        self._active = set()
+        self._depth = 0
+        self._in_flight = 0
+        self.submitted = 0
+        self.processed = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def submit(self, symbol: str, timeframe: str, candles) -> bool:
+        """
+        Đưa nến vào hàng đợi của symbol (không block luồng ingest).
+        Trả về False nếu bị drop do hàng đợi đầy.
+        """
+        with self.lock:
+            queue = self._pending.setdefault(symbol, OrderedDict())
+            if timeframe in queue:
+                # Nến cũ chưa kịp xử lý -> thay bằng nến mới nhất (giữ thời điểm vào hàng đợi ban đầu)
+                queue[timeframe] = (candles, queue[timeframe][1])
+                self.coalesced += 1
+            elif self._depth >= self.max_pending:
+                self.dropped += 1
+                if self.logger:
+                    self.logger.warning(f"Dispatcher full ({self._depth}), dropped candle {symbol}-{timeframe}")
+                return False
+            else:
+                queue[timeframe] = (candles, time.perf_counter())
+                self._depth += 1
+            self.submitted += 1
+            if symbol not in self._active:
+                self._active.add(symbol)
+                self.executor.submit(self._drain, symbol)
+        return True
+
+    def _drain(self, symbol: str):
+        while True:
+            with self.lock:
+                queue = self._pending.get(symbol)
+                if not queue:
+                    self._active.discard(symbol)
+                    self._pending.pop(symbol, None)
+                    return
+                timeframe, (candles, queued_at) = queue.popitem(last=False)
+                self._depth -= 1
+                self._in_flight += 1
+            start = time.perf_counter()
+            if self.metrics:
+                self.metrics.observe("dispatch_wait", start - queued_at, symbol)
+            try:
+                self.handler(symbol, timeframe, candles)
+            except Exception as e:
+                with self.lock:
+                    self.errors += 1
+                if self.logger:
+                    self.logger.error(f"Candle handler failed for {symbol}-{timeframe}: {e}")
+            finally:
+                if self.metrics:
+                    self.metrics.observe("handler", time.perf_counter() - start, symbol)
+                with self.lock:
+                    self._in_flight -= 1
+                    self.processed += 1
+
+    def stats(self):
+        """Độ sâu hàng đợi và các bộ đếm (cho dashboard/metrics)."""
+        with self.lock:
+            return {
+                "queue_depth": self._depth,
+                "in_flight": self._in_flight,
+                "active_symbols": len(self._active),
+                "submitted": self.submitted,
+                "processed": self.processed,
+                "coalesced": self.coalesced,
+                "dropped": self.dropped,
+                "errors": self.errors,
+            }
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+# Usage example/test
+if __name__ == "__main__":
+    import time
+
+    def slow_handler(symbol, timeframe, candles):
+        time.sleep(0.05)
+
+    dispatcher = CandleDispatcher(slow_handler, max_workers=4)
+    for i in range(20):
+        for s in ["BTCUSDT", "ETHUSDT", "SOLUSDT"]:
+            dispatcher.submit(s, "1h", [i])
+    time.sleep(0.5)
+    print(dispatcher.stats())
+    dispatcher.shutdown()
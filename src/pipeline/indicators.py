@@ -0,0 +1,224 @@
+import math
+import threading
+from collections import deque
+import numpy as np
+
+class RollingWindow:
+    """
+    Cửa sổ trượt cố định độ dài, giữ tổng và tổng bình phương để tính mean/std O(1).
+    Định kỳ tính lại tổng từ đầu để tránh sai số tích lũy của float.
+    """
+    RESYNC_EVERY = 1000
+
+    def __init__(self, period):
+        self.period = period
+        self.values = deque(maxlen=period)
+        self.total = 0.0
+        self.total_sq = 0.0
+        self._updates = 0
+
+    def push(self, value):
+        if len(self.values) == self.period:
+            old = self.values[0]
+            self.total -= old
+            self.total_sq -= old * old
+        self.values.append(value)
+        self.total += value
+        self.total_sq += value * value
+        self._updates += 1
+        if self._updates % self.RESYNC_EVERY == 0:
+            self.total = math.fsum(self.values)
+            self.total_sq = math.fsum(v * v for v in self.values)
+
+    @property
+    def full(self):
+        return len(self.values) == self.period
+
+    def mean(self):
+        return self.total / len(self.values)
+
+    def std(self):
+        n = len(self.values)
+        var = self.total_sq / n - (self.total / n) ** 2
+        return math.sqrt(var) if var > 0 else 0.0
+
+class IndicatorState:
+    """
+    Indicator streaming cho 1 symbol/timeframe, cập nhật O(1) mỗi nến:
+    Wilder RSI, MACD (EMA fast/slow + signal), Wilder ATR, Bollinger bands, volume SMA.
+    EMA được seed bằng giá trị đầu tiên; RSI/ATR seed bằng SMA của `period` giá trị đầu.
+    """
+    def __init__(self, rsi_period=14, macd_fast=12, macd_slow=26, macd_signal=9,
+                 atr_period=14, bb_period=20, bb_std=2.0, volume_sma_period=20):
+        self.rsi_period = rsi_period
+        self.macd_fast = macd_fast
+        self.macd_slow = macd_slow
+        self.macd_signal = macd_signal
+        self.atr_period = atr_period
+        self.bb_period = bb_period
+        self.bb_std = bb_std
+        self.volume_sma_period = volume_sma_period
+        self.lock = threading.Lock()
+        self.reset()
+
+    @classmethod
+    def from_config(cls, strategy_cfg):
+        """Tạo state với period lấy từ strategy.yaml (strategies.rsi_macd + indicators)."""
+        rsi_macd = strategy_cfg.get("strategies", {}).get("rsi_macd", {})
+        ind = strategy_cfg.get("indicators", {})
+        return cls(
+            rsi_period=rsi_macd.get("rsi_period", 14),
+            macd_fast=rsi_macd.get("macd_fast", 12),
+            macd_slow=rsi_macd.get("macd_slow", 26),
+            macd_signal=rsi_macd.get("macd_signal", 9),
+            atr_period=ind.get("atr_period", 14),
+            bb_period=ind.get("bb_period", 20),
+            bb_std=ind.get("bb_std", 2.0),
+            volume_sma_period=ind.get("volume_sma_period", 20),
+        )
+
+    def reset(self):
+        self.count = 0
+        self.timestamp = None
+        self.close = None
+        self.volume = None
+        self._prev_close = None
+        # RSI (Wilder)
+        self._gain_sum = 0.0
+        self._loss_sum = 0.0
+        self.avg_gain = None
+        self.avg_loss = None
+        # MACD
+        self.ema_fast = None
+        self.ema_slow = None
+        self.macd_signal_line = None
+        # ATR (Wilder)
+        self._tr_sum = 0.0
+        self.atr = None
+        # Bollinger / volume SMA
+        self._bb = RollingWindow(self.bb_period)
+        self._vol = RollingWindow(self.volume_sma_period)
+
+    @staticmethod
+    def _ema(prev, value, period):
+        if prev is None:
+            return value
+        alpha = 2.0 / (period + 1)
+        return prev + alpha * (value - prev)
+
+    def update(self, high, low, close, volume, timestamp=None):
+        """Cập nhật toàn bộ indicator với 1 nến mới. O(1)."""
+        with self.lock:
+            self._update(high, low, close, volume, timestamp)
+
+    def _update(self, high, low, close, volume, timestamp):
+        prev = self._prev_close
+        self.count += 1
+        self.timestamp = timestamp
+        self.close = close
+        self.volume = volume
+
+        if prev is not None:
+            delta = close - prev
+            gain, loss = max(delta, 0.0), max(-delta, 0.0)
+            n = self.count - 1  # số delta đã có
+            p = self.rsi_period
+            if n < p:
+                self._gain_sum += gain
+                self._loss_sum += loss
+            elif n == p:
+                self.avg_gain = (self._gain_sum + gain) / p
+                self.avg_loss = (self._loss_sum + loss) / p
+            else:
+                self.avg_gain = (self.avg_gain * (p - 1) + gain) / p
+                self.avg_loss = (self.avg_loss * (p - 1) + loss) / p
+            tr = max(high - low, abs(high - prev), abs(low - prev))
+        else:
+            tr = high - low
+
+        p = self.atr_period
+        if self.count < p:
+            self._tr_sum += tr
+        elif self.count == p:
+            self.atr = (self._tr_sum + tr) / p
+        else:
+            self.atr = (self.atr * (p - 1) + tr) / p
+
+        self.ema_fast = self._ema(self.ema_fast, close, self.macd_fast)
+        self.ema_slow = self._ema(self.ema_slow, close, self.macd_slow)
+        self.macd_signal_line = self._ema(self.macd_signal_line, self.ema_fast - self.ema_slow, self.macd_signal)
+
+        self._bb.push(close)
+        if volume == volume:  # bỏ qua NaN
+            self._vol.push(volume)
+        self._prev_close = close
+
+    def warmup(self, candles):
+        """
+        Reset và chạy lại toàn bộ lịch sử (CandleView hoặc list-of-dict) để khởi tạo state.
+        """
+        if hasattr(candles, "close"):
+            highs, lows, closes, volumes, stamps = candles.high, candles.low, candles.close, candles.volume, candles.timestamp
+        else:
+            highs = np.array([c.get("high", c["close"]) for c in candles], dtype=np.float64)
+            lows = np.array([c.get("low", c["close"]) for c in candles], dtype=np.float64)
+            closes = np.array([c["close"] for c in candles], dtype=np.float64)
+            volumes = np.array([c.get("volume", np.nan) for c in candles], dtype=np.float64)
+            stamps = [c.get("timestamp") for c in candles]
+        with self.lock:
+            self.reset()
+            for h, l, c, v, ts in zip(highs.tolist(), lows.tolist(), closes.tolist(), volumes.tolist(), list(stamps)):
+                self._update(h, l, c, v, ts)
+        return self
+
+    @property
+    def ready(self):
+        """Đủ dữ liệu cho tất cả indicator."""
+        return (self.avg_gain is not None and self.atr is not None and self._bb.full
+                and self.count >= self.macd_slow + self.macd_signal)
+
+    @property
+    def rsi(self):
+        if self.avg_gain is None:
+            return None
+        if self.avg_loss == 0:
+            return 100.0 if self.avg_gain > 0 else 50.0
+        return 100.0 - 100.0 / (1.0 + self.avg_gain / self.avg_loss)
+
+    def snapshot(self):
+        """Giá trị indicator hiện tại dạng dict (None nếu chưa đủ dữ liệu)."""
+        with self.lock:
+            macd = None if self.ema_fast is None else self.ema_fast - self.ema_slow
+            bb_mid = bb_upper = bb_lower = None
+            if self._bb.full:
+                bb_mid = self._bb.mean()
+                width = self.bb_std * self._bb.std()
+                bb_upper, bb_lower = bb_mid + width, bb_mid - width
+            return {
+                "timestamp": self.timestamp,
+                "close": self.close,
+                "volume": self.volume,
+                "rsi": self.rsi,
+                "ema_fast": self.ema_fast,
+                "ema_slow": self.ema_slow,
+                "macd": macd,
+                "macd_signal": self.macd_signal_line,
+                "macd_hist": None if macd is None else macd - self.macd_signal_line,
+                "atr": self.atr,
+                "bb_mid": bb_mid,
+                "bb_upper": bb_upper,
+                "bb_lower": bb_lower,
+                "volume_sma": self._vol.mean() if self._vol.full else None,
+                "count": self.count,
+                "ready": self.ready,
+            }
+
+# Usage example/test
+if __name__ == "__main__":
+    import random
+    state = IndicatorState(rsi_period=21)
+    price = 100.0
+    for _ in range(200):
+        price += random.uniform(-1, 1)
+        state.update(price + 0.5, price - 0.5, price, random.uniform(100, 200))
+    print(state.snapshot())
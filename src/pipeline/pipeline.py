@@ -1,25 +1,188 @@
-from src.ai.ai_trainer import AITrainer
-from src.risk.risk_controller import RiskController
+import multiprocessing
+import os
+import queue
+import time
+import numpy as np
+from ai.ai_trainer import AITrainer, walk_forward_splits
+from ai.feature_engine import FeatureEngine, artifact_path
+from pipeline.candle_store import CandleStore
+from utils.config_loader import ConfigLoader
+from utils.log_manager import LogManager
+
+def _train_job(params, preprocessing, validation_split, X, y, fold=None):
+    """
+    Chạy trong process con. fold=(train_end, test_end): train trên [0, train_end),
+    trả về metrics trên [train_end, test_end). fold=None: train trên toàn bộ, trả về trainer.
+    """
+    trainer = AITrainer("xgb", params, preprocessing=preprocessing, validation_split=validation_split)
+    if fold is None:
+        trainer.train(X, y)
+        return trainer
+    train_end, test_end = fold
+    trainer.train(X[:train_end], y[:train_end])
+    metrics = trainer.evaluate(X[train_end:test_end], y[train_end:test_end])
+    metrics["n_train"] = int(train_end)
+    return metrics
+
+def _fill_missing(X, method):
+    """Bỏ giai đoạn warm-up (NaN đầu chuỗi), NaN giữa chuỗi nội suy tuyến tính hoặc bỏ dòng."""
+    finite = np.isfinite(X).all(axis=1)
+    if not finite.any():
+        return X[:0], finite
+    start = int(np.argmax(finite))
+    X = X[start:].copy()
+    if method == "interpolate":
+        idx = np.arange(len(X))
+        for j in range(X.shape[1]):
+            bad = ~np.isfinite(X[:, j])
+            if bad.any():
+                X[bad, j] = np.interp(idx[bad], idx[~bad], X[~bad, j])
+    keep = np.zeros(start + len(X), dtype=bool)
+    keep[start:] = np.isfinite(X).all(axis=1)
+    return X[keep[start:]], keep
 
 class Pipeline:
-    def __init__(self, config):
-        self.config = config
-        self.ai_trainer = AITrainer('xgb', config['xgb'])
-        self.risk_controller = RiskController(config['risk'])
-
-    def fetch_data(self):
-        # TODO: Fetch candle data
-        return [], []
-    def preprocess(self, X, y):
-        # TODO: Preprocess data
-        return X, y
-    def run(self):
-        X, y = self.fetch_data()
-        X, y = self.preprocess(X, y)
-        self.ai_trainer.train(X, y)
-        signal = self.ai_trainer.predict(X)
-        safe_mode = self.risk_controller.check_safe_mode(['win','loss','loss'], 'ok', 10)
-        if safe_mode:
-            print('SafeMode active. Skip trade!')
-        else:
-            print(f'Execute trade with signal: {signal}')
+    """
+    Training pipeline cho model XGB:
+    - Lấy lịch sử từ CandleStore (memmap), build feature bulk bằng FeatureEngine
+    - Walk-forward validation (training.validation) + fit model cuối, mỗi fold / symbol
+      là 1 job trong process pool (số worker theo CPU và memory budget)
+    - Toàn bộ lần chạy nằm trong resource_limits.training_timeout, quá hạn thì terminate worker
+    - Model đạt ngưỡng accuracy được ghi artifact có version, AIEngine tự hot-reload
+    """
+    def __init__(self, config=None, config_dir="config", model_dir="models"):
+        self.config_loader = ConfigLoader(config_dir)
+        self.config = config or self.config_loader.get("ai")
+        strategy_cfg = self.config_loader.get("strategy")
+        fetch_cfg = strategy_cfg.get("data_fetcher", {})
+        self.store = CandleStore(fetch_cfg.get("history_dir", "data/candles"))
+        self.feature_engine = FeatureEngine(config_dir, model_dir)
+        self.model_dir = model_dir
+        self.logger = LogManager.get_logger("ai")
+
+        xgb_cfg = self.config.get("xgb", {})
+        general = self.config.get("general", {})
+        training = self.config.get("training", {})
+        limits = self.config.get("resource_limits", {})
+        validation = training.get("validation", {})
+        self.params = xgb_cfg.get("model_params", {})
+        self.timeframe = xgb_cfg.get("timeframe", "1h")
+        self.candle_limit = xgb_cfg.get("candle_limit", 800)
+        self.compiled = xgb_cfg.get("compiled", False)
+        self.preprocessing = training.get("data_preprocessing", {})
+        self.label_horizon = training.get("label_horizon", 1)
+        self.n_splits = validation.get("n_splits", 3)
+        self.test_size = validation.get("test_size", 0.2)
+        self.validation_split = general.get("validation_split", 0.25)
+        self.min_samples = general.get("min_training_samples", 300)
+        self.retrain_interval = general.get("retrain_interval", 168) * 3600
+        self.min_accuracy = self.config.get("monitoring", {}).get("disable_model_below_accuracy", 0.0)
+        self.timeout = limits.get("training_timeout", 300)
+        # Mỗi job 1 thread xgboost, số process bị chặn bởi CPU và RAM cho phép
+        budget_workers = limits.get("max_memory_mb", 400) // max(1, training.get("job_memory_mb", 100))
+        self.workers = max(1, min(os.cpu_count() or 1, training.get("workers", 4), budget_workers))
+
+    def fetch_data(self, symbol):
+        """candle_limit nến cuối của symbol từ CandleStore (memmap, không copy)."""
+        return self.store.tail(symbol, self.timeframe, self.candle_limit)
+
+    def preprocess(self, candles):
+        """
+        (X, y): feature XGB bulk + nhãn close[t + label_horizon] > close[t].
+        Scaling / lọc outlier làm trong AITrainer trên đúng phần train của từng fold.
+        """
+        X = self.feature_engine.build_matrix(candles)
+        close = np.asarray(candles["close"], dtype=np.float64)
+        h = self.label_horizon
+        if len(close) <= h:
+            return X[:0], np.empty(0, dtype=np.int8)
+        y = (close[h:] > close[:-h]).astype(np.int8)
+        X, keep = _fill_missing(X[:-h], self.preprocessing.get("handle_missing", "interpolate"))
+        return X, y[keep]
+
+    def due(self, symbol):
+        """True nếu model live của symbol chưa có hoặc cũ hơn retrain_interval."""
+        path = artifact_path(self.model_dir, "xgb", symbol, ".pkl")
+        try:
+            return time.time() - os.stat(path).st_mtime >= self.retrain_interval
+        except FileNotFoundError:
+            return True
+
+    def run(self, symbols=None, force=False):
+        """
+        Train lại các symbol (mặc định: mọi symbol có lịch sử ở timeframe của XGB).
+        Trả về {symbol: report} với metrics walk-forward, version đã deploy hoặc lý do bỏ qua.
+        """
+        symbols = symbols if symbols is not None else self.store.symbols(self.timeframe)
+        reports, datasets = {}, {}
+        for symbol in symbols:
+            if not force and not self.due(symbol):
+                reports[symbol] = {"status": "fresh"}
+                continue
+            X, y = self.preprocess(self.fetch_data(symbol))
+            if len(X) < self.min_samples:
+                reports[symbol] = {"status": "insufficient_data", "samples": int(len(X))}
+                continue
+            datasets[symbol] = (X, y)
+            reports[symbol] = {"status": "timeout", "samples": int(len(X)), "folds": []}
+
+        start = time.monotonic()
+        # multiprocessing.Pool (không dùng ProcessPoolExecutor): terminate() dừng được cả job đang chạy
+        pool = multiprocessing.Pool(self.workers)
+        done = queue.Queue()
+        pending, finals = {}, {}
+        try:
+            for symbol, (X, y) in datasets.items():
+                args = (self.params, self.preprocessing, self.validation_split, X, y)
+                for fold in [*walk_forward_splits(len(X), self.n_splits, self.test_size), None]:
+                    job = len(pending)
+                    pending[job] = (symbol, fold)
+                    pool.apply_async(_train_job, (*args, fold),
+                                     callback=lambda result, job=job: done.put((job, result, None)),
+                                     error_callback=lambda e, job=job: done.put((job, None, e)))
+            while pending:
+                remaining = self.timeout - (time.monotonic() - start)
+                try:
+                    job, result, error = done.get(timeout=max(0.0, remaining))
+                except queue.Empty:
+                    break
+                symbol, fold = pending.pop(job)
+                if error is not None:
+                    self.logger.error(f"Training job failed for {symbol} (fold {fold}): {error}")
+                    reports[symbol]["status"] = "error"
+                elif fold is None:
+                    finals[symbol] = result
+                else:
+                    reports[symbol]["folds"].append(result)
+        finally:
+            if pending:
+                self.logger.warning(f"Training timeout after {self.timeout}s, terminated {len(pending)} jobs")
+                pool.terminate()
+            else:
+                pool.close()
+            pool.join()
+
+        for symbol, trainer in finals.items():
+            report = reports[symbol]
+            if report["status"] == "error" or len(report["folds"]) < self.n_splits:
+                continue
+            report["folds"].sort(key=lambda m: m["n_train"])
+            accuracy = float(np.mean([m["accuracy"] for m in report["folds"]]))
+            report["accuracy"] = accuracy
+            if accuracy < self.min_accuracy:
+                report["status"] = "rejected"
+                self.logger.warning(f"{symbol}: walk-forward accuracy {accuracy:.3f} < {self.min_accuracy}, keep current model")
+                continue
+            trainer.model_dir = self.model_dir
+            metrics = {"accuracy": accuracy, "samples": report["samples"], "folds": report["folds"]}
+            report["version"] = trainer.save(symbol, metrics=metrics, compiled=self.compiled)
+            report["status"] = "deployed"
+            self.logger.info(f"{symbol}: deployed xgb model {report['version']} (accuracy {accuracy:.3f})")
+        self.logger.info(f"Training finished in {time.monotonic() - start:.1f}s with {self.workers} workers")
+        return reports
+
+if __name__ == "__main__":
+    import sys
+    results = Pipeline().run(sys.argv[1:] or None, force=True)
+    for symbol, report in results.items():
+        print(symbol, report.get("status"), report.get("accuracy"), report.get("version"))
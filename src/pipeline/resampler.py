@@ -0,0 +1,127 @@
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+TIMEFRAME_UNITS = {"m": 60_000, "h": 3_600_000, "d": 86_400_000, "w": 604_800_000}
+
+def timeframe_to_ms(timeframe: str) -> int:
+    """'15m' -> 900000, '4h' -> 14400000 ..."""
+    try:
+        return int(timeframe[:-1]) * TIMEFRAME_UNITS[timeframe[-1]]
+    except (KeyError, ValueError):
+        raise ValueError(f"Unsupported timeframe: {timeframe}")
+
+class Resampler:
+    """
+    Gộp nến base timeframe (vd: 15m) thành các timeframe lớn hơn (1h, 2h, 4h) theo kiểu streaming.
+    Mỗi nến base cập nhật OHLCV của bar đang chạy O(1); bar chỉ được trả về khi đã đóng
+    (nhận nến base cuối cùng của bar, hoặc nến thuộc bar kế tiếp nếu bị thiếu nến).
+    Timestamp của nến/bar là thời điểm mở (epoch ms), bar căn theo epoch (như Binance).
+    """
+    def __init__(self, base_timeframe: str, timeframes: List[str]):
+        self.base_timeframe = base_timeframe
+        self.base_ms = timeframe_to_ms(base_timeframe)
+        self.targets: Dict[str, int] = {}
+        for tf in timeframes:
+            tf_ms = timeframe_to_ms(tf)
+            if tf_ms <= self.base_ms or tf_ms % self.base_ms:
+                raise ValueError(f"Timeframe {tf} is not a multiple of base {base_timeframe}")
+            self.targets[tf] = tf_ms
+        # partial[symbol][tf] = bar đang chạy
+        self.partial: Dict[str, Dict[str, dict]] = {}
+
+    @staticmethod
+    def _new_bar(bucket, candle):
+        close = candle["close"]
+        return {
+            "timestamp": bucket,
+            "open": candle.get("open", close),
+            "high": candle.get("high", close),
+            "low": candle.get("low", close),
+            "close": close,
+            "volume": candle.get("volume") or 0.0,
+            "quote_volume": candle.get("quote_volume"),
+            "_last": None,
+        }
+
+    @staticmethod
+    def _merge(bar, candle):
+        close = candle["close"]
+        bar["high"] = max(bar["high"], candle.get("high", close))
+        bar["low"] = min(bar["low"], candle.get("low", close))
+        bar["close"] = close
+        bar["volume"] += candle.get("volume") or 0.0
+        qv = candle.get("quote_volume")
+        if qv is not None:
+            bar["quote_volume"] = qv if bar["quote_volume"] is None else bar["quote_volume"] + qv
+
+    @staticmethod
+    def _closed(bar):
+        return {k: v for k, v in bar.items() if k != "_last" and v is not None}
+
+    def update(self, symbol: str, timestamp: int, candle: dict) -> List[Tuple[str, dict]]:
+        """
+        Đưa 1 nến base (đã đóng) vào. Trả về list (timeframe, bar) của các bar vừa đóng.
+        """
+        completed = []
+        bars = self.partial.setdefault(symbol, {})
+        for tf, tf_ms in self.targets.items():
+            bucket = timestamp - timestamp % tf_ms
+            bar = bars.get(tf)
+            if bar is not None and bucket != bar["timestamp"]:
+                if bucket < bar["timestamp"]:
+                    continue  # nến cũ đến muộn, bỏ qua
+                # Thiếu nến cuối của bar trước: vẫn đóng bar với dữ liệu đang có
+                completed.append((tf, self._closed(bar)))
+                bar = None
+            if bar is None:
+                bar = bars[tf] = self._new_bar(bucket, candle)
+            elif timestamp <= bar["_last"]:
+                continue  # nến base trùng, không cộng dồn 2 lần
+            else:
+                self._merge(bar, candle)
+            bar["_last"] = timestamp
+            if timestamp + self.base_ms >= bucket + tf_ms:
+                completed.append((tf, self._closed(bar)))
+                del bars[tf]
+        return completed
+
+    def seed(self, symbol: str, records: np.ndarray):
+        """
+        Khôi phục bar đang chạy sau restart từ lịch sử base (structured array có timestamp + OHLCV),
+        không phát sự kiện đóng bar.
+        """
+        if not len(records):
+            return
+        bars = self.partial.setdefault(symbol, {})
+        ts = records["timestamp"]
+        last = int(ts[-1])
+        for tf, tf_ms in self.targets.items():
+            bucket = last - last % tf_ms
+            if last + self.base_ms >= bucket + tf_ms:
+                bars.pop(tf, None)  # bar cuối đã đóng
+                continue
+            rows = records[np.searchsorted(ts, bucket, side="left"):]
+            volume = np.nan_to_num(rows["volume"])
+            qv = rows["quote_volume"]
+            bars[tf] = {
+                "timestamp": bucket,
+                "open": float(rows["open"][0]),
+                "high": float(rows["high"].max()),
+                "low": float(rows["low"].min()),
+                "close": float(rows["close"][-1]),
+                "volume": float(volume.sum()),
+                "quote_volume": None if np.isnan(qv).all() else float(np.nansum(qv)),
+                "_last": last,
+            }
+
+    def pending(self, symbol: str, timeframe: str) -> Optional[dict]:
+        """Bar đang chạy (chưa đóng) của symbol/timeframe."""
+        bar = self.partial.get(symbol, {}).get(timeframe)
+        return self._closed(bar) if bar else None
+
+# Usage example/test
+if __name__ == "__main__":
+    rs = Resampler("15m", ["1h", "4h"])
+    for i in range(16):
+        for tf, bar in rs.update("BTCUSDT", i * 900_000, {"open": i, "high": i + 1, "low": i - 1, "close": i + 0.5, "volume": 10}):
+            print(tf, bar)
@@ -10,7 +10,9 @@ class RiskController:
     def __init__(self, config_dir="config"):
         self.config = ConfigLoader(config_dir)
         self.logger = LogManager.get_logger("risk")
+        self.clock = time.time  # Backtest thay bằng đồng hồ mô phỏng
         self.reload_config()
+        self.config.subscribe("risk", self._on_config_change)
         self.safe_mode = False
         self.safe_mode_until = 0
         self.error_count = 0
@@ -26,6 +28,9 @@ class RiskController:
         self.safe_mode_triggers = self.risk_cfg.get("safe_mode_triggers", ["ai_error", "continuous_loss", "high_atr_spike"])
         self.safe_mode_period = self.risk_cfg.get("disable_after_minutes", 60)
 
+    def _on_config_change(self, name, config):
+        self.reload_config()
+
     def check_max_position(self, size, balance):
         ok = size <= balance * self.max_position_size
         if not ok:
@@ -61,11 +66,11 @@ class RiskController:
 
     def trigger_safe_mode(self, reason):
         self.safe_mode = True
-        self.safe_mode_until = time.time() + self.safe_mode_period * 60
+        self.safe_mode_until = self.clock() + self.safe_mode_period * 60
         self.logger.error(f"SAFE MODE TRIGGERED: {reason}. All trading halted for {self.safe_mode_period} minutes.")
 
     def check_safe_mode(self):
-        if self.safe_mode and time.time() > self.safe_mode_until:
+        if self.safe_mode and self.clock() > self.safe_mode_until:
             self.safe_mode = False
             self.error_count = 0
             self.loss_streak = 0
@@ -0,0 +1,105 @@
+import os
+import numpy as np
+
+# Các cột indicator dùng chung (snapshot của IndicatorState), stack thành mảng theo symbol
+INDICATOR_FIELDS = ("close", "volume", "rsi", "ema_fast", "ema_slow", "macd", "macd_signal", "macd_hist",
+                    "atr", "bb_mid", "bb_upper", "bb_lower", "volume_sma")
+
+STRATEGIES = {}
+
+def register(name):
+    """Decorator đăng ký plugin strategy theo tên dùng trong available_strategies."""
+    def wrap(cls):
+        cls.name = name
+        STRATEGIES[name] = cls
+        return cls
+    return wrap
+
+def stack_indicators(snapshots):
+    """
+    List snapshot indicator (1/symbol) -> dict cột NumPy (None -> NaN).
+    Các đại lượng dẫn xuất dùng chung (volume_ratio, ...) tính 1 lần cho mọi strategy.
+    """
+    cols = {field: np.array([np.nan if s.get(field) is None else s[field] for s in snapshots], dtype=np.float64)
+            for field in INDICATOR_FIELDS}
+    return derive_indicators(cols)
+
+def derive_indicators(cols):
+    """Thêm các cột dẫn xuất dùng chung vào dict cột indicator (theo symbol hoặc theo thời gian)."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cols["volume_ratio"] = cols["volume"] / cols["volume_sma"]
+        cols["atr_extension"] = np.maximum(cols["close"] - cols["bb_upper"], cols["bb_lower"] - cols["close"]) / cols["atr"]
+    return cols
+
+class Strategy:
+    """
+    Plugin strategy: evaluate() nhận các cột indicator đã stack cho N symbol,
+    trả về mảng điểm trong [-1, 1] (1 = buy, -1 = sell, 0 = không có tín hiệu).
+    Không được tự tính lại indicator từ nến.
+    """
+    name = None
+
+    def __init__(self, params=None, config_dir="config"):
+        self.params = params or {}
+        self.weight = self.params.get("weight", 1.0)
+
+    @property
+    def active(self):
+        return True
+
+    def evaluate(self, ind, symbols):
+        raise NotImplementedError
+
+@register("rsi_macd")
+class RsiMacd(Strategy):
+    """Buy khi RSI quá bán và MACD > 0, sell khi RSI quá mua và MACD < 0."""
+    def evaluate(self, ind, symbols):
+        buy = (ind["rsi"] < self.params.get("rsi_oversold", 30)) & (ind["macd"] > 0)
+        sell = (ind["rsi"] > self.params.get("rsi_overbought", 70)) & (ind["macd"] < 0)
+        return buy.astype(np.float64) - sell
+
+@register("trend_breakout")
+class TrendBreakout(Strategy):
+    """Phá Bollinger band theo hướng MACD histogram, kèm volume xác nhận."""
+    def evaluate(self, ind, symbols):
+        volume_ok = ind["volume_ratio"] >= self.params.get("min_volume_ratio", 1.5)
+        buy = (ind["close"] > ind["bb_upper"]) & (ind["macd_hist"] > 0) & volume_ok
+        sell = (ind["close"] < ind["bb_lower"]) & (ind["macd_hist"] < 0) & volume_ok
+        return buy.astype(np.float64) - sell
+
+@register("dca_breakout")
+class DcaBreakout(Strategy):
+    """
+    Breakout chỉ chiều buy cho DCA: giá vượt band trên nhưng chưa chạy quá
+    max_atr_extension * ATR và RSI chưa quá mua, để còn chỗ cho các lệnh DCA.
+    """
+    def evaluate(self, ind, symbols):
+        buy = ((ind["close"] > ind["bb_upper"])
+               & (ind["atr_extension"] <= self.params.get("max_atr_extension", 1.0))
+               & (ind["rsi"] < self.params.get("max_rsi", 75))
+               & (ind["volume_ratio"] >= self.params.get("min_volume_ratio", 1.0)))
+        return buy.astype(np.float64)
+
+@register("copy_trade")
+class CopyTrade(Strategy):
+    """
+    Tín hiệu từ leader (set_leader_signal), chỉ hoạt động khi có follower.yaml.
+    Không dùng indicator.
+    """
+    def __init__(self, params=None, config_dir="config"):
+        super().__init__(params, config_dir)
+        self.follower_path = os.path.join(config_dir, "follower.yaml")
+        self.leader_signals = {}
+
+    @property
+    def active(self):
+        return os.path.exists(self.follower_path)
+
+    def set_leader_signal(self, symbol, side):
+        if side is None:
+            self.leader_signals.pop(symbol, None)
+        else:
+            self.leader_signals[symbol] = 1.0 if side == "buy" else -1.0
+
+    def evaluate(self, ind, symbols):
+        return np.array([self.leader_signals.get(s, 0.0) for s in symbols], dtype=np.float64)
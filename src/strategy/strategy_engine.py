@@ -1,21 +1,53 @@
 import numpy as np
+from pipeline.indicators import IndicatorState
+from strategy.strategies import STRATEGIES, stack_indicators
+from strategy.universe_scanner import compile_banned
 from utils.config_loader import ConfigLoader
 from utils.log_manager import LogManager
+from utils.metrics import METRICS
 
 class StrategyEngine:
     """
     Quản lý các chiến lược trading, áp dụng tín hiệu AI, chọn lệnh, lọc symbol.
     Hỗ trợ multi-strategy, trailing, coin filter, DCA, copytrade.
+    Mỗi strategy trong available_strategies là 1 plugin (strategy/strategies.py),
+    tất cả chạy vector hóa trên indicator dùng chung, kết hợp với AI theo tech_weight/ai_weight.
     """
-    def __init__(self, config_dir="config"):
+    def __init__(self, config_dir="config", strategy_cfg=None):
+        self.config_dir = config_dir
         self.config = ConfigLoader(config_dir)
         self.logger = LogManager.get_logger("strategy")
-        self.reload_config()
+        self.reload_config(strategy_cfg)
+        if strategy_cfg is None:
+            self.config.subscribe("strategy", self._on_config_change)
 
-    def reload_config(self):
-        self.strategy_cfg = self.config.get("strategy", reload=True)
+    def reload_config(self, strategy_cfg=None):
+        """
+        Đọc lại strategy.yaml và dựng lại các plugin (gọi khi config đổi, không gọi mỗi nến).
+        strategy_cfg: dùng dict config có sẵn thay vì file (backtest / optimizer).
+        """
+        self.strategy_cfg = strategy_cfg or self.config.get("strategy", reload=True)
+        self.params = self.strategy_cfg.get("strategy", {})
         self.advanced_cfg = self.strategy_cfg.get("coin_filter_advanced", {})
         self.available_strategies = self.strategy_cfg.get("available_strategies", ["rsi_macd"])
+        self.banned = compile_banned(self.params.get("banned_keywords", []))
+        self.tech_weight = self.params.get("tech_weight", 0.4)
+        self.ai_weight = self.params.get("ai_weight", 0.6)
+        params = self.strategy_cfg.get("strategies", {})
+        self.plugins = []
+        for name in self.available_strategies:
+            cls = STRATEGIES.get(name)
+            if cls is None:
+                self.logger.warning(f"Unknown strategy in available_strategies: {name}")
+                continue
+            self.plugins.append(cls(params.get(name, {}), self.config_dir))
+
+    def _on_config_change(self, name, config):
+        self.logger.info("strategy.yaml changed, reloading strategies")
+        self.reload_config(config)
+
+    def get_plugin(self, name):
+        return next((p for p in self.plugins if p.name == name), None)
 
     def check_filter(self, symbol, candles, side):
         """
@@ -23,87 +55,107 @@ class StrategyEngine:
         """
         # Volume filter
         if self.advanced_cfg.get("enabled", False):
-            tf = self.strategy_cfg.get("timeframe", "1h")
+            tf = self.params.get("timeframe", "1h")
             min_vol = self.advanced_cfg.get(f"min_buy_volume_usdt_{tf}", 0)
             last_vol = candles[-1]["quote_volume"] if "quote_volume" in candles[-1] else candles[-1].get("volume", 0)
             if last_vol < min_vol:
-                self.logger.debug(f"{symbol} filtered by volume: {last_vol}<{min_vol}")
+                self.logger.debug("%s filtered by volume: %s<%s", symbol, last_vol, min_vol)
                 return False
             # Ratio logic
             # (Có thể mở rộng: prefer_buy_ratio, exclude_if_sell_ratio, ...)
         # Banned keyword
-        for bad in self.strategy_cfg.get("banned_keywords", []):
-            if bad in symbol:
-                self.logger.debug(f"{symbol} filtered by banned keyword: {bad}")
-                return False
+        if self.banned and self.banned.search(symbol):
+            self.logger.debug("%s filtered by banned keyword", symbol)
+            return False
         # Side check
-        allowed_side = self.strategy_cfg.get("allowed_side", ["buy", "sell"])
+        allowed_side = self.params.get("allowed_side", ["buy", "sell"])
         if side not in allowed_side:
-            self.logger.debug(f"{symbol} side {side} not allowed")
+            self.logger.debug("%s side %s not allowed", symbol, side)
             return False
         return True
 
-    def apply_rsi_macd(self, candles):
+    def _snapshot(self, candles, indicators=None):
+        """Snapshot indicator đã cache từ DataPipeline, nếu không có thì warm-up từ candles."""
+        if indicators is None:
+            indicators = IndicatorState.from_config(self.strategy_cfg).warmup(candles).snapshot()
+        return indicators
+
+    def score(self, ind, symbols):
         """
-        RSI-MACD strategy: trả về side, confidence, SL/TP, trailing...
+        Chạy mọi plugin đang active trên các cột indicator đã stack (theo symbol, hoặc theo
+        thời gian khi backtest). Trả về (tech_score trong [-1, 1], {strategy: điểm}).
         """
-        closes = np.array([c["close"] for c in candles[-30:]])
-        # Tính RSI
-        delta = np.diff(closes)
-        gain = np.mean(delta[delta > 0]) if np.any(delta > 0) else 0
-        loss = -np.mean(delta[delta < 0]) if np.any(delta < 0) else 0
-        rs = gain / loss if loss > 0 else 0
-        rsi = 100 - (100 / (1 + rs)) if loss > 0 else 100
-        # Tính MACD (đơn giản)
-        ema12 = np.mean(closes[-12:])
-        ema26 = np.mean(closes[-26:])
-        macd = ema12 - ema26
-        # Điều kiện vào lệnh
-        if rsi < 30 and macd > 0:
-            return "buy", rsi, macd
-        elif rsi > 70 and macd < 0:
-            return "sell", rsi, macd
-        else:
-            return None, rsi, macd
+        tech = np.zeros(len(symbols))
+        signals = {}
+        for plugin in self.plugins:
+            if not plugin.active:
+                continue
+            score = np.nan_to_num(plugin.evaluate(ind, symbols))
+            signals[plugin.name] = score
+            tech += plugin.weight * score
+        return np.clip(tech, -1.0, 1.0), signals
 
-    def propose_trade(self, ai_signal, candles, strategy_stats=None):
+    def evaluate(self, symbols, snapshots):
+        """Chấm điểm N symbol trong 1 lượt, indicator được stack 1 lần và dùng chung."""
+        return self.score(stack_indicators(snapshots), symbols)
+
+    def combine(self, tech, ai_conf, ai_pass):
         """
-        Đầu vào: ai_signal (ScoredSignal), candles (list), strategy_stats (dict).
-        Đầu ra: dict đề xuất lệnh chuẩn hóa cho Execution Engine.
+        confidence = tech_weight * |tech_score| + ai_weight * AI confidence.
+        Trả về (confidence, mask vào lệnh: AI pass, có tín hiệu kỹ thuật, vượt confidence_threshold).
         """
-        self.reload_config()
-        symbol = ai_signal["symbol"]
-        tf = self.strategy_cfg.get("timeframe", "1h")
-        confidence_thres = self.strategy_cfg.get("confidence_threshold", 0.7)
-        # Chọn chiến lược
-        strat_name = self.strategy_cfg.get("name", "rsi_macd")
-        side, rsi, macd = None, None, None
-        if strat_name == "rsi_macd":
-            side, rsi, macd = self.apply_rsi_macd(candles)
-        # Có thể mở rộng nhiều strategy khác tại đây...
+        confidence = self.tech_weight * np.abs(tech) + self.ai_weight * ai_conf
+        return confidence, ai_pass & (tech != 0) & (confidence > self.params.get("confidence_threshold", 0.7))
+
+    def propose_trades(self, ai_signals, candles_by_symbol, indicators_by_symbol=None):
+        """Đề xuất lệnh cho nhiều symbol cùng tick, side theo dấu tech_score."""
+        with METRICS.timer("strategy", ai_signals[0]["symbol"] if len(ai_signals) == 1 else "batch"):
+            return self._propose_trades(ai_signals, candles_by_symbol, indicators_by_symbol)
 
-        # Nếu AI pass và chiến lược thỏa điều kiện
-        if ai_signal["pass"] and side and ai_signal["confidence"] > confidence_thres:
-            if not self.check_filter(symbol, candles, side):
-                return None
-            sl = self.strategy_cfg.get("sl", 2.5)
-            tp = self.strategy_cfg.get("tp", 5.0)
-            trailing_cfg = self.strategy_cfg.get("trailing", {})
+    def _propose_trades(self, ai_signals, candles_by_symbol, indicators_by_symbol):
+        indicators_by_symbol = indicators_by_symbol or {}
+        symbols = [sig["symbol"] for sig in ai_signals]
+        snapshots = [self._snapshot(candles_by_symbol[s], indicators_by_symbol.get(s)) for s in symbols]
+        tech, signals = self.evaluate(symbols, snapshots)
+        ai_conf = np.array([sig["confidence"] for sig in ai_signals], dtype=np.float64)
+        ai_pass = np.array([bool(sig["pass"]) for sig in ai_signals])
+        confidence, candidates = self.combine(tech, ai_conf, ai_pass)
+
+        proposals = []
+        for i in np.flatnonzero(candidates):
+            symbol = symbols[i]
+            side = "buy" if tech[i] > 0 else "sell"
+            if not self.check_filter(symbol, candles_by_symbol[symbol], side):
+                continue
+            fired = {name: float(score[i]) for name, score in signals.items() if score[i] * tech[i] > 0}
             proposal = {
                 "symbol": symbol,
                 "side": side,
-                "confidence": ai_signal["confidence"],
-                "strategy": strat_name,
-                "sl": sl,
-                "tp": tp,
-                "trailing": trailing_cfg,
-                "info": {"rsi": rsi, "macd": macd}
+                "confidence": float(confidence[i]),
+                "strategy": "+".join(fired),
+                # % so với giá vào, ExecutionEngine quy đổi ra mức giá khi có entry_price
+                "sl_pct": self.params.get("sl", 2.5),
+                "tp_pct": self.params.get("tp", 5.0),
+                "trailing": self.params.get("trailing", {}),
+                "info": {"rsi": snapshots[i].get("rsi"), "macd": snapshots[i].get("macd"),
+                         "tech_score": float(tech[i]), "ai_confidence": float(ai_conf[i]), "signals": fired}
             }
-            self.logger.info(f"Proposed trade: {proposal}")
-            return proposal
-        else:
-            self.logger.debug(f"No trade for {symbol}: pass={ai_signal['pass']} side={side} conf={ai_signal['confidence']:.2f}")
+            self.logger.info("Proposed trade: %s", proposal)
+            proposals.append(proposal)
+        return proposals
+
+    def propose_trade(self, ai_signal, candles, strategy_stats=None, indicators=None):
+        """
+        Đầu vào: ai_signal (ScoredSignal), candles (CandleView/list), strategy_stats (dict),
+        indicators (snapshot từ DataPipeline.get_indicators, tùy chọn).
+        Đầu ra: dict đề xuất lệnh chuẩn hóa cho Execution Engine.
+        """
+        symbol = ai_signal["symbol"]
+        proposals = self.propose_trades([ai_signal], {symbol: candles}, {symbol: indicators} if indicators else None)
+        if not proposals:
+            self.logger.debug("No trade for %s: pass=%s conf=%.2f", symbol, ai_signal["pass"], ai_signal["confidence"])
             return None
+        return proposals[0]
 
 # Usage example/test
 if __name__ == "__main__":
@@ -0,0 +1,157 @@
+import re
+import threading
+import numpy as np
+from utils.config_loader import ConfigLoader
+from utils.log_manager import LogManager
+
+# Tên field ticker chuẩn -> các tên tương đương (Binance /api/v3/ticker/24hr, ...)
+FIELD_ALIASES = {
+    "symbol": ("symbol",),
+    "quote_volume": ("quote_volume", "quoteVolume"),
+    "bid": ("bid", "bidPrice"),
+    "ask": ("ask", "askPrice"),
+    "volume_ratio": ("volume_ratio",),
+}
+
+def compile_banned(keywords):
+    """1 regex cho mọi banned keyword (khớp chuỗi con như check_filter), None nếu không có keyword."""
+    return re.compile("|".join(map(re.escape, keywords))) if keywords else None
+
+def _columns(tickers):
+    """List ticker (dict) hoặc dict cột -> dict cột NumPy theo tên field chuẩn."""
+    cols = {}
+    for field, aliases in FIELD_ALIASES.items():
+        if isinstance(tickers, dict):
+            values = next((tickers[a] for a in aliases if a in tickers), None)
+        else:
+            name = next((a for a in aliases if tickers and a in tickers[0]), None)
+            values = None if name is None else [t.get(name) for t in tickers]
+        if values is None:
+            continue
+        cols[field] = np.asarray(values, dtype=str if field == "symbol" else np.float64)
+    return cols
+
+class UniverseScanner:
+    """
+    Chọn tập symbol được trade từ toàn bộ ticker của sàn (hàng trăm cặp), mỗi interval 1 lần,
+    bằng thao tác mảng: quote asset, banned keyword (regex biên dịch sẵn, cache theo symbol),
+    min_volume_binance, max_spread_threshold, min_volume_ratio, rồi lấy top_n theo quote volume.
+    Tập active được publish cho các subscriber (DataPipeline.set_universe, AIEngine.set_universe).
+    Symbol đang có vị thế (keep) luôn nằm trong tập active để vẫn được theo dõi SL/TP.
+    """
+    def __init__(self, config_dir="config", strategy_cfg=None, data_pipeline=None):
+        cfg = strategy_cfg or ConfigLoader(config_dir).get("strategy", reload=True)
+        params = cfg.get("strategy", {})
+        scanner_cfg = cfg.get("universe_scanner", {})
+        self.min_volume = params.get("min_volume_binance", 0)
+        self.top_n = params.get("top_n", 20)
+        self.min_volume_ratio = params.get("min_volume_ratio")
+        self.max_spread = params.get("max_spread_threshold")
+        self.timeframe = params.get("timeframe", "1h")
+        self.banned = compile_banned(params.get("banned_keywords", []))
+        self.quote_asset = scanner_cfg.get("quote_asset", "USDT")
+        self.interval = scanner_cfg.get("interval", 300)
+        self.data_pipeline = data_pipeline
+        self.logger = LogManager.get_logger("strategy")
+        self._banned_cache = {}
+        self.subscribers = []
+        self.active = frozenset()
+        self.version = 0
+        self.last_scan = {}
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _banned_mask(self, symbols):
+        if self.banned is None:
+            return np.zeros(len(symbols), dtype=bool)
+        cache = self._banned_cache
+        for s in symbols:
+            if s not in cache:
+                cache[s] = self.banned.search(s) is not None
+        return np.fromiter((cache[s] for s in symbols), dtype=bool, count=len(symbols))
+
+    def _volume_ratio(self, symbols):
+        """volume / volume_sma từ indicator của DataPipeline (NaN nếu symbol chưa có dữ liệu)."""
+        ratio = np.full(len(symbols), np.nan)
+        indicators = self.data_pipeline.indicators if self.data_pipeline else {}
+        for i, s in enumerate(symbols):
+            state = indicators.get(s, {}).get(self.timeframe)
+            if state is not None:
+                snap = state.snapshot()
+                if snap["volume_sma"]:
+                    ratio[i] = snap["volume"] / snap["volume_sma"]
+        return ratio
+
+    def scan(self, tickers, keep=()):
+        """
+        Lọc + xếp hạng ticker, publish tập active nếu thay đổi. Trả về list top_n symbol (đã xếp hạng).
+        tickers: list dict ticker 24h hoặc dict cột; field thiếu (bid/ask, volume_ratio) thì bỏ qua filter đó.
+        """
+        cols = _columns(tickers)
+        symbols = cols.get("symbol", np.empty(0, dtype=str))
+        n = len(symbols)
+        if not n:
+            self.logger.warning("Universe scan got no tickers, keep current universe")
+            return sorted(self.active)
+        qv = cols.get("quote_volume", np.full(n, np.nan))
+        ok = np.char.endswith(symbols, self.quote_asset) if self.quote_asset else np.ones(n, dtype=bool)
+        ok &= ~self._banned_mask(symbols.tolist())
+        ok &= qv >= self.min_volume
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if self.max_spread is not None and "bid" in cols and "ask" in cols:
+                bid, ask = cols["bid"], cols["ask"]
+                ok &= ~((ask - bid) / ((ask + bid) / 2) > self.max_spread)
+            if self.min_volume_ratio:
+                ratio = cols["volume_ratio"] if "volume_ratio" in cols else self._volume_ratio(symbols.tolist())
+                ok &= ~(ratio < self.min_volume_ratio)  # NaN (chưa đủ dữ liệu) không bị loại
+        idx = np.flatnonzero(ok)
+        top = idx[np.argsort(-qv[idx], kind="stable")[:self.top_n]]
+        ranked = symbols[top].tolist()
+        self.last_scan = {"universe": n, "eligible": int(len(idx)), "selected": ranked}
+        self.publish(ranked + [s for s in keep if s not in ranked])
+        return ranked
+
+    def subscribe(self, callback):
+        """callback(symbols: frozenset) mỗi khi tập active thay đổi; gọi ngay nếu đã có tập active."""
+        self.subscribers.append(callback)
+        if self.version:
+            callback(self.active)
+
+    def publish(self, symbols):
+        active = frozenset(symbols)
+        if active == self.active and self.version:
+            return False
+        self.active = active
+        self.version += 1
+        self.logger.info(f"Universe v{self.version}: {sorted(active)} ({self.last_scan.get('eligible')} eligible "
+                         f"of {self.last_scan.get('universe')})")
+        for callback in list(self.subscribers):
+            try:
+                callback(active)
+            except Exception as e:
+                self.logger.error(f"Universe subscriber failed: {e}")
+        return True
+
+    def start(self, fetch_tickers, keep_fn=None):
+        """Scan nền mỗi interval giây: fetch_tickers() -> tickers, keep_fn() -> symbol đang có vị thế."""
+        if self._thread:
+            return
+        self._stop.clear()
+
+        def loop():
+            while True:
+                try:
+                    self.scan(fetch_tickers(), keep_fn() if keep_fn else ())
+                except Exception as e:
+                    self.logger.error(f"Universe scan failed: {e}")
+                if self._stop.wait(self.interval):
+                    return
+
+        self._thread = threading.Thread(target=loop, name="universe-scanner", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
@@ -1,41 +1,183 @@
+import logging
 import os
+import threading
+import time
+import weakref
 import yaml
 
+logger = logging.getLogger(__name__)
+
+class FrozenDict(dict):
+    """
+    Dict chỉ đọc cho snapshot config dùng chung giữa các module.
+    copy.deepcopy / pickle trả về dict + list thường (có thể sửa tự do).
+    """
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Config snapshot is read-only, use copy.deepcopy() to modify")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+    __ior__ = _readonly
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (dict, (thaw(self),))
+
+def freeze(value):
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+def thaw(value):
+    if isinstance(value, dict):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(v) for v in value]
+    return value
+
+class _Snapshot:
+    __slots__ = ("config", "stamp", "version", "checked")
+
+    def __init__(self, config, stamp, version, checked):
+        self.config = config
+        self.stamp = stamp
+        self.version = version
+        self.checked = checked
+
 class ConfigLoader:
     """
     Load YAML config files and provide dynamic access to config sections.
-    Always load fresh config to ensure real-time updates.
+    Snapshot đã parse được dùng chung cho mọi ConfigLoader trong process (theo đường dẫn file):
+    - get() trả về snapshot trong memory (read-only), file chỉ được stat tối đa 1 lần / check_interval giây
+      và chỉ parse lại khi mtime/size đổi -> sửa config khi bot đang chạy có hiệu lực trong ~1s
+    - Mỗi lần đổi tăng version; subscribe() đăng ký callback khi file đổi (watcher thread poll nền)
     """
+    check_interval = 1.0
+    _snapshots = {}
+    _subscribers = {}
+    _lock = threading.RLock()
+    _watcher = None
+
     def __init__(self, config_dir="config"):
         self.config_dir = config_dir
-        self._configs = {}
+        self._paths = {}
 
-    def load(self, name):
-        """Load a YAML config file from the config_dir."""
-        path = os.path.join(self.config_dir, f"{name}.yaml")
-        if not os.path.exists(path):
-            raise FileNotFoundError(f"Config file not found: {path}")
+    def path(self, name):
+        path = self._paths.get(name)
+        if path is None:
+            path = self._paths[name] = os.path.abspath(os.path.join(self.config_dir, f"{name}.yaml"))
+        return path
+
+    @staticmethod
+    def _stamp(path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Config file not found: {path}") from None
+        return st.st_mtime_ns, st.st_size
+
+    @classmethod
+    def _parse(cls, path, stamp):
+        """Parse file thành snapshot mới (version + 1), trả về (snapshot, changed)."""
         with open(path, "r") as f:
-            config = yaml.safe_load(f)
-        self._configs[name] = config
-        return config
+            config = freeze(yaml.safe_load(f) or {})
+        with cls._lock:
+            old = cls._snapshots.get(path)
+            changed = old is not None and old.config != config
+            version = (old.version + changed) if old else 1
+            snap = _Snapshot(config, stamp, version, time.monotonic())
+            cls._snapshots[path] = snap
+        return snap, changed
+
+    @classmethod
+    def _validate(cls, path, force=False):
+        """Snapshot hiện hành của file: stat nếu quá check_interval (hoặc force), parse lại nếu file đổi."""
+        snap = cls._snapshots.get(path)
+        now = time.monotonic()
+        if snap is not None and not force and now - snap.checked < cls.check_interval:
+            return snap
+        stamp = cls._stamp(path)
+        if snap is not None and stamp == snap.stamp:
+            snap.checked = now
+            return snap
+        snap, changed = cls._parse(path, stamp)
+        if changed:
+            cls._notify(path, snap)
+        return snap
+
+    @classmethod
+    def _notify(cls, path, snap):
+        name = os.path.splitext(os.path.basename(path))[0]
+        with cls._lock:
+            refs = list(cls._subscribers.get(path, ()))
+        for ref in refs:
+            callback = ref()
+            if callback is None:
+                with cls._lock:
+                    if ref in cls._subscribers.get(path, ()):
+                        cls._subscribers[path].remove(ref)
+                continue
+            try:
+                callback(name, snap.config)
+            except Exception as e:
+                logger.error("Config subscriber failed for %s: %s", name, e)
+
+    def load(self, name):
+        """Parse lại YAML config từ config_dir (bỏ qua cache)."""
+        path = self.path(name)
+        snap, changed = self._parse(path, self._stamp(path))
+        if changed:
+            self._notify(path, snap)
+        return snap.config
 
     def get(self, name, section=None, reload=False):
         """
-        Get config by name (file name, without .yaml).
-        Optionally get a section.
-        Set reload=True to force reload from disk.
+        Get config by name (file name, without .yaml). Optionally get a section.
+        reload=True: kiểm tra file ngay (bỏ qua check_interval), chỉ parse lại nếu file đã đổi.
         """
-        if reload or name not in self._configs:
-            self.load(name)
+        config = self._validate(self.path(name), force=reload).config
         if section:
-            return self._configs[name].get(section, {})
-        return self._configs[name]
+            return config.get(section, {})
+        return config
+
+    def version(self, name):
+        """Số lần config đã đổi kể từ lần load đầu (bắt đầu từ 1)."""
+        return self._validate(self.path(name)).version
+
+    def subscribe(self, name, callback):
+        """
+        callback(name, config) khi file config đổi. Bound method được giữ bằng weakref
+        (object bị thu hồi thì tự hủy đăng ký). Watcher thread poll mỗi check_interval giây.
+        """
+        path = self.path(name)
+        self._validate(path)
+        ref = weakref.WeakMethod(callback) if hasattr(callback, "__self__") else (lambda: callback)
+        with self._lock:
+            self._subscribers.setdefault(path, []).append(ref)
+            if ConfigLoader._watcher is None:
+                ConfigLoader._watcher = threading.Thread(target=ConfigLoader._watch, name="config-watcher", daemon=True)
+                ConfigLoader._watcher.start()
+
+    @classmethod
+    def _watch(cls):
+        while True:
+            time.sleep(cls.check_interval)
+            with cls._lock:
+                paths = [p for p, refs in cls._subscribers.items() if refs]
+            for path in paths:
+                try:
+                    cls._validate(path)
+                except Exception as e:
+                    logger.error("Config watcher failed for %s: %s", path, e)
 
     def refresh_all(self):
-        """Reload all configs from disk."""
-        for name in list(self._configs.keys()):
-            self.load(name)
+        """Kiểm tra lại mọi config đã load (parse lại file nào đã đổi)."""
+        prefix = os.path.abspath(self.config_dir) + os.sep
+        for path in [p for p in list(self._snapshots) if p.startswith(prefix)]:
+            self._validate(path, force=True)
 
 # Usage example
 if __name__ == "__main__":
@@ -1,35 +1,200 @@
+import atexit
+import json
 import os
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from utils.metrics import METRICS
+
+# Arg kiểu này không đổi sau khi log -> để writer thread format sau được
+_IMMUTABLE_ARGS = (str, int, float, bool, bytes, type(None))
+
+def _env_flag(name, default):
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+class TextFormatter(logging.Formatter):
+    """Format text mặc định, thêm số message đã bị rate limit bỏ qua (nếu có)."""
+    def __init__(self):
+        super().__init__('%(asctime)s | %(levelname)s | %(name)s | %(message)s')
+
+    def format(self, record):
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        return f"{text} (+{suppressed} suppressed)" if suppressed else text
+
+class JsonFormatter(logging.Formatter):
+    """1 dòng JSON gọn / record: ts, level, logger, msg (+ suppressed, exc)."""
+    def format(self, record):
+        entry = {"ts": round(record.created, 3), "level": record.levelname, "logger": record.name,
+                 "msg": record.getMessage()}
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, separators=(",", ":"), ensure_ascii=False)
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket theo (logger, message template): tối đa `rate` record/giây, burst `burst`.
+    Chỉ áp dụng cho level < WARNING; record được cho qua kế tiếp mang số lượng đã bỏ (record.suppressed).
+    Dùng %-format (logger.info("x %s", v)) để các message cùng template chung 1 bucket.
+    """
+    MAX_KEYS = 10000
+
+    def __init__(self, rate, burst=None):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.msg)
+        now = record.created
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                if len(self.buckets) >= self.MAX_KEYS:
+                    self.buckets.clear()
+                bucket = self.buckets[key] = [self.burst, now, 0]
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            if bucket[2]:
+                record.suppressed, bucket[2] = bucket[2], 0
+        return True
+
+class _AsyncHandler(QueueHandler):
+    """
+    Đẩy record vào queue, chỉ format ở thread gọi khi args là object có thể đổi (dict signal / order...)
+    để log đúng giá trị tại lúc gọi, còn lại format ở writer thread.
+    Queue đầy thì bỏ record thay vì block luồng trade (đếm ở metric log_dropped).
+    """
+    dropped = 0
+
+    def prepare(self, record):
+        args = record.args
+        if args:
+            values = args.values() if isinstance(args, dict) else args
+            if not all(isinstance(v, _IMMUTABLE_ARGS) for v in values):
+                record.msg, record.args = record.getMessage(), None
+        if record.exc_info and not record.exc_text:
+            # Traceback phải được render trước khi frame thay đổi
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _AsyncHandler.dropped += 1
+            METRICS.inc("log_dropped")
+
+class _Router(logging.Handler):
+    """Handler của writer thread: chuyển record tới file / console của đúng module."""
+    def __init__(self):
+        super().__init__()
+        self.routes = {}
+
+    def handle(self, record):
+        for handler in self.routes.get(record.name, ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+        return True
 
 class LogManager:
     """
-    Centralized log manager. 
+    Centralized log manager.
     Each module can get its own logger by name.
     Logs are rotated, formatted, and stored by module in /logs/.
+    Cấu hình qua env (.env): LOG_ASYNC (ghi file/console ở writer thread nền qua queue),
+    LOG_FORMAT=text|json, LOG_CONSOLE, LOG_RATE_LIMIT (record/giây cho mỗi template < WARNING, 0 = tắt),
+    LOG_QUEUE_SIZE.
     """
     LOG_DIR = "logs"
     MAX_BYTES = 2 * 1024 * 1024   # 2MB/file
     BACKUP_COUNT = 3              # Keep 3 old logs
+    ASYNC = _env_flag("LOG_ASYNC", "true")
+    FORMAT = os.getenv("LOG_FORMAT", "text").strip().lower()
+    CONSOLE = _env_flag("LOG_CONSOLE", "true")
+    RATE_LIMIT = float(os.getenv("LOG_RATE_LIMIT", "0") or 0)
+    QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000") or 0)
+
+    _lock = threading.RLock()
+    _queue = None
+    _listener = None
+    _router = _Router()
+    _async_handlers = []
+
+    @staticmethod
+    def _formatter():
+        return JsonFormatter() if LogManager.FORMAT == "json" else TextFormatter()
+
+    @staticmethod
+    def _start_listener():
+        LogManager._queue = queue.Queue(LogManager.QUEUE_SIZE)
+        for handler in LogManager._async_handlers:
+            handler.queue = LogManager._queue
+        LogManager._listener = QueueListener(LogManager._queue, LogManager._router)
+        LogManager._listener.start()
+
+    @staticmethod
+    def _after_fork():
+        # Writer thread không tồn tại trong process con (process pool): tạo queue + listener mới
+        LogManager._lock = threading.RLock()
+        if LogManager._listener is not None:
+            LogManager._start_listener()
+
+    @staticmethod
+    def shutdown():
+        """Ghi nốt các record còn trong queue và dừng writer thread."""
+        with LogManager._lock:
+            if LogManager._listener is not None:
+                LogManager._listener.stop()
+                LogManager._listener = None
 
     @staticmethod
     def get_logger(module_name: str, level=logging.INFO):
         """Return a logger for a specific module (ai, signal, order, error, main...)."""
-        if not os.path.exists(LogManager.LOG_DIR):
-            os.makedirs(LogManager.LOG_DIR)
-        log_path = os.path.join(LogManager.LOG_DIR, f"{module_name}.log")
-        logger = logging.getLogger(module_name)
-        if not logger.handlers:
-            handler = RotatingFileHandler(log_path, maxBytes=LogManager.MAX_BYTES, backupCount=LogManager.BACKUP_COUNT)
-            formatter = logging.Formatter('%(asctime)s | %(levelname)s | %(name)s | %(message)s')
-            handler.setFormatter(formatter)
-            logger.addHandler(handler)
+        with LogManager._lock:
+            logger = logging.getLogger(module_name)
+            if logger.handlers:
+                return logger
+            os.makedirs(LogManager.LOG_DIR, exist_ok=True)
+            log_path = os.path.join(LogManager.LOG_DIR, f"{module_name}.log")
+            formatter = LogManager._formatter()
+            handlers = [RotatingFileHandler(log_path, maxBytes=LogManager.MAX_BYTES, backupCount=LogManager.BACKUP_COUNT)]
+            if LogManager.CONSOLE:
+                handlers.append(logging.StreamHandler())
+            for handler in handlers:
+                handler.setFormatter(formatter)
+            if LogManager.ASYNC:
+                if LogManager._listener is None:
+                    LogManager._start_listener()
+                LogManager._router.routes[module_name] = handlers
+                handler = _AsyncHandler(LogManager._queue)
+                LogManager._async_handlers.append(handler)
+                handlers = [handler]
+            for handler in handlers:
+                logger.addHandler(handler)
+            if LogManager.RATE_LIMIT > 0:
+                logger.addFilter(RateLimitFilter(LogManager.RATE_LIMIT))
             logger.setLevel(level)
-            # Optional: also log to console (remove if not needed)
-            ch = logging.StreamHandler()
-            ch.setFormatter(formatter)
-            logger.addHandler(ch)
-        return logger
+            return logger
+
+atexit.register(LogManager.shutdown)
+os.register_at_fork(after_in_child=LogManager._after_fork)
 
 # Usage example
 if __name__ == "__main__":
@@ -0,0 +1,145 @@
+import threading
+import time
+from bisect import bisect_left
+
+# Biên bucket (giây) dùng chung cho mọi histogram latency: 50µs -> 10s
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+PREFIX = "thopper"
+
+class Histogram:
+    """Histogram bucket cố định (memory không đổi theo số lần observe), ước lượng quantile từ bucket."""
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # bucket cuối = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Nội suy tuyến tính trong bucket chứa rank q (như histogram_quantile của Prometheus)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, n in enumerate(self.counts):
+            if cumulative + n >= rank and n:
+                if i == len(BUCKETS):
+                    return BUCKETS[-1]
+                lower = BUCKETS[i - 1] if i else 0.0
+                return lower + (BUCKETS[i] - lower) * (rank - cumulative) / n
+            cumulative += n
+        return BUCKETS[-1]
+
+class _Timer:
+    __slots__ = ("metrics", "stage", "symbol", "start")
+
+    def __init__(self, metrics, stage, symbol):
+        self.metrics = metrics
+        self.stage = stage
+        self.symbol = symbol
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start, self.symbol)
+        return False
+
+def _labels(pairs):
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}" if pairs else ""
+
+class Metrics:
+    """
+    Registry metrics trong process cho hot path (candle -> AI -> strategy -> risk -> order):
+    - timer(stage, symbol) / observe(): latency theo (stage, symbol) vào Histogram bucket cố định
+    - inc(name, **labels): counter (orders, rejects, retries, ...)
+    - register_gauge(name, fn): giá trị lấy lúc scrape (vd: DataPipeline.dispatch_stats)
+    - render(): Prometheus text format cho WebhookServer /metrics
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.started = time.time()
+
+    def timer(self, stage, symbol=""):
+        return _Timer(self, stage, symbol)
+
+    def observe(self, stage, seconds, symbol=""):
+        key = (stage, symbol)
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(seconds)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def register_gauge(self, name, fn):
+        """fn() -> số hoặc dict {tên: số} (mỗi key thành 1 gauge `<name>_<key>`)."""
+        self.gauges[name] = fn
+
+    def snapshot(self):
+        """{stage: {symbol: {count, p50, p95, p99}}} cho dashboard / log."""
+        with self.lock:
+            items = [(key, hist.count, [hist.quantile(q) for q in QUANTILES]) for key, hist in self.histograms.items()]
+        out = {}
+        for (stage, symbol), count, qs in items:
+            out.setdefault(stage, {})[symbol] = {"count": count, **{f"p{int(q * 100)}": v for q, v in zip(QUANTILES, qs)}}
+        return out
+
+    def render(self):
+        lines = []
+        with self.lock:
+            histograms = sorted((key, list(h.counts), h.sum, h.count) for key, h in self.histograms.items())
+            counters = sorted(self.counters.items())
+        name = f"{PREFIX}_stage_latency_seconds"
+        lines += [f"# HELP {name} Hot-path stage latency.", f"# TYPE {name} histogram"]
+        quantiles = []
+        for (stage, symbol), counts, total, count in histograms:
+            base = (("stage", stage), ("symbol", symbol))
+            cumulative = 0
+            for le, n in zip(BUCKETS + ("+Inf",), counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{_labels(base + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(base)} {total}")
+            lines.append(f"{name}_count{_labels(base)} {count}")
+            hist = Histogram()
+            hist.counts, hist.count = counts, count
+            quantiles += [(base, q, hist.quantile(q)) for q in QUANTILES]
+        qname = f"{PREFIX}_stage_latency_quantile_seconds"
+        lines += [f"# HELP {qname} Estimated stage latency quantiles (from histogram buckets).", f"# TYPE {qname} gauge"]
+        lines += [f"{qname}{_labels(base + (('quantile', q),))} {v}" for base, q, v in quantiles]
+        seen = set()
+        for (counter, labels), value in counters:
+            cname = f"{PREFIX}_{counter}_total"
+            if cname not in seen:
+                seen.add(cname)
+                lines.append(f"# TYPE {cname} counter")
+            lines.append(f"{cname}{_labels(labels)} {value}")
+        for gauge, fn in sorted(self.gauges.items()):
+            try:
+                values = fn()
+            except Exception:
+                continue
+            values = values if isinstance(values, dict) else {"": values}
+            for key, value in values.items():
+                if isinstance(value, (int, float)):
+                    gname = f"{PREFIX}_{gauge}_{key}" if key else f"{PREFIX}_{gauge}"
+                    lines += [f"# TYPE {gname} gauge", f"{gname} {value}"]
+        lines += [f"# TYPE {PREFIX}_uptime_seconds gauge", f"{PREFIX}_uptime_seconds {time.time() - self.started:.0f}"]
+        return "\n".join(lines) + "\n"
+
+METRICS = Metrics()
@@ -3,8 +3,10 @@ import hashlib
 import json
 from http.server import BaseHTTPRequestHandler, HTTPServer
 import threading
+import time
 from utils.config_loader import ConfigLoader
 from utils.log_manager import LogManager
+from utils.metrics import METRICS
 
 class WebhookQueue:
     """
@@ -31,11 +33,37 @@ class WebhookQueue:
 class WebhookHandler(BaseHTTPRequestHandler):
     """
     HTTP Handler nhận webhook, verify HMAC, push vào queue.
+    GET /metrics (Prometheus text) và /health (JSON) cho monitoring.
     """
     queue = None
     secret = ""
     logger = None
     reward_callback = None
+    health_callback = None
+    started = time.time()
+
+    def _reply(self, status, body, content_type):
+        body = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            self._reply(200, METRICS.render(), "text/plain; version=0.0.4; charset=utf-8")
+        elif path == "/health":
+            health = {"status": "ok", "uptime": round(time.time() - self.started), "queue_size": self.queue.size()}
+            if self.health_callback:
+                try:
+                    health.update(self.health_callback())
+                except Exception as e:
+                    health.update(status="error", error=str(e))
+            self._reply(200 if health["status"] == "ok" else 503, json.dumps(health, default=str), "application/json")
+        else:
+            self._reply(404, "not found", "text/plain")
 
     def do_POST(self):
         length = int(self.headers.get('Content-Length'))
@@ -81,11 +109,12 @@ class WebhookServer:
     """
     Webhook HTTP server chạy nền, nhận tín hiệu ngoài và phân phối tới pipeline.
     """
-    def __init__(self, queue, secret="", reward_callback=None, port=8088):
+    def __init__(self, queue, secret="", reward_callback=None, port=8088, health_callback=None):
         self.queue = queue
         self.secret = secret
         self.port = port
         self.reward_callback = reward_callback
+        self.health_callback = health_callback
         self.logger = LogManager.get_logger("webhook")
 
         # Gán static biến cho Handler
@@ -93,6 +122,8 @@ class WebhookServer:
         WebhookHandler.secret = self.secret
         WebhookHandler.logger = self.logger
         WebhookHandler.reward_callback = self.reward_callback
+        # staticmethod: tránh bị bind thành method của handler
+        WebhookHandler.health_callback = staticmethod(health_callback) if health_callback else None
 
         self.httpd = HTTPServer(('0.0.0.0', self.port), WebhookHandler)
         self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)